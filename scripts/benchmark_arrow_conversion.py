@@ -0,0 +1,161 @@
+"""
+Benchmark the time and peak memory of converting a GeoDataFrame to an Arrow table.
+
+Run with `python benchmark_arrow_conversion.py`. A synthetic GeoDataFrame with a few
+attribute columns is converted with each method, in a fresh process each time so that
+the memory freed by one method doesn't lower the peak of the next:
+
+- "pandas": the previous conversion of `geopandas_to_arrow`, which replaced the
+  geometry columns of a pandas copy of the data with object arrays of WKB bytes and
+  converted them with `pa.Table.from_pandas`.
+- "arrow": `geopandas_to_arrow`, which encodes WKB in chunks directly into the buffers
+  of Arrow binary arrays.
+- "geopandas": `GeoDataFrame.to_arrow`, for reference.
+
+The peak RSS is measured from the start of the conversion, by resetting the peak
+through `/proc/self/clear_refs` on Linux. Elsewhere the peak can't be reset, so only
+the growth beyond the peak reached when generating the data is measured.
+"""
+
+import gc
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import click
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+from benchmark_geoparquet import GEOMETRY_TYPES, generate_geometries
+from instrumentation import current_rss, peak_rss, reset_peak_rss
+from write_nz_building_outline import (
+    _create_metadata,
+    encode_metadata,
+    geopandas_to_arrow,
+    parse_to_shapely,
+)
+
+
+def _via_pandas(df: gpd.GeoDataFrame) -> pa.Table:
+    """The previous conversion of geopandas_to_arrow, through pandas"""
+    geometry_columns = parse_to_shapely(df)
+    geo_metadata = _create_metadata(df, geometry_columns)
+    df = pd.DataFrame(df)
+    for col, geometry_array in geometry_columns.items():
+        df[col] = shapely.to_wkb(geometry_array)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**table.schema.metadata, b"geo": encode_metadata(geo_metadata)}
+    return table.replace_schema_metadata(metadata)
+
+
+METHODS: Dict[str, Callable[[gpd.GeoDataFrame], pa.Table]] = {
+    "pandas": _via_pandas,
+    "arrow": geopandas_to_arrow,
+    "geopandas": lambda df: pa.table(df.to_arrow(geometry_encoding="WKB")),
+}
+
+
+def generate_dataframe(
+    geometry_type: str, n_features: int, n_vertices: int
+) -> gpd.GeoDataFrame:
+    """Synthetic features with integer, float and string attributes"""
+    df = generate_geometries(geometry_type, n_features, n_vertices)
+    rng = np.random.default_rng(0)
+    df["value"] = rng.random(n_features)
+    df["count"] = rng.integers(0, 1000, n_features, dtype=np.int32)
+    df["name"] = pd.Series(rng.choice(["a", "bb", "ccc"], n_features), dtype=object)
+    return df
+
+
+def measure(
+    method: str, geometry_type: str, n_features: int, n_vertices: int
+) -> Dict[str, Any]:
+    """Convert a synthetic GeoDataFrame with a method, measuring time and peak RSS"""
+    df = generate_dataframe(geometry_type, n_features, n_vertices)
+    gc.collect()
+    reset = reset_peak_rss()
+    baseline = current_rss() if reset else peak_rss()
+
+    start = time.perf_counter()
+    table = METHODS[method](df)
+    seconds = time.perf_counter() - start
+    peak = peak_rss()
+    return {
+        "method": method,
+        "seconds": seconds,
+        "peak_rss_bytes": max(peak - baseline, 0),
+        "table_bytes": table.nbytes,
+        "peak_reset": reset,
+    }
+
+
+@click.command()
+@click.option("--n-features", type=int, default=1_000_000, show_default=True)
+@click.option(
+    "--geometry-type",
+    type=click.Choice(GEOMETRY_TYPES),
+    default="Polygon",
+    show_default=True,
+)
+@click.option(
+    "--n-vertices",
+    type=click.IntRange(min=4),
+    default=8,
+    show_default=True,
+    help="Number of vertices of each linestring or polygon ring.",
+)
+@click.option(
+    "--method",
+    "methods",
+    type=click.Choice(list(METHODS)),
+    multiple=True,
+    default=list(METHODS),
+    show_default=True,
+    help="Conversion methods to measure. Can be repeated.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the results as JSON to this path.",
+)
+def main(
+    n_features: int,
+    geometry_type: str,
+    n_vertices: int,
+    methods: Tuple[str, ...],
+    output: Optional[Path],
+):
+    results = []
+    for method in methods:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(
+                measure, method, geometry_type, n_features, n_vertices
+            ).result()
+        results.append(result)
+        print(
+            f"{method:>9}: {result['seconds']:.2f}s, peak RSS "
+            f"+{result['peak_rss_bytes'] / 1e6:.0f} MB for a table of "
+            f"{result['table_bytes'] / 1e6:.0f} MB",
+            file=sys.stderr,
+        )
+        if not result["peak_reset"]:
+            print(
+                "  (the peak RSS couldn't be reset, so it only includes growth "
+                "beyond the peak when generating the data)",
+                file=sys.stderr,
+            )
+
+    if output is not None:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Benchmark writing and reading GeoParquet across encodings, compressions and layouts.
+
+Run with `python benchmark_geoparquet.py`. A synthetic dataset is written with a
+baseline layout and with each option varied in turn: compression codec and level,
+row group size, WKB or native GeoArrow encoding, and spatial sorting. For each layout,
+the write time, file size, full scan time and bbox query time are measured.
+
+Results are written as JSON, with the versions of the libraries used, so that runs can
+be compared over time. Pass a previous result as `--baseline` to print the change of
+each measurement.
+"""
+
+import dataclasses
+import json
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+import geoarrow.pyarrow as ga
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from numpy.typing import NDArray
+
+from benchmark_spatial_sort import random_queries
+from generate_synthetic_data import SyntheticSpec, generate_array
+from read_geoparquet import read_geoparquet
+from spatial_sort import AVAILABLE_SORTS, sort_order
+from write_nz_building_outline import AVAILABLE_ENCODINGS, geopandas_to_arrow
+
+GEOMETRY_TYPES = [
+    "Point",
+    "LineString",
+    "Polygon",
+    "MultiPoint",
+    "MultiLineString",
+    "MultiPolygon",
+]
+
+# (codec, level) pairs, including the zstd levels recommended by the distribution
+# guide
+COMPRESSIONS: List[Tuple[str, Optional[int]]] = [
+    ("NONE", None),
+    ("SNAPPY", None),
+    ("LZ4", None),
+    ("GZIP", None),
+    ("BROTLI", None),
+    ("ZSTD", 1),
+    ("ZSTD", 3),
+    ("ZSTD", 11),
+    ("ZSTD", 16),
+]
+ROW_GROUP_SIZES = [10_000, 50_000, 100_000, 500_000]
+SWEEPS = ["compression", "row_group_size", "encoding", "sort"]
+
+
+@dataclass(frozen=True)
+class Layout:
+    compression: str = "ZSTD"
+    compression_level: Optional[int] = 3
+    row_group_size: int = 100_000
+    encoding: str = "WKB"
+    sort: Optional[str] = None
+
+    def __str__(self):
+        level = "" if self.compression_level is None else f"({self.compression_level})"
+        return (
+            f"{self.compression}{level}, {self.row_group_size} rows/group, "
+            f"{self.encoding}, {self.sort or 'unsorted'}"
+        )
+
+
+def generate_geometries(
+    geometry_type: str,
+    n_features: int,
+    n_vertices: int = 8,
+    n_parts: int = 2,
+    seed: int = 0,
+) -> gpd.GeoDataFrame:
+    """Geometries of a type, clustered around a few "towns", in random order"""
+    spec = SyntheticSpec(
+        geometry_type=geometry_type.lower(),
+        min_vertices=n_vertices,
+        max_vertices=n_vertices,
+        min_parts=n_parts,
+        max_parts=n_parts,
+    )
+    geometry, _ = generate_array(spec, n_features, np.random.default_rng(seed))
+    return gpd.GeoDataFrame(
+        {"id": np.arange(n_features, dtype=np.int64)},
+        geometry=shapely.from_wkb(ga.as_wkb(geometry).storage),
+        crs="EPSG:3857",
+    )
+
+
+def layouts(sweeps: List[str], n_features: int) -> List[Layout]:
+    """The baseline layout, and the layouts varying one option from it"""
+    baseline = Layout()
+    result = [baseline]
+    if "compression" in sweeps:
+        result += [
+            dataclasses.replace(baseline, compression=codec, compression_level=level)
+            for codec, level in COMPRESSIONS
+        ]
+    if "row_group_size" in sweeps:
+        result += [
+            dataclasses.replace(baseline, row_group_size=size)
+            for size in ROW_GROUP_SIZES
+            if size < n_features
+        ]
+    if "encoding" in sweeps:
+        result += [
+            dataclasses.replace(baseline, encoding=encoding)
+            for encoding in AVAILABLE_ENCODINGS
+        ]
+    if "sort" in sweeps:
+        result += [dataclasses.replace(baseline, sort=sort) for sort in AVAILABLE_SORTS]
+    return list(dict.fromkeys(result))
+
+
+def _best_of(repeat: int, f) -> Tuple[float, Any]:
+    """Minimum time of repeated calls of f, and the result of the last one"""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_layout(
+    table: pa.Table,
+    layout: Layout,
+    path: Path,
+    queries: NDArray[np.float64],
+    repeat: int,
+) -> Dict[str, Any]:
+    write_seconds, _ = _best_of(
+        repeat,
+        lambda: pq.write_table(
+            table,
+            path,
+            compression=layout.compression,
+            compression_level=layout.compression_level,
+            row_group_size=layout.row_group_size,
+        ),
+    )
+    scan_seconds, _ = _best_of(repeat, lambda: pq.read_table(path))
+
+    query_seconds = []
+    row_groups_read = []
+    bytes_read = []
+    for query in queries:
+        seconds, (_, statistics) = _best_of(
+            repeat, lambda: read_geoparquet(path, bbox=query)
+        )
+        query_seconds.append(seconds)
+        row_groups_read.append(statistics.row_groups_read)
+        bytes_read.append(statistics.bytes_read)
+
+    return {
+        "write_seconds": write_seconds,
+        "file_bytes": path.stat().st_size,
+        "scan_seconds": scan_seconds,
+        "row_groups": pq.read_metadata(path).num_row_groups,
+        "query_seconds": float(np.mean(query_seconds)),
+        "query_row_groups_read": float(np.mean(row_groups_read)),
+        "query_bytes_read": float(np.mean(bytes_read)),
+    }
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pyarrow": pa.__version__,
+        "shapely": shapely.__version__,
+        "geopandas": gpd.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]]) -> None:
+    """Print the relative change of each measurement from a baseline run"""
+    previous = {json.dumps(r["layout"], sort_keys=True): r for r in baseline}
+    for result in results:
+        old = previous.get(json.dumps(result["layout"], sort_keys=True))
+        if old is None:
+            continue
+        changes = [
+            f"{key} {100 * (result[key] / old[key] - 1):+.1f}%"
+            for key in ["write_seconds", "file_bytes", "scan_seconds", "query_seconds"]
+            if old[key]
+        ]
+        print(f"{Layout(**result['layout'])}: {', '.join(changes)}", file=sys.stderr)
+
+
+@click.command()
+@click.option("--n-features", type=int, default=1_000_000, show_default=True)
+@click.option(
+    "--geometry-type",
+    type=click.Choice(GEOMETRY_TYPES),
+    default="Polygon",
+    show_default=True,
+)
+@click.option(
+    "--n-vertices",
+    type=click.IntRange(min=4),
+    default=8,
+    show_default=True,
+    help="Number of vertices of each linestring or polygon ring.",
+)
+@click.option(
+    "--sweep",
+    "sweeps",
+    type=click.Choice(SWEEPS),
+    multiple=True,
+    default=SWEEPS,
+    show_default=True,
+    help="Options to vary from the baseline layout. Can be repeated.",
+)
+@click.option("--n-queries", type=int, default=20, show_default=True)
+@click.option(
+    "--query-size",
+    type=float,
+    default=10_000,
+    show_default=True,
+    help="Width and height of the query boxes, in CRS units.",
+)
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    default=3,
+    show_default=True,
+    help="Number of times each measurement is repeated, keeping the fastest.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the results as JSON to this path.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Results of a previous run to compare with.",
+)
+def main(
+    n_features: int,
+    geometry_type: str,
+    n_vertices: int,
+    sweeps: Tuple[str, ...],
+    n_queries: int,
+    query_size: float,
+    repeat: int,
+    output: Optional[Path],
+    baseline: Optional[Path],
+):
+    df = generate_geometries(geometry_type, n_features, n_vertices)
+    extent = shapely.total_bounds(df.geometry.values)
+    queries = random_queries(n_queries, query_size, extent)
+
+    # Converting to Arrow only depends on the encoding and sort, not on the Parquet
+    # options, so it is done once for each
+    tables: Dict[Tuple[str, Optional[str]], pa.Table] = {}
+    convert_seconds: Dict[Tuple[str, Optional[str]], float] = {}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i, layout in enumerate(layouts(list(sweeps), n_features)):
+            key = (layout.encoding, layout.sort)
+            if key not in tables:
+                start = time.perf_counter()
+                sorted_df = df
+                if layout.sort is not None:
+                    order = sort_order(df.geometry.values, layout.sort, crs=df.crs)
+                    sorted_df = df.take(order)
+                tables[key] = geopandas_to_arrow(
+                    sorted_df, covering=True, encoding=layout.encoding
+                )
+                convert_seconds[key] = time.perf_counter() - start
+
+            path = Path(tmpdir) / f"{i}.parquet"
+            result = benchmark_layout(tables[key], layout, path, queries, repeat)
+            result = {
+                "layout": dataclasses.asdict(layout),
+                "convert_seconds": convert_seconds[key],
+                **result,
+            }
+            results.append(result)
+            print(
+                f"{layout}: {result['file_bytes'] / 1e6:.1f} MB, "
+                f"write {result['write_seconds']:.2f}s, "
+                f"scan {result['scan_seconds']:.2f}s, "
+                f"query {1000 * result['query_seconds']:.1f}ms "
+                f"({result['query_row_groups_read']:.1f} of {result['row_groups']} "
+                "row groups)",
+                file=sys.stderr,
+            )
+
+    parameters = {
+        "n_features": n_features,
+        "geometry_type": geometry_type,
+        "n_vertices": n_vertices,
+        "n_queries": n_queries,
+        "query_size": query_size,
+        "repeat": repeat,
+    }
+    if baseline is not None:
+        previous = json.loads(baseline.read_text())
+        if previous["parameters"] != parameters:
+            print(
+                f"Warning: the baseline was run with {previous['parameters']}",
+                file=sys.stderr,
+            )
+        compare(results, previous["results"])
+
+    if output is not None:
+        report = {
+            "parameters": parameters,
+            "environment": environment(),
+            "results": results,
+        }
+        output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
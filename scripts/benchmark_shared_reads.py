@@ -0,0 +1,205 @@
+"""
+Benchmark reading the same GeoParquet file from a pool of worker processes, with and
+without memory-mapping and the shared metadata cache.
+
+Run with `python benchmark_shared_reads.py`. A synthetic file is written, then for each
+mode a pool of fresh processes is started, as a multi-process tile server would, and
+each worker runs the same bbox queries. The first query of each worker is its cold
+start: it includes reading the footer and computing the row group bounds, unless they
+come from the shared cache. Once every worker has run its queries, and while they still
+hold their results, the proportional set size (PSS) of each worker is measured, so that
+the total over the pool counts the pages shared between workers once.
+
+The shared cache is cleared before each memory-mapped run, and filled by a process
+started before the pool, so that the cold start of the workers is the one they have
+once any process has read the file.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import click
+import numpy as np
+import pyarrow.parquet as pq
+import shapely
+
+from benchmark_spatial_sort import generate_buildings, random_queries
+from instrumentation import current_rss, peak_rss, reset_peak_rss
+from metadata_cache import clear_cache
+from read_geoparquet import read_geoparquet
+from spatial_sort import sort_order
+from write_nz_building_outline import geopandas_to_arrow
+
+MODES = {"read": False, "memory_map": True}
+
+
+def proportional_set_size() -> Optional[int]:
+    """PSS of this process in bytes, where /proc/self/smaps_rollup is available"""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _worker(
+    path: Path,
+    queries: List[List[float]],
+    memory_map: bool,
+    barrier: Any,
+    results: Any,
+) -> None:
+    reset_peak_rss()
+    baseline = current_rss()
+    tables = []
+    seconds = []
+    for bbox in queries:
+        start = time.perf_counter()
+        table, _ = read_geoparquet(path, bbox=bbox, memory_map=memory_map)
+        seconds.append(time.perf_counter() - start)
+        tables.append(table)
+
+    # Measure once every worker holds its results
+    barrier.wait()
+    results.put(
+        {
+            "cold_start_seconds": seconds[0],
+            "warm_query_seconds": float(np.median(seconds[1:] or seconds)),
+            "pss_bytes": proportional_set_size(),
+            "rss_bytes": current_rss(),
+            "peak_rss_growth_bytes": max(peak_rss() - baseline, 0),
+            "rows": sum(len(table) for table in tables),
+        }
+    )
+    barrier.wait()
+
+
+def run_pool(
+    path: Path, queries: List[List[float]], memory_map: bool, workers: int
+) -> List[Dict[str, Any]]:
+    context = get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_worker, args=(path, queries, memory_map, barrier, results)
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measurements
+
+
+def _fill_cache(path: Path) -> None:
+    read_geoparquet(path, bbox=(0, 0, 0, 0), memory_map=True)
+
+
+@click.command()
+@click.option("--n-features", type=int, default=1_000_000, show_default=True)
+@click.option("--row-group-size", type=int, default=2_000, show_default=True)
+@click.option(
+    "--compression",
+    type=click.Choice(["none", "snappy", "zstd"]),
+    default="zstd",
+    show_default=True,
+)
+@click.option("--workers", type=int, default=8, show_default=True)
+@click.option("--n-queries", type=int, default=20, show_default=True)
+@click.option(
+    "--query-size",
+    type=float,
+    default=50_000,
+    show_default=True,
+    help="Width and height of the query boxes, in CRS units.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the results as JSON to this path.",
+)
+def main(
+    n_features: int,
+    row_group_size: int,
+    compression: str,
+    workers: int,
+    n_queries: int,
+    query_size: float,
+    output: Optional[Path],
+):
+    df = generate_buildings(n_features)
+    df = df.take(sort_order(df.geometry.values, "hilbert"))
+    extent = shapely.total_bounds(df.geometry.values)
+    queries = random_queries(n_queries, query_size, extent).tolist()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ["GEOPARQUET_METADATA_CACHE"] = str(Path(tmpdir) / "cache")
+        path = Path(tmpdir) / "buildings.parquet"
+        pq.write_table(
+            geopandas_to_arrow(df, covering=True),
+            path,
+            row_group_size=row_group_size,
+            compression=compression,
+        )
+        del df
+
+        for mode, memory_map in MODES.items():
+            if memory_map:
+                clear_cache()
+                context = get_context("spawn")
+                process = context.Process(target=_fill_cache, args=(path,))
+                process.start()
+                process.join()
+
+            measurements = run_pool(path, queries, memory_map, workers)
+            pss = [m["pss_bytes"] for m in measurements]
+            result = {
+                "mode": mode,
+                "workers": workers,
+                "compression": compression,
+                "mean_cold_start_seconds": float(
+                    np.mean([m["cold_start_seconds"] for m in measurements])
+                ),
+                "mean_warm_query_seconds": float(
+                    np.mean([m["warm_query_seconds"] for m in measurements])
+                ),
+                "total_pss_bytes": None if None in pss else sum(pss),
+                "total_rss_bytes": sum(m["rss_bytes"] for m in measurements),
+                "mean_peak_rss_growth_bytes": float(
+                    np.mean([m["peak_rss_growth_bytes"] for m in measurements])
+                ),
+                "workers_measurements": measurements,
+            }
+            results.append(result)
+
+            total_pss = result["total_pss_bytes"]
+            pss_text = "n/a" if total_pss is None else f"{total_pss / 1e6:.0f} MB"
+            print(
+                f"{mode:>10}: cold start {result['mean_cold_start_seconds'] * 1e3:.1f}"
+                f" ms, warm query {result['mean_warm_query_seconds'] * 1e3:.1f} ms,"
+                f" total PSS {pss_text}, total RSS "
+                f"{result['total_rss_bytes'] / 1e6:.0f} MB, peak RSS growth "
+                f"{result['mean_peak_rss_growth_bytes'] / 1e6:.0f} MB per worker",
+                file=sys.stderr,
+            )
+
+    if output is not None:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark how spatial ordering reduces the row groups touched by bbox queries.
+
+Run with `python benchmark_spatial_sort.py`. Synthetic building-like polygons are
+written in random order and in each space-filling curve order, and the number of row
+groups whose extent intersects random query boxes is counted for each layout.
+"""
+
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+import shapely
+from numpy.typing import NDArray
+
+from spatial_sort import AVAILABLE_SORTS, sort_order
+from wkb_scan import wkb_statistics
+from write_nz_building_outline import geopandas_to_arrow
+
+
+def generate_buildings(n_features: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """Small square polygons clustered around a few "towns", in random order"""
+    rng = np.random.default_rng(seed)
+    n_towns = 50
+    towns = rng.uniform(0, 1_000_000, size=(n_towns, 2))
+    town = rng.integers(0, n_towns, n_features)
+    xy = towns[town] + rng.normal(0, 5_000, size=(n_features, 2))
+    geometry = shapely.box(xy[:, 0], xy[:, 1], xy[:, 0] + 15, xy[:, 1] + 15)
+    return gpd.GeoDataFrame(
+        {"building_id": np.arange(n_features, dtype=np.int32)},
+        geometry=geometry,
+        crs="EPSG:2193",
+    )
+
+
+def row_group_bounds(path: Path, column: str = "geometry") -> NDArray[np.float64]:
+    """Extent of each row group, as a reader with bbox statistics would see it"""
+    parquet_file = pq.ParquetFile(path)
+    bounds = []
+    for i in range(parquet_file.metadata.num_row_groups):
+        wkb = parquet_file.read_row_group(i, columns=[column]).column(column)
+        _, row_group_bbox = wkb_statistics(wkb)
+        bounds.append(row_group_bbox)
+    return np.array(bounds)
+
+
+def row_groups_touched(
+    bounds: NDArray[np.float64], queries: NDArray[np.float64]
+) -> NDArray[np.int64]:
+    """Number of row groups intersecting each query box"""
+    intersects = (
+        (bounds[None, :, 0] <= queries[:, None, 2])
+        & (bounds[None, :, 2] >= queries[:, None, 0])
+        & (bounds[None, :, 1] <= queries[:, None, 3])
+        & (bounds[None, :, 3] >= queries[:, None, 1])
+    )
+    return intersects.sum(axis=1)
+
+
+def random_queries(
+    n_queries: int, size: float, extent: NDArray[np.float64], seed: int = 1
+) -> NDArray[np.float64]:
+    rng = np.random.default_rng(seed)
+    xmin = rng.uniform(extent[0], extent[2] - size, n_queries)
+    ymin = rng.uniform(extent[1], extent[3] - size, n_queries)
+    return np.column_stack([xmin, ymin, xmin + size, ymin + size])
+
+
+@click.command()
+@click.option("--n-features", type=int, default=1_000_000, show_default=True)
+@click.option("--row-group-size", type=int, default=50_000, show_default=True)
+@click.option("--n-queries", type=int, default=1_000, show_default=True)
+@click.option(
+    "--query-size",
+    type=float,
+    default=10_000,
+    show_default=True,
+    help="Width and height of the query boxes, in CRS units.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the results as JSON to this path.",
+)
+def main(
+    n_features: int,
+    row_group_size: int,
+    n_queries: int,
+    query_size: float,
+    output: Optional[str],
+):
+    df = generate_buildings(n_features)
+    extent = shapely.total_bounds(df.geometry.values)
+    queries = random_queries(n_queries, query_size, extent)
+
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for method in [None, *AVAILABLE_SORTS]:
+            start = time.perf_counter()
+            if method is None:
+                sorted_df = df
+            else:
+                sorted_df = df.take(sort_order(df.geometry.values, method, crs=df.crs))
+            sort_time = time.perf_counter() - start
+
+            path = Path(tmpdir) / f"{method}.parquet"
+            pq.write_table(
+                geopandas_to_arrow(sorted_df), path, row_group_size=row_group_size
+            )
+            touched = row_groups_touched(row_group_bounds(path), queries)
+            n_row_groups = pq.ParquetFile(path).metadata.num_row_groups
+
+            results.append(
+                {
+                    "sort": method or "none",
+                    "sort_seconds": round(sort_time, 3),
+                    "row_groups": n_row_groups,
+                    "mean_row_groups_touched": float(touched.mean()),
+                    "max_row_groups_touched": int(touched.max()),
+                }
+            )
+            print(
+                f"{method or 'none':>8}: {touched.mean():8.2f} of {n_row_groups} "
+                f"row groups touched on average (sorted in {sort_time:.2f}s)",
+                file=sys.stderr,
+            )
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Check that the geo metadata of a GeoParquet file is consistent with its data.
+
+The metadata validator only checks the shape of the metadata. This checker reads the
+geometry columns and verifies that:
+
+- every geometry is within the declared `bbox`, and within the bounds of the
+  statistics of its row group,
+- every geometry type, including its Z/M dimensions, is listed in `geometry_types`,
+- if `orientation` is `counterclockwise`, exterior rings are counterclockwise and
+  interior rings clockwise.
+
+Geometry types and bounds are computed by geoarrow directly from the WKB or native
+buffers, without creating shapely geometries. Shapely is only used for the
+orientation check. Row groups are checked in parallel worker processes, and each
+worker streams its row group in batches, so that memory use is bounded by the batch
+size and the number of workers rather than the size of the file.
+"""
+
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import click
+import geoarrow.pyarrow as ga
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from geoparquet_names import wkb_type_name
+from inspect_metadata import row_group_bounds
+from read_geoparquet import get_geo_metadata, to_geoarrow, to_shapely
+
+BATCH_SIZE = 65_536
+
+# Bounds of no geometries, the identity of _merge_bounds
+EMPTY_BOUNDS = [np.inf, np.inf, -np.inf, -np.inf]
+
+
+@dataclass
+class RowGroupSummary:
+    """Geometry types and bounds found in a geometry column of a row group"""
+
+    column: str
+    row_group: int
+    rows: int = 0
+    bounds: List[float] = field(default_factory=lambda: list(EMPTY_BOUNDS))
+    geometry_types: Set[str] = field(default_factory=set)
+    misoriented_rings: int = 0
+
+
+def _merge_bounds(left: Sequence[float], right: Sequence[float]) -> List[float]:
+    return [
+        min(left[0], right[0]),
+        min(left[1], right[1]),
+        max(left[2], right[2]),
+        max(left[3], right[3]),
+    ]
+
+
+def geometry_type_names(array: pa.Array) -> Set[str]:
+    """Names of the geometry types in a geoarrow array, e.g. "Polygon Z" """
+    unique = ga.unique_geometry_types(array)
+    # geoarrow dimension codes are 1 (XY) to 4 (XYZM), ISO WKB adds 0 to 3000
+    return {
+        wkb_type_name(geometry_type + 1000 * (dimensions - 1))
+        for geometry_type, dimensions in zip(
+            unique.field(0).to_pylist(), unique.field(1).to_pylist()
+        )
+    }
+
+
+def misoriented_rings(geometries: np.ndarray) -> int:
+    """Number of polygon rings that aren't oriented counterclockwise (exterior) or
+    clockwise (interior)"""
+    parts = shapely.get_parts(geometries)
+    polygons = parts[shapely.get_type_id(parts) == shapely.GeometryType.POLYGON]
+    rings, index = shapely.get_rings(polygons, return_index=True)
+    if len(rings) == 0:
+        return 0
+    # get_rings returns the exterior ring of each polygon first
+    exterior = np.ones(len(rings), dtype=bool)
+    exterior[1:] = index[1:] != index[:-1]
+    return int(np.count_nonzero(shapely.is_ccw(rings) != exterior))
+
+
+def check_row_group(
+    path: Path,
+    row_group: int,
+    column: str,
+    column_metadata: Dict[str, Any],
+    batch_size: Optional[int] = None,
+) -> RowGroupSummary:
+    """Summarize a geometry column of a row group, one batch at a time"""
+    encoding = column_metadata.get("encoding", "WKB")
+    check_orientation = column_metadata.get("orientation") == "counterclockwise"
+
+    summary = RowGroupSummary(column, row_group)
+    batches = pq.ParquetFile(path).iter_batches(
+        batch_size=batch_size or BATCH_SIZE, row_groups=[row_group], columns=[column]
+    )
+    for batch in batches:
+        array = to_geoarrow(batch.column(0), encoding)
+        box = ga.box_agg(array).as_py()
+        summary.rows += len(array)
+        summary.bounds = _merge_bounds(
+            summary.bounds, [box["xmin"], box["ymin"], box["xmax"], box["ymax"]]
+        )
+        summary.geometry_types |= geometry_type_names(array)
+        if check_orientation:
+            geometries = to_shapely(pa.chunked_array([batch.column(0)]), encoding)
+            summary.misoriented_rings += misoriented_rings(geometries)
+
+    return summary
+
+
+def _xy_bbox(bbox: Sequence[float]) -> List[float]:
+    """xmin, ymin, xmax, ymax of a 2D, 3D or 4D bbox"""
+    half = len(bbox) // 2
+    return [bbox[0], bbox[1], bbox[half], bbox[half + 1]]
+
+
+def _contains(outer: Sequence[float], inner: Sequence[float]) -> bool:
+    if inner[0] > inner[2]:
+        # No non-empty geometries
+        return True
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and outer[2] >= inner[2]
+        and outer[3] >= inner[3]
+    )
+
+
+def compare_metadata(
+    metadata: pq.FileMetaData,
+    geo_metadata: Dict[str, Any],
+    summaries: List[RowGroupSummary],
+) -> List[str]:
+    """Inconsistencies between the metadata and the summaries of the row groups"""
+    problems = []
+    for column, column_metadata in geo_metadata["columns"].items():
+        column_summaries = [s for s in summaries if s.column == column]
+
+        for summary in column_summaries:
+            bounds, _ = row_group_bounds(
+                metadata, summary.row_group, column, column_metadata
+            )
+            if bounds is not None and not _contains(bounds, summary.bounds):
+                problems.append(
+                    f"{column}: row group {summary.row_group} has geometries with "
+                    f"bounds {summary.bounds} outside its statistics {bounds}"
+                )
+
+        bounds = EMPTY_BOUNDS
+        for summary in column_summaries:
+            bounds = _merge_bounds(bounds, summary.bounds)
+        bbox = column_metadata.get("bbox")
+        if bbox is not None and not _contains(_xy_bbox(bbox), bounds):
+            problems.append(
+                f"{column}: geometries with bounds {bounds} are outside the "
+                f"declared bbox {bbox}"
+            )
+
+        declared = column_metadata.get("geometry_types", [])
+        found = set().union(*(s.geometry_types for s in column_summaries))
+        if declared and not found <= set(declared):
+            problems.append(
+                f"{column}: geometry types {sorted(found - set(declared))} are "
+                f"not in the declared geometry_types {declared}"
+            )
+
+        misoriented = sum(s.misoriented_rings for s in column_summaries)
+        if misoriented:
+            problems.append(
+                f"{column}: {misoriented} rings aren't oriented counterclockwise "
+                "(exterior) or clockwise (interior)"
+            )
+
+    return problems
+
+
+def check_file(
+    path: Path, workers: int = 1, batch_size: Optional[int] = None
+) -> List[str]:
+    """Check the consistency of the geo metadata of a file with its data
+
+    Returns a list of the inconsistencies found, which is empty if there are none.
+    """
+    metadata = pq.read_metadata(path)
+    geo_metadata = get_geo_metadata(metadata)
+    tasks = [
+        (path, i, column, column_metadata, batch_size)
+        for column, column_metadata in geo_metadata["columns"].items()
+        for i in range(metadata.num_row_groups)
+    ]
+
+    if workers == 1:
+        summaries = [check_row_group(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(check_row_group, *task) for task in tasks]
+            summaries = [future.result() for future in futures]
+
+    return compare_metadata(metadata, geo_metadata, summaries)
+
+
+@click.command()
+@click.argument(
+    "paths",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes checking row groups.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=BATCH_SIZE,
+    show_default=True,
+    help="Number of rows decoded at a time by each process.",
+)
+def main(paths: List[Path], workers: int, batch_size: int):
+    """Check that the geo metadata of the files in PATHS matches their data"""
+    inconsistent = 0
+    for path in paths:
+        problems = check_file(path, workers, batch_size)
+        inconsistent += bool(problems)
+        print(json.dumps({"path": str(path), "problems": problems}), file=sys.stdout)
+
+    print(f"{inconsistent} of {len(paths)} files are inconsistent", file=sys.stderr)
+    sys.exit(1 if inconsistent else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Convert every layer of many GeoPackages (or other OGR data sources) to GeoParquet.
+
+Files are discovered from files, directories and glob patterns, and each spatial layer
+of each file is a separate conversion, scheduled on a pool of worker processes so that
+throughput scales with the number of cores. Layers are streamed in batches with
+`write_streaming`, and the memory of each worker can be capped with `--memory-limit`.
+
+Progress is checkpointed after each layer in a `_conversions.json` manifest in the
+output directory, which records the SHA-256 hash of each input and the options it was
+converted with. Running the same command again retries failed layers and skips layers
+whose input and options are unchanged, so an interrupted run resumes where it stopped.
+Files whose size and modification time match the manifest are not hashed again.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import resource
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import click
+import pyarrow.parquet as pq
+import pyogrio
+
+from spatial_sort import AVAILABLE_SORTS
+from validate_geoparquet import expand_inputs
+from write_nz_building_outline import (
+    AVAILABLE_COMPRESSIONS,
+    AVAILABLE_ENCODINGS,
+    ByteSizeType,
+    PathType,
+    iter_geopackage_batches,
+    write_streaming,
+)
+
+MANIFEST_NAME = "_conversions.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+Manifest = Dict[str, Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class ConversionOptions:
+    """Options of write_streaming that change the output of a conversion"""
+
+    compression: str = "ZSTD"
+    batch_size: int = 100_000
+    sort: Optional[str] = None
+    covering: bool = False
+    row_group_bytes: Optional[int] = None
+    max_row_group_rows: Optional[int] = None
+    encoding: str = "WKB"
+
+
+@dataclass(frozen=True)
+class Task:
+    """The conversion of one layer of an input file"""
+
+    input: Path
+    layer: str
+    output: Path
+    sha256: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.input}::{self.layer}"
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(output_dir: Path) -> Manifest:
+    """The manifest entries of previous runs, keyed by input and layer"""
+    try:
+        with open(output_dir / MANIFEST_NAME) as f:
+            return json.load(f)["conversions"]
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(output_dir: Path, manifest: Manifest) -> None:
+    """Replace the manifest atomically, so that an interruption can't corrupt it"""
+    path = output_dir / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"conversions": manifest}, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def input_hashes(
+    paths: Sequence[Path], manifest: Manifest, workers: int
+) -> Dict[Path, str]:
+    """The SHA-256 hash of each input
+
+    Hashes recorded in the manifest are reused for files with the same size and
+    modification time. Other files are hashed on a thread pool, as hashlib releases
+    the GIL.
+    """
+    recorded = {
+        (entry["input"], entry["size"], entry["mtime_ns"]): entry["sha256"]
+        for entry in manifest.values()
+    }
+    hashes = {}
+    to_hash = []
+    for path in paths:
+        stat = path.stat()
+        sha256 = recorded.get((str(path), stat.st_size, stat.st_mtime_ns))
+        if sha256 is None:
+            to_hash.append(path)
+        else:
+            hashes[path] = sha256
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes.update(zip(to_hash, executor.map(file_sha256, to_hash)))
+    return hashes
+
+
+def output_path(output_dir: Path, input: Path, layer: str) -> Path:
+    """Where a layer is written: one directory per input, one file per layer"""
+    name = re.sub(r"[^\w.-]", "_", layer)
+    return output_dir / input.stem / f"{name}.parquet"
+
+
+def is_up_to_date(
+    entry: Optional[Dict[str, Any]],
+    task: Task,
+    output_dir: Path,
+    options: ConversionOptions,
+) -> bool:
+    return (
+        entry is not None
+        and entry["status"] == "done"
+        and entry["sha256"] == task.sha256
+        and entry["options"] == dataclasses.asdict(options)
+        and (entry["output"] is None or (output_dir / entry["output"]).exists())
+    )
+
+
+def _entry(task: Task, options: ConversionOptions, **result: Any) -> Dict[str, Any]:
+    stat = task.input.stat()
+    return {
+        "input": str(task.input),
+        "layer": task.layer,
+        "output": None,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": task.sha256,
+        "options": dataclasses.asdict(options),
+        **result,
+    }
+
+
+def discover_tasks(
+    inputs: Sequence[Path],
+    output_dir: Path,
+    manifest: Manifest,
+    options: ConversionOptions,
+    workers: int = 1,
+    force: bool = False,
+) -> Tuple[List[Task], List[Dict[str, Any]]]:
+    """The layers to convert, largest input first, and entries of unreadable inputs
+
+    Layers without geometries are skipped, and so are layers already converted from
+    an input with the same hash and with the same options, unless force is True.
+    The failures of previous runs to read inputs that can now be read are removed
+    from the manifest.
+    """
+    stems = Counter(path.stem for path in inputs)
+    duplicates = {stem for stem, count in stems.items() if count > 1}
+    if duplicates:
+        raise ValueError(f"Input file names must be unique, got {sorted(duplicates)}")
+
+    hashes = input_hashes(inputs, manifest, workers)
+    tasks = []
+    failures = []
+    for path in sorted(inputs, key=lambda path: path.stat().st_size, reverse=True):
+        try:
+            layers = pyogrio.list_layers(path)
+        except Exception as e:
+            task = Task(path, "", output_dir, hashes[path])
+            failures.append(_entry(task, options, status="failed", error=str(e)))
+            continue
+
+        manifest.pop(Task(path, "", output_dir, hashes[path]).key, None)
+        for layer, geometry_type in layers:
+            if geometry_type is None:
+                continue
+            task = Task(path, layer, output_path(output_dir, path, layer), hashes[path])
+            if force or not is_up_to_date(
+                manifest.get(task.key), task, output_dir, options
+            ):
+                tasks.append(task)
+    return tasks, failures
+
+
+def _limit_memory(memory_limit: Optional[int]) -> None:
+    """Cap the address space of a worker, so that it fails with a MemoryError"""
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def convert_layer(task: Task, options: ConversionOptions) -> Dict[str, Any]:
+    """Convert a layer, writing to a temporary file that is renamed when complete
+
+    Returns the number of rows written and the time taken. Empty layers are not
+    written.
+    """
+    start = time.perf_counter()
+    # Sorting batches needs the extent of the whole layer, which drivers that don't
+    # store it only report when forced
+    info = pyogrio.read_info(
+        task.input, layer=task.layer, force_total_bounds=options.sort is not None
+    )
+    if info["features"] == 0:
+        return {"rows": 0, "seconds": time.perf_counter() - start}
+
+    task.output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = task.output.with_name(task.output.name + ".tmp")
+    try:
+        write_streaming(
+            iter_geopackage_batches(task.input, task.layer, options.batch_size),
+            tmp,
+            options.compression,
+            sort=options.sort,
+            extent=info["total_bounds"],
+            covering=options.covering,
+            row_group_bytes=options.row_group_bytes,
+            max_row_group_rows=options.max_row_group_rows,
+            encoding=options.encoding,
+            cast=None,
+            batch_size=options.batch_size,
+        )
+        os.replace(tmp, task.output)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return {
+        "rows": pq.read_metadata(task.output).num_rows,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def run_tasks(
+    tasks: Sequence[Task],
+    output_dir: Path,
+    manifest: Manifest,
+    options: ConversionOptions,
+    workers: int = 1,
+    memory_limit: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Convert layers on a process pool, checkpointing the manifest after each one
+
+    Yields the manifest entry of each layer as it completes. A layer that fails,
+    including by exceeding the memory limit, is recorded as failed and retried on the
+    next run. If a worker is killed, the layers that hadn't completed yet are recorded
+    as failed too.
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_limit_memory, initargs=(memory_limit,)
+    ) as executor:
+        futures = {
+            executor.submit(convert_layer, task, options): task for task in tasks
+        }
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = {"status": "done", **future.result()}
+                if result["rows"]:
+                    result["output"] = str(task.output.relative_to(output_dir))
+            except BrokenProcessPool as e:
+                result = {"status": "failed", "error": f"worker process died: {e}"}
+            except Exception as e:
+                result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+            entry = _entry(task, options, **result)
+            manifest[task.key] = entry
+            write_manifest(output_dir, manifest)
+            yield entry
+
+
+def convert_all(
+    inputs: Sequence[Path],
+    output_dir: Path,
+    options: ConversionOptions,
+    workers: int = 1,
+    memory_limit: Optional[int] = None,
+    force: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """Convert all spatial layers of inputs that changed since the last run"""
+    inputs = [path.resolve() for path in inputs]
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(output_dir)
+    tasks, failures = discover_tasks(
+        inputs, output_dir, manifest, options, workers, force
+    )
+    for entry in failures:
+        manifest[f"{entry['input']}::"] = entry
+        yield entry
+    write_manifest(output_dir, manifest)
+    if tasks:
+        yield from run_tasks(
+            tasks, output_dir, manifest, options, workers, memory_limit
+        )
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option(
+    "-o",
+    "--output",
+    type=PathType(file_okay=False, dir_okay=True, writable=True),
+    required=True,
+    help="Directory to write a directory of GeoParquet files per input to.",
+)
+@click.option(
+    "--pattern",
+    default="*.gpkg",
+    show_default=True,
+    help="Files to convert in input directories.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=os.cpu_count(),
+    show_default="number of CPUs",
+    help="Number of layers converted in parallel.",
+)
+@click.option(
+    "--memory-limit",
+    type=ByteSizeType(),
+    default=None,
+    help="Maximum address space of each worker, e.g. 4GB.",
+)
+@click.option("--force", is_flag=True, help="Convert unchanged layers again.")
+@click.option(
+    "--compression",
+    type=click.Choice(AVAILABLE_COMPRESSIONS, case_sensitive=False),
+    default="ZSTD",
+    show_default=True,
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=100_000,
+    show_default=True,
+    help="Number of features per batch.",
+)
+@click.option("--sort", type=click.Choice(AVAILABLE_SORTS), default=None)
+@click.option("--covering/--no-covering", default=False, show_default=True)
+@click.option("--row-group-bytes", type=ByteSizeType(), default=None)
+@click.option("--max-row-group-rows", type=click.IntRange(min=1), default=None)
+@click.option(
+    "--encoding",
+    type=click.Choice(AVAILABLE_ENCODINGS, case_sensitive=False),
+    default="WKB",
+    show_default=True,
+)
+def main(
+    inputs: Tuple[str, ...],
+    output: Path,
+    pattern: str,
+    workers: int,
+    memory_limit: Optional[int],
+    force: bool,
+    compression: str,
+    batch_size: int,
+    sort: Optional[str],
+    covering: bool,
+    row_group_bytes: Optional[int],
+    max_row_group_rows: Optional[int],
+    encoding: str,
+):
+    """Convert all spatial layers of INPUTS, which are files, directories or globs"""
+    options = ConversionOptions(
+        compression=compression.upper(),
+        batch_size=batch_size,
+        sort=sort,
+        covering=covering,
+        row_group_bytes=row_group_bytes,
+        max_row_group_rows=max_row_group_rows,
+        encoding=encoding,
+    )
+    paths = expand_inputs(inputs, pattern)
+    start = time.perf_counter()
+    n_done = n_failed = 0
+    try:
+        for entry in convert_all(paths, output, options, workers, memory_limit, force):
+            if entry["status"] == "done":
+                n_done += 1
+                print(
+                    f"{entry['input']}:{entry['layer']}: {entry['rows']} rows",
+                    file=sys.stderr,
+                )
+            else:
+                n_failed += 1
+                print(
+                    f"{entry['input']}:{entry['layer']}: {entry['error']}",
+                    file=sys.stderr,
+                )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    print(
+        f"Converted {n_done} layers, {n_failed} failed, "
+        f"in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+    if n_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,8 @@ import geoarrow.pyarrow as ga
 import geopandas
 import pyarrow as pa
 import math
-import pyarrow.parquet as pq
+
+from row_group_sizing import write_table
 
 HERE = pathlib.Path(__file__).parent
 
@@ -50,4 +51,4 @@ metadata = {
 }
 
 table = table.replace_schema_metadata({"geo": json.dumps(metadata)})
-pq.write_table(table, HERE / "../examples/example.parquet")
+write_table(table, HERE / "../examples/example.parquet")
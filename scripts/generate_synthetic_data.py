@@ -0,0 +1,507 @@
+"""
+Generate large synthetic GeoParquet datasets for load and regression testing.
+
+Unlike `test_data/generate_test_data.py`, which writes a few hand-written geometries
+of each type, this generates any number of features with a configurable complexity:
+number of vertices, holes and parts, Z/M dimensions, and ratios of null and empty
+geometries. Coordinates are generated with vectorized NumPy directly into the buffers
+of native GeoArrow arrays, without creating any geometry objects, and written one row
+group at a time, so the size of a dataset is only limited by disk space.
+
+Features are clustered around a few "towns" and are in random order, like real data
+that hasn't been spatially sorted. Polygons are valid: exterior rings are star-shaped
+and counterclockwise, holes are clockwise and inside them, and the parts of
+multi-geometries don't overlap.
+"""
+
+import json
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import click
+import geoarrow.pyarrow as ga
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from numpy.typing import NDArray
+from pyproj import CRS
+
+from geoparquet_names import WKB_GEOMETRY_TYPES, wkb_type_name
+from read_geoparquet import DIMENSIONS, NATIVE_TYPES
+from schema_registry import get_schema
+from write_nz_building_outline import (
+    AVAILABLE_COMPRESSIONS,
+    AVAILABLE_ENCODINGS,
+    NATIVE_ENCODING_VERSION,
+    bounds_covering,
+)
+
+GEOMETRY_TYPES = list(NATIVE_TYPES)
+WKB_TYPE_CODES = {name.lower(): code for code, name in WKB_GEOMETRY_TYPES.items()}
+DIMENSION_CODES = {"xy": 0, "xyz": 1000, "xym": 2000, "xyzm": 3000}
+
+# Distance between the centres of the parts of multi-geometries, in multiples of the
+# size of the feature, so that they don't overlap
+PART_SPACING = 2.5
+
+
+@dataclass(frozen=True)
+class SyntheticSpec:
+    """What the generated geometries look like
+
+    Vertex counts are per linestring or ring, not counting the closing vertex of
+    rings, and part counts are per multi-geometry. Counts are drawn uniformly between
+    their minimum and maximum. Sizes and extents are in CRS units.
+    """
+
+    geometry_type: str = "polygon"
+    dimensions: str = "xy"
+    min_vertices: int = 4
+    max_vertices: int = 16
+    max_holes: int = 0
+    min_parts: int = 1
+    max_parts: int = 3
+    null_ratio: float = 0.0
+    empty_ratio: float = 0.0
+    size: float = 20.0
+    extent: Tuple[float, float, float, float] = (0, 0, 1_000_000, 1_000_000)
+    n_towns: int = 50
+    town_spread: float = 5_000.0
+
+    @property
+    def geoarrow_type(self) -> ga.GeometryExtensionType:
+        return (
+            NATIVE_TYPES[self.geometry_type]()
+            .with_coord_type(ga.CoordType.SEPARATED)
+            .with_dimensions(DIMENSIONS[self.dimensions])
+        )
+
+    @property
+    def geometry_type_name(self) -> str:
+        """The name of the geometry type in the geo metadata, e.g. "Polygon Z" """
+        code = WKB_TYPE_CODES[self.geometry_type] + DIMENSION_CODES[self.dimensions]
+        return wkb_type_name(code)
+
+
+def _offsets(counts: NDArray[np.int64]) -> NDArray[np.int32]:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _index_in_group(counts: NDArray[np.int64]) -> NDArray[np.int64]:
+    """The index of each element of consecutive groups of counts in its group"""
+    return np.arange(counts.sum()) - np.repeat(_offsets(counts)[:-1], counts)
+
+
+def _rings(
+    rng: np.random.Generator,
+    centers: NDArray[np.float64],
+    radii: NDArray[np.float64],
+    n_vertices: NDArray[np.int64],
+    holes: NDArray[np.bool_],
+) -> NDArray[np.float64]:
+    """Coordinates of closed rings of n_vertices around centers
+
+    Exterior rings are counterclockwise and star-shaped, with random angles and radii
+    between 0.7 and 1 times the radius. Holes are clockwise regular polygons.
+
+    Consecutive exterior vertices are at most 1.5 / n_vertices of a turn apart, so
+    rings of at least 6 vertices contain the disk of half their radius around their
+    centre.
+    """
+    # Each ring has one more coordinate than vertices, which repeats the first one
+    ring = np.repeat(np.arange(len(n_vertices)), n_vertices + 1)
+    index = _index_in_group(n_vertices + 1)
+    k = n_vertices[ring]
+    vertex = index % k
+    closing = np.flatnonzero(index == k)
+
+    # The angle of each vertex is jittered within half its k-th of the turn, so that
+    # angles stay in order
+    jitter = rng.uniform(0, 0.5, len(ring))
+    scale = rng.uniform(0.7, 1.0, len(ring))
+    jitter[closing] = jitter[closing - k[closing]]
+    scale[closing] = scale[closing - k[closing]]
+    hole = holes[ring]
+    jitter[hole] = 0
+    scale[hole] = 1
+
+    angles = 2 * np.pi * (vertex + jitter) / k
+    angles[hole] *= -1
+    r = radii[ring] * scale
+    return centers[ring] + np.column_stack([r * np.cos(angles), r * np.sin(angles)])
+
+
+def _lines(
+    rng: np.random.Generator,
+    centers: NDArray[np.float64],
+    sizes: NDArray[np.float64],
+    n_vertices: NDArray[np.int64],
+) -> NDArray[np.float64]:
+    """Coordinates of random walks of n_vertices starting at centers"""
+    line = np.repeat(np.arange(len(n_vertices)), n_vertices)
+    step = (sizes / np.sqrt(np.maximum(n_vertices, 1)))[line]
+    steps = rng.normal(0, 1, (len(line), 2)) * step[:, None]
+    steps[_offsets(n_vertices)[:-1][n_vertices > 0]] = 0
+    walks = np.cumsum(steps, axis=0)
+
+    # Subtract the cumulative sum of the previous lines
+    starts = walks[_offsets(n_vertices)[:-1][n_vertices > 0]]
+    return centers[line] + walks - np.repeat(starts, n_vertices[n_vertices > 0], axis=0)
+
+
+def generate_towns(
+    spec: SyntheticSpec, rng: np.random.Generator
+) -> NDArray[np.float64]:
+    """Centres of the towns that features are clustered around"""
+    return rng.uniform(spec.extent[:2], spec.extent[2:], (spec.n_towns, 2))
+
+
+def generate_array(
+    spec: SyntheticSpec,
+    n_features: int,
+    rng: np.random.Generator,
+    towns: Optional[NDArray[np.float64]] = None,
+) -> Tuple[pa.Array, NDArray[np.float64]]:
+    """Native GeoArrow array of n_features random geometries, and their bounds
+
+    Bounds are NaN for null and empty geometries. Pass the same towns to generate
+    batches of the same dataset.
+    """
+    if towns is None:
+        towns = generate_towns(spec, rng)
+    is_null = rng.random(n_features) < spec.null_ratio
+    is_empty = ~is_null & (rng.random(n_features) < spec.empty_ratio)
+    present = ~is_null & ~is_empty
+
+    town = rng.integers(0, len(towns), n_features)
+    centers = towns[town] + rng.normal(0, spec.town_spread, (n_features, 2))
+    sizes = spec.size * rng.uniform(0.5, 1.0, n_features)
+
+    # Features of single geometry types are their only part. Null and empty
+    # multi-geometries have no parts, and single ones a part with no coordinates
+    multi = spec.geometry_type.startswith("multi")
+    base_type = spec.geometry_type[5:] if multi else spec.geometry_type
+    if multi:
+        n_parts = rng.integers(spec.min_parts, spec.max_parts + 1, n_features)
+        n_parts[~present] = 0
+    else:
+        n_parts = np.ones(n_features, dtype=np.int64)
+    part_feature = np.repeat(np.arange(n_features), n_parts)
+    part_present = present[part_feature]
+    part_sizes = sizes[part_feature]
+    part_centers = centers[part_feature]
+    part_centers[:, 0] += PART_SPACING * part_sizes * _index_in_group(n_parts)
+
+    # Offsets of each level of nesting, from the coordinates up
+    levels: List[NDArray[np.int32]] = []
+    if base_type == "point":
+        coords = part_centers
+        coords[~part_present] = np.nan
+    elif base_type == "linestring":
+        n_vertices = rng.integers(
+            max(spec.min_vertices, 2), spec.max_vertices + 1, len(part_feature)
+        )
+        n_vertices[~part_present] = 0
+        coords = _lines(rng, part_centers, part_sizes, n_vertices)
+        levels.append(_offsets(n_vertices))
+    else:
+        n_rings = 1 + rng.integers(0, spec.max_holes + 1, len(part_feature))
+        n_rings[~part_present] = 0
+        ring_part = np.repeat(np.arange(len(part_feature)), n_rings)
+        hole = _index_in_group(n_rings)
+        is_hole = hole > 0
+        n_holes = (n_rings - 1)[ring_part]
+
+        # Holes are evenly spaced at a quarter of the radius around the centre of
+        # their polygon, and small enough to neither overlap each other nor reach
+        # half the radius, which exterior rings of 6 vertices or more contain
+        ring_sizes = part_sizes[ring_part]
+        theta = 2 * np.pi * hole / np.maximum(n_holes, 1)
+        ring_centers = part_centers[ring_part]
+        ring_centers[is_hole] += (0.25 * ring_sizes[is_hole])[
+            :, None
+        ] * np.column_stack([np.cos(theta[is_hole]), np.sin(theta[is_hole])])
+        hole_scale = np.minimum(0.2, 0.225 * np.sin(np.pi / np.maximum(n_holes, 2)))
+        radii = np.where(is_hole, hole_scale, 1.0) * ring_sizes
+
+        n_vertices = rng.integers(
+            max(spec.min_vertices, 3), spec.max_vertices + 1, len(ring_part)
+        )
+        n_vertices[~is_hole & (n_holes > 0)] = np.maximum(
+            n_vertices[~is_hole & (n_holes > 0)], 6
+        )
+        coords = _rings(rng, ring_centers, radii, n_vertices, is_hole)
+        levels += [_offsets(n_vertices + 1), _offsets(n_rings)]
+    if multi:
+        levels.append(_offsets(n_parts))
+
+    # Coordinates are in feature order, so the bounds of each feature are a
+    # reduction over its range of coordinates
+    feature_offsets = np.arange(n_features + 1)
+    for offsets in reversed(levels):
+        feature_offsets = offsets[feature_offsets]
+    bounds = np.full((n_features, 4), np.nan)
+    has_coords = np.diff(feature_offsets) > 0
+    if has_coords.any():
+        starts = feature_offsets[:-1][has_coords]
+        bounds[has_coords, :2] = np.fmin.reduceat(coords, starts, axis=0)
+        bounds[has_coords, 2:] = np.fmax.reduceat(coords, starts, axis=0)
+
+    n_coords = len(coords)
+    columns = [coords[:, 0], coords[:, 1]]
+    if "z" in spec.dimensions:
+        columns.append(rng.uniform(0, 100, n_coords))
+    if "m" in spec.dimensions:
+        columns.append(np.arange(n_coords, dtype=np.float64))
+    for values in columns[2:]:
+        values[np.isnan(coords[:, 0])] = np.nan
+
+    # Assemble the nested lists, with the field names and nullability of the
+    # GeoArrow storage type of each level
+    types = [spec.geoarrow_type.storage_type]
+    while not pa.types.is_struct(types[-1]):
+        types.append(types[-1].value_type)
+    mask = pa.array(is_null)
+    array: pa.Array = pa.StructArray.from_arrays(
+        [pa.array(values) for values in columns],
+        fields=list(types[-1]),
+        mask=None if levels else mask,
+    )
+    for i, offsets in enumerate(levels):
+        array = pa.ListArray.from_arrays(
+            pa.array(offsets),
+            array,
+            type=types[-2 - i],
+            mask=mask if i == len(levels) - 1 else None,
+        )
+    return spec.geoarrow_type.wrap_array(array), bounds
+
+
+def generate_batches(
+    spec: SyntheticSpec,
+    n_features: int,
+    batch_size: int = 100_000,
+    encoding: str = "WKB",
+    covering: bool = False,
+    seed: int = 0,
+) -> Iterator[Tuple[pa.RecordBatch, NDArray[np.float64]]]:
+    """Record batches of synthetic features, and the bounds of their geometries
+
+    Batches have an "id" column, a "geometry" column encoded as WKB or native
+    GeoArrow, and a "bbox" covering column if covering is True. The same seed and
+    batch size always generate the same features.
+    """
+    seeds = np.random.SeedSequence(seed)
+    towns = generate_towns(spec, np.random.default_rng(seeds.spawn(1)[0]))
+    ids = np.arange(n_features, dtype=np.int64)
+    for start in range(0, n_features, batch_size):
+        rng = np.random.default_rng(seeds.spawn(1)[0])
+        n = min(batch_size, n_features - start)
+        geometry, bounds = generate_array(spec, n, rng, towns)
+        if encoding == "WKB":
+            geometry = ga.as_wkb(geometry)
+        columns = {"id": pa.array(ids[start : start + n]), "geometry": geometry.storage}
+        if covering:
+            columns["bbox"] = bounds_covering(bounds)
+        yield pa.RecordBatch.from_pydict(columns), bounds
+
+
+def geo_metadata(
+    spec: SyntheticSpec,
+    encoding: str,
+    bbox: Optional[List[float]],
+    covering: bool,
+    crs: CRS,
+) -> Dict[str, Any]:
+    column_metadata: Dict[str, Any] = {
+        "encoding": "WKB" if encoding == "WKB" else spec.geometry_type,
+        "geometry_types": [spec.geometry_type_name] if bbox is not None else [],
+        "crs": crs.to_json_dict(),
+        "edges": "planar",
+    }
+    if spec.geometry_type.endswith("polygon"):
+        column_metadata["orientation"] = "counterclockwise"
+    if bbox is not None:
+        column_metadata["bbox"] = bbox
+    if covering:
+        column_metadata["covering"] = {
+            "bbox": {name: ["bbox", name] for name in ["xmin", "ymin", "xmax", "ymax"]}
+        }
+
+    if encoding == "WKB":
+        version = get_schema()["properties"]["version"]["const"]
+    else:
+        version = NATIVE_ENCODING_VERSION
+    return {
+        "version": version,
+        "primary_column": "geometry",
+        "columns": {"geometry": column_metadata},
+    }
+
+
+def write_synthetic(
+    path: Path,
+    spec: SyntheticSpec,
+    n_features: int,
+    row_group_size: int = 100_000,
+    encoding: str = "WKB",
+    compression: str = "ZSTD",
+    covering: bool = False,
+    crs: CRS = CRS.from_epsg(3857),
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Write a synthetic GeoParquet file one row group at a time
+
+    Only one row group of features is in memory at a time. The geo metadata, with the
+    bbox accumulated from all row groups, is added to the footer when closing the
+    file, and returned.
+    """
+    bbox = np.full(4, np.nan)
+    writer = None
+    try:
+        for batch, bounds in generate_batches(
+            spec, n_features, row_group_size, encoding, covering, seed
+        ):
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    path, batch.schema, compression=compression, store_schema=False
+                )
+            writer.write_batch(batch, row_group_size=row_group_size)
+            with np.errstate(invalid="ignore"):
+                bbox[:2] = np.fmin(bbox[:2], np.nanmin(bounds[:, :2], axis=0))
+                bbox[2:] = np.fmax(bbox[2:], np.nanmax(bounds[:, 2:], axis=0))
+
+        metadata = geo_metadata(
+            spec,
+            encoding,
+            None if np.isnan(bbox).any() else bbox.tolist(),
+            covering,
+            crs,
+        )
+        if writer is not None:
+            writer.add_key_value_metadata({"geo": json.dumps(metadata)})
+    finally:
+        if writer is not None:
+            writer.close()
+    return metadata
+
+
+@click.command()
+@click.argument(
+    "output", type=click.Path(dir_okay=False, writable=True, path_type=Path)
+)
+@click.option(
+    "--n-features", type=click.IntRange(min=1), default=1_000_000, show_default=True
+)
+@click.option(
+    "--geometry-type",
+    type=click.Choice(GEOMETRY_TYPES),
+    default="polygon",
+    show_default=True,
+)
+@click.option(
+    "--dimensions",
+    type=click.Choice(list(DIMENSION_CODES)),
+    default="xy",
+    show_default=True,
+)
+@click.option(
+    "--vertices",
+    type=(click.IntRange(min=2), click.IntRange(min=2)),
+    default=(4, 16),
+    show_default=True,
+    help="Minimum and maximum number of vertices of each linestring or ring.",
+)
+@click.option(
+    "--max-holes",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Maximum number of holes of each polygon.",
+)
+@click.option(
+    "--parts",
+    type=(click.IntRange(min=1), click.IntRange(min=1)),
+    default=(1, 3),
+    show_default=True,
+    help="Minimum and maximum number of parts of each multi-geometry.",
+)
+@click.option(
+    "--null-ratio", type=click.FloatRange(0, 1), default=0.0, show_default=True
+)
+@click.option(
+    "--empty-ratio", type=click.FloatRange(0, 1), default=0.0, show_default=True
+)
+@click.option(
+    "--row-group-size", type=click.IntRange(min=1), default=100_000, show_default=True
+)
+@click.option(
+    "--encoding",
+    type=click.Choice(AVAILABLE_ENCODINGS),
+    default="WKB",
+    show_default=True,
+)
+@click.option(
+    "--compression",
+    type=click.Choice(AVAILABLE_COMPRESSIONS, case_sensitive=False),
+    default="ZSTD",
+    show_default=True,
+)
+@click.option("--covering", is_flag=True, help="Add a bbox covering column.")
+@click.option("--seed", type=int, default=0, show_default=True)
+def main(
+    output: Path,
+    n_features: int,
+    geometry_type: str,
+    dimensions: str,
+    vertices: Tuple[int, int],
+    max_holes: int,
+    parts: Tuple[int, int],
+    null_ratio: float,
+    empty_ratio: float,
+    row_group_size: int,
+    encoding: str,
+    compression: str,
+    covering: bool,
+    seed: int,
+):
+    """Write N_FEATURES synthetic geometries to OUTPUT"""
+    if vertices[0] > vertices[1] or parts[0] > parts[1]:
+        raise click.BadParameter("minimums must not be greater than maximums")
+    spec = SyntheticSpec(
+        geometry_type=geometry_type,
+        dimensions=dimensions,
+        min_vertices=vertices[0],
+        max_vertices=vertices[1],
+        max_holes=max_holes,
+        min_parts=parts[0],
+        max_parts=parts[1],
+        null_ratio=null_ratio,
+        empty_ratio=empty_ratio,
+    )
+    start = time.perf_counter()
+    write_synthetic(
+        output,
+        spec,
+        n_features,
+        row_group_size=row_group_size,
+        encoding=encoding,
+        compression=compression.upper(),
+        covering=covering,
+        seed=seed,
+    )
+    seconds = time.perf_counter() - start
+    print(
+        f"Wrote {n_features} features to {output} "
+        f"({output.stat().st_size / 1e6:.1f} MB) in {seconds:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Names used in the geo metadata of GeoParquet files, shared by the writers, readers and
+checkers.
+"""
+
+# Geometry types of ISO WKB codes, without the dimension offset
+WKB_GEOMETRY_TYPES = {
+    1: "Point",
+    2: "LineString",
+    3: "Polygon",
+    4: "MultiPoint",
+    5: "MultiLineString",
+    6: "MultiPolygon",
+    7: "GeometryCollection",
+}
+WKB_DIMENSION_SUFFIXES = {0: "", 1: " Z", 2: " M", 3: " ZM"}
+
+
+def wkb_type_name(code: int) -> str:
+    """Name of an ISO WKB geometry type code, as used in geometry_types"""
+    return WKB_GEOMETRY_TYPES[code % 1000] + WKB_DIMENSION_SUFFIXES[code // 1000]
+
+
+def covering_column_name(primary_column: str, col: str) -> str:
+    """Name of the bbox covering column of a geometry column"""
+    return "bbox" if col == primary_column else f"{col}_bbox"
@@ -0,0 +1,277 @@
+"""
+Inspect the geo metadata and row group statistics of many GeoParquet files.
+
+Only the Parquet footer of each file is read: the last bytes of a file hold the length
+of the footer, so a speculative read of the tail of the file usually contains the whole
+footer, and a second read is only needed for very large footers. Local files are
+memory-mapped, so only the pages holding the footer are touched.
+
+Files are inspected concurrently and the result is a compact Arrow table with one row
+per file, row group and geometry column, which can be written to Parquet and reused as
+a cache on the next run.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import click
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from geoparquet_names import wkb_type_name
+
+PARQUET_MAGIC = b"PAR1"
+
+# Size of the speculative read of the end of the file. Most footers fit in this, so
+# that a file can usually be inspected with a single read.
+FOOTER_READ_SIZE = 64 * 1024
+
+INSPECTION_SCHEMA = pa.schema(
+    [
+        pa.field("path", pa.string()),
+        pa.field("file_size", pa.int64()),
+        pa.field("mtime_ns", pa.int64()),
+        pa.field("version", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("column", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("encoding", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("row_group", pa.int32()),
+        pa.field("num_rows", pa.int64()),
+        pa.field("compressed_bytes", pa.int64()),
+        pa.field("xmin", pa.float64()),
+        pa.field("ymin", pa.float64()),
+        pa.field("xmax", pa.float64()),
+        pa.field("ymax", pa.float64()),
+        pa.field("geometry_types", pa.list_(pa.string())),
+    ]
+)
+
+
+def _footer_length(tail: bytes, path: Path, size: int) -> int:
+    if tail[-4:] != PARQUET_MAGIC:
+        raise ValueError(f"{path} is not a Parquet file")
+    footer_length = struct.unpack("<i", tail[-8:-4])[0]
+    # The footer sits between the leading magic and its length and trailing magic
+    if footer_length < 0 or footer_length + 12 > size:
+        raise ValueError(
+            f"{path} has a corrupt footer: its length of {footer_length} bytes "
+            f"doesn't fit in the file of {size} bytes"
+        )
+    return footer_length
+
+
+def read_footer_bytes(path: Path) -> bytes:
+    """The serialized footer of a Parquet file, followed by its length and magic"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 12:
+            raise ValueError(f"{path} is too small to be a Parquet file")
+
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            # Not mmap-able (e.g. on some network filesystems), fall back to reads
+            mapped = None
+
+        if mapped is not None:
+            with mapped:
+                footer_length = _footer_length(mapped[-8:], path, size)
+                footer = mapped[size - 8 - footer_length :]
+        else:
+            f.seek(max(0, size - FOOTER_READ_SIZE))
+            tail = f.read()
+            footer_length = _footer_length(tail, path, size)
+            if footer_length + 8 > len(tail):
+                f.seek(size - 8 - footer_length)
+                tail = f.read()
+            footer = tail[len(tail) - 8 - footer_length :]
+
+    return footer
+
+
+def read_footer(path: Path) -> pq.FileMetaData:
+    """Read the Parquet metadata of a file without reading any of its data pages
+
+    The footer bytes are wrapped into a minimal buffer of magic + footer + length +
+    magic, which is all pyarrow needs to parse the metadata.
+    """
+    return pq.read_metadata(pa.BufferReader(PARQUET_MAGIC + read_footer_bytes(path)))
+
+
+def _column_indices(metadata: pq.FileMetaData) -> Dict[str, int]:
+    return {metadata.schema.column(i).path: i for i in range(metadata.num_columns)}
+
+
+def row_group_bounds(
+    metadata: pq.FileMetaData,
+    row_group: int,
+    column: str,
+    column_metadata: Dict[str, Any],
+) -> Tuple[Optional[List[float]], Optional[List[str]]]:
+    """Bounds and geometry types of a geometry column in a row group
+
+    The native Parquet geospatial statistics are used if they were written, and the
+    bbox covering column statistics otherwise. Either may be unavailable, in which
+    case None is returned.
+    """
+    indices = _column_indices(metadata)
+    rg = metadata.row_group(row_group)
+
+    if column in indices:
+        chunk = rg.column(indices[column])
+        if chunk.is_geo_stats_set and chunk.geo_statistics is not None:
+            stats = chunk.geo_statistics
+            types = [wkb_type_name(code) for code in stats.geospatial_types or []]
+            if stats.xmin is not None:
+                return [stats.xmin, stats.ymin, stats.xmax, stats.ymax], types
+            return None, types
+
+    covering = column_metadata.get("covering", {}).get("bbox")
+    if covering is not None:
+        bounds = []
+        for key, aggregate in [
+            ("xmin", "min"),
+            ("ymin", "min"),
+            ("xmax", "max"),
+            ("ymax", "max"),
+        ]:
+            path = ".".join(covering[key])
+            stats = rg.column(indices[path]).statistics if path in indices else None
+            if stats is None or not stats.has_min_max:
+                return None, None
+            bounds.append(getattr(stats, aggregate))
+        return bounds, None
+
+    return None, None
+
+
+def compressed_size(row_group: pq.RowGroupMetaData) -> int:
+    return sum(
+        row_group.column(i).total_compressed_size for i in range(row_group.num_columns)
+    )
+
+
+def inspect_file(path: Path) -> List[Dict[str, Any]]:
+    """One record per row group and geometry column of a GeoParquet file"""
+    stat = path.stat()
+    metadata = read_footer(path)
+    key_value_metadata = metadata.metadata or {}
+    if b"geo" not in key_value_metadata:
+        return []
+
+    geo_metadata = json.loads(key_value_metadata[b"geo"])
+    records = []
+    for column, column_metadata in geo_metadata.get("columns", {}).items():
+        for i in range(metadata.num_row_groups):
+            rg = metadata.row_group(i)
+            bounds, types = row_group_bounds(metadata, i, column, column_metadata)
+            xmin, ymin, xmax, ymax = bounds or [None] * 4
+            records.append(
+                {
+                    "path": str(path),
+                    "file_size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "version": geo_metadata.get("version"),
+                    "column": column,
+                    "encoding": column_metadata.get("encoding"),
+                    "row_group": i,
+                    "num_rows": rg.num_rows,
+                    "compressed_bytes": compressed_size(rg),
+                    "xmin": xmin,
+                    "ymin": ymin,
+                    "xmax": xmax,
+                    "ymax": ymax,
+                    "geometry_types": types,
+                }
+            )
+
+    return records
+
+
+def _is_cached(cached: Dict[str, Tuple[int, int]], path: Path) -> bool:
+    if str(path) not in cached:
+        return False
+    stat = path.stat()
+    return cached[str(path)] == (stat.st_size, stat.st_mtime_ns)
+
+
+def inspect_files(
+    paths: Iterable[Path],
+    workers: Optional[int] = None,
+    cache: Optional[pa.Table] = None,
+) -> pa.Table:
+    """Inspect many files concurrently
+
+    If a previous result is given as `cache`, its rows are reused for files whose
+    size and modification time haven't changed, and only the other files are read.
+    """
+    paths = list(paths)
+    reused = []
+    if cache is not None:
+        cached = {
+            row["path"]: (row["file_size"], row["mtime_ns"])
+            for row in cache.select(["path", "file_size", "mtime_ns"]).to_pylist()
+        }
+        fresh = {str(path) for path in paths if _is_cached(cached, path)}
+        paths = [path for path in paths if str(path) not in fresh]
+        mask = pa.array([path in fresh for path in cache.column("path").to_pylist()])
+        reused = [cache.filter(mask).cast(INSPECTION_SCHEMA)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(inspect_file, paths)
+        records = [record for result in results for record in result]
+
+    table = pa.Table.from_pylist(records, schema=INSPECTION_SCHEMA)
+    return pa.concat_tables([*reused, table]).unify_dictionaries()
+
+
+@click.command()
+@click.argument(
+    "inputs",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, path_type=Path),
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help=(
+        "Write the inspection table to this Parquet file. If it already exists, it is "
+        "used as a cache and only new or modified files are read."
+    ),
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of threads reading footers.",
+)
+def main(inputs: Tuple[Path, ...], output: Optional[Path], workers: Optional[int]):
+    """Inspect the GeoParquet files in INPUTS (files or directories)"""
+    paths = []
+    for input in inputs:
+        if input.is_dir():
+            paths.extend(sorted(input.rglob("*.parquet")))
+        else:
+            paths.append(input)
+
+    cache = pq.read_table(output) if output is not None and output.exists() else None
+    table = inspect_files(paths, workers, cache)
+
+    if output is not None:
+        pq.write_table(table, output)
+    else:
+        print(table.to_pandas().to_string(), file=sys.stdout)
+
+    print(f"Inspected {len(paths)} files", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Record the wall time, CPU time, peak memory and bytes processed of pipeline phases.
+
+Code is instrumented with `with phase("name") as p: ...`, optionally setting `p.bytes`
+and `p.rows` to the amount of data processed. Phases are only measured while a
+`Recorder` is active, in `with recording() as recorder:`, and are free otherwise.
+Phases can be nested, and the same phase can be recorded many times, e.g. once per
+batch when streaming.
+
+Recordings are exported as JSON, with the total of each phase, or as a file in the
+Chrome trace-event format that can be opened in https://ui.perfetto.dev or
+chrome://tracing.
+
+CPU time is that of the whole process, including all its threads, but not of worker
+processes. The peak RSS of each phase is measured from its start on Linux, where the
+peak can be reset through `/proc/self/clear_refs`. Elsewhere, it is the peak of the
+process so far.
+"""
+
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes, or its peak if not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return peak_rss()
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak RSS of this process to its current RSS, if supported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@dataclass
+class Phase:
+    """A measured phase. Times are in seconds from the start of the recording."""
+
+    name: str
+    depth: int = 0
+    start: float = 0.0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    start_rss_bytes: int = 0
+    peak_rss_bytes: int = 0
+    bytes: Optional[int] = None
+    rows: Optional[int] = None
+
+
+class Recorder:
+    """The phases measured while recording, in the order they started"""
+
+    def __init__(self):
+        self.phases: List[Phase] = []
+        self.peak_reset = reset_peak_rss()
+        self._origin = time.perf_counter()
+        self._stack: List[Phase] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[Phase]:
+        # The peak of the enclosing phase is kept before resetting it for this one,
+        # and the enclosing phase continues from the peak of this one
+        rss = current_rss()
+        if self._stack:
+            parent = self._stack[-1]
+            parent.peak_rss_bytes = max(parent.peak_rss_bytes, peak_rss())
+        if self.peak_reset:
+            reset_peak_rss()
+
+        record = Phase(name, depth=len(self._stack), start_rss_bytes=rss)
+        self.phases.append(record)
+        self._stack.append(record)
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        record.start = start - self._origin
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_rss_bytes = max(record.peak_rss_bytes, peak_rss())
+            self._stack.pop()
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak_rss_bytes = max(
+                    parent.peak_rss_bytes, record.peak_rss_bytes
+                )
+
+    def totals(self) -> Dict[str, Dict[str, Any]]:
+        """The count, total times and bytes, and maximum peak RSS of each phase
+
+        Phases are identified by their name and those of the phases enclosing them,
+        like "convert/encode_wkb".
+        """
+        totals: Dict[str, Dict[str, Any]] = {}
+        path: List[str] = []
+        for record in self.phases:
+            del path[record.depth :]
+            path.append(record.name)
+            total = totals.setdefault(
+                "/".join(path),
+                {
+                    "count": 0,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "peak_rss_bytes": 0,
+                    "bytes": None,
+                    "rows": None,
+                },
+            )
+            total["count"] += 1
+            total["wall_seconds"] += record.wall_seconds
+            total["cpu_seconds"] += record.cpu_seconds
+            total["peak_rss_bytes"] = max(
+                total["peak_rss_bytes"], record.peak_rss_bytes
+            )
+            for key in ["bytes", "rows"]:
+                if getattr(record, key) is not None:
+                    total[key] = (total[key] or 0) + getattr(record, key)
+        return totals
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "peak_rss_reset": self.peak_reset,
+            "totals": self.totals(),
+            "phases": [asdict(record) for record in self.phases],
+        }
+
+    def to_trace_events(self) -> Dict[str, Any]:
+        """Complete events for the phases, and a counter of the RSS at their starts"""
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = []
+        for record in self.phases:
+            ts = record.start * 1e6
+            args = {
+                "cpu_seconds": record.cpu_seconds,
+                "peak_rss_bytes": record.peak_rss_bytes,
+            }
+            for key in ["bytes", "rows"]:
+                if getattr(record, key) is not None:
+                    args[key] = getattr(record, key)
+            events.append(
+                {
+                    "name": record.name,
+                    "cat": "phase",
+                    "ph": "X",
+                    "ts": ts,
+                    "dur": record.wall_seconds * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+            events.append(
+                {
+                    "name": "RSS",
+                    "ph": "C",
+                    "ts": ts,
+                    "pid": pid,
+                    "args": {"MB": record.start_rss_bytes / 1e6},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_json(self, path: Path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def write_trace(self, path: Path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_trace_events(), f)
+
+    def summary(self) -> str:
+        """A table of the totals of each phase"""
+        lines = [
+            f"{'phase':<40} {'count':>6} {'wall s':>8} {'cpu s':>8} "
+            f"{'peak MB':>8} {'MB':>8}"
+        ]
+        for name, total in self.totals().items():
+            mb = "" if total["bytes"] is None else f"{total['bytes'] / 1e6:.1f}"
+            lines.append(
+                f"{name:<40} {total['count']:>6} {total['wall_seconds']:>8.2f} "
+                f"{total['cpu_seconds']:>8.2f} "
+                f"{total['peak_rss_bytes'] / 1e6:>8.0f} {mb:>8}"
+            )
+        return "\n".join(lines)
+
+
+_recorder: ContextVar[Optional[Recorder]] = ContextVar("recorder", default=None)
+
+
+@contextlib.contextmanager
+def recording() -> Iterator[Recorder]:
+    """Record the phases of the code run in this context"""
+    recorder = Recorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[Phase]:
+    """Measure a phase if recording, otherwise only provide a Phase to fill in"""
+    recorder = _recorder.get()
+    if recorder is None:
+        yield Phase(name)
+    else:
+        with recorder.phase(name) as record:
+            yield record
@@ -0,0 +1,233 @@
+"""
+Cache of the footers, geo metadata and row group bounds of GeoParquet files, shared by
+the processes that read them.
+
+Every process that reads a file, like each worker of a tile server, would otherwise read
+and parse its footer and compute the bounds of its row groups. Instead, these are
+computed once and stored as an index file in a shared-memory filesystem (`/dev/shm` on
+Linux, where POSIX shared memory lives), which processes memory-map so that they share
+one copy of it. Processes also keep the indexes they have loaded in memory.
+
+Index files are keyed by the real path, size and modification time of the GeoParquet
+file, so a modified file never uses a stale index. They are written atomically, so
+processes racing to create the same index don't see partial files. The cache directory
+is `$GEOPARQUET_METADATA_CACHE` if set.
+"""
+
+import functools
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from numpy.typing import NDArray
+
+from inspect_metadata import PARQUET_MAGIC, read_footer_bytes, row_group_bounds
+
+INDEX_MAGIC = b"GPQIDX1\0"
+# Number of indexes each process keeps in memory
+MEMORY_CACHE_SIZE = 256
+
+
+def cache_dir() -> Path:
+    """Directory of the shared index files
+
+    This is $GEOPARQUET_METADATA_CACHE if set, and otherwise a directory in /dev/shm,
+    or in the temporary directory where there is no /dev/shm.
+    """
+    if "GEOPARQUET_METADATA_CACHE" in os.environ:
+        return Path(os.environ["GEOPARQUET_METADATA_CACHE"])
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return Path(base) / f"geoparquet-metadata-{os.getuid()}"
+
+
+def _pad(length: int) -> int:
+    return -length % 8
+
+
+@dataclass
+class FileIndex:
+    """The footer, geo metadata and row group bounds of a GeoParquet file
+
+    `row_group_bounds` has the (xmin, ymin, xmax, ymax) of each row group for each
+    geometry column, NaN where the statistics aren't available.
+    """
+
+    path: str
+    footer: Union[bytes, memoryview]
+    geo_metadata: Dict[str, Any]
+    row_group_bounds: Dict[str, NDArray[np.float64]]
+
+    @functools.cached_property
+    def metadata(self) -> pq.FileMetaData:
+        """The Parquet metadata, parsed from the footer"""
+        return pq.read_metadata(pa.BufferReader(PARQUET_MAGIC + bytes(self.footer)))
+
+    def prune(self, bbox: Sequence[float], column: Optional[str] = None) -> List[int]:
+        """Indices of the row groups that may contain geometries intersecting bbox
+
+        Row groups without usable statistics are always kept.
+        """
+        column = column or self.geo_metadata["primary_column"]
+        file_bbox = self.geo_metadata["columns"][column].get("bbox")
+        if file_bbox is not None and len(file_bbox) == 4:
+            if not (
+                file_bbox[0] <= bbox[2]
+                and file_bbox[2] >= bbox[0]
+                and file_bbox[1] <= bbox[3]
+                and file_bbox[3] >= bbox[1]
+            ):
+                return []
+
+        bounds = self.row_group_bounds[column]
+        with np.errstate(invalid="ignore"):
+            intersects = (
+                (bounds[:, 0] <= bbox[2])
+                & (bounds[:, 2] >= bbox[0])
+                & (bounds[:, 1] <= bbox[3])
+                & (bounds[:, 3] >= bbox[1])
+            )
+        return np.flatnonzero(intersects | np.isnan(bounds).any(axis=1)).tolist()
+
+    def to_bytes(self) -> bytes:
+        columns = list(self.row_group_bounds)
+        header = json.dumps(
+            {
+                "path": self.path,
+                "geo": self.geo_metadata,
+                "footer_length": len(self.footer),
+                "columns": columns,
+                "num_row_groups": len(next(iter(self.row_group_bounds.values()), [])),
+            }
+        ).encode()
+        parts = [INDEX_MAGIC, struct.pack("<Q", len(header)), header]
+        parts.append(b"\0" * _pad(len(header)))
+        parts += [bytes(self.footer), b"\0" * _pad(len(self.footer))]
+        parts += [self.row_group_bounds[column].tobytes() for column in columns]
+        return b"".join(parts)
+
+    @classmethod
+    def from_buffer(cls, buffer: Union[bytes, mmap.mmap]) -> "FileIndex":
+        """Read an index without copying its footer and bounds out of buffer"""
+        if buffer[:8] != INDEX_MAGIC:
+            raise ValueError("Not a GeoParquet metadata index")
+        (header_length,) = struct.unpack_from("<Q", buffer, 8)
+        header = json.loads(bytes(buffer[16 : 16 + header_length]))
+        offset = 16 + header_length + _pad(header_length)
+        footer_length = header["footer_length"]
+        footer = memoryview(buffer)[offset : offset + footer_length]
+        offset += footer_length + _pad(footer_length)
+
+        n = header["num_row_groups"]
+        row_group_bounds = {}
+        for column in header["columns"]:
+            bounds = np.frombuffer(buffer, np.float64, count=4 * n, offset=offset)
+            row_group_bounds[column] = bounds.reshape(n, 4)
+            offset += bounds.nbytes
+        return cls(header["path"], footer, header["geo"], row_group_bounds)
+
+
+def build_index(path: Path) -> FileIndex:
+    """Read the footer of a GeoParquet file and compute its row group bounds"""
+    footer = read_footer_bytes(path)
+    metadata = pq.read_metadata(pa.BufferReader(PARQUET_MAGIC + footer))
+    key_value_metadata = metadata.metadata or {}
+    if b"geo" not in key_value_metadata:
+        raise ValueError("No 'geo' metadata found in parquet file")
+    geo_metadata = json.loads(key_value_metadata[b"geo"])
+
+    bounds = {}
+    for column, column_metadata in geo_metadata["columns"].items():
+        column_bounds = np.full((metadata.num_row_groups, 4), np.nan)
+        for i in range(metadata.num_row_groups):
+            rg_bounds, _ = row_group_bounds(metadata, i, column, column_metadata)
+            if rg_bounds is not None:
+                column_bounds[i] = rg_bounds
+        bounds[column] = column_bounds
+    return FileIndex(str(path), footer, geo_metadata, bounds)
+
+
+def _cache_key(path: Path) -> Tuple[str, str]:
+    """The real path of a file, and the key of its index"""
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    key = f"{real_path}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return real_path, hashlib.sha256(key.encode()).hexdigest()
+
+
+def _read_shared(index_path: Path) -> Optional[FileIndex]:
+    """Memory-map an index file, ignoring missing or corrupt files"""
+    try:
+        with open(index_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        return FileIndex.from_buffer(mapped)
+    except (ValueError, KeyError, struct.error):
+        return None
+
+
+def _write_shared(index_path: Path, index: FileIndex) -> None:
+    """Atomically write an index file; failures are not fatal"""
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=index_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(index.to_bytes())
+            os.replace(tmp, index_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
+
+
+_memory_cache: "OrderedDict[str, FileIndex]" = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+
+def load_index(path: Path, shared: bool = True) -> FileIndex:
+    """The index of a GeoParquet file, from memory, the shared cache or the file
+
+    If shared is False, the shared cache is neither read nor written.
+    """
+    real_path, key = _cache_key(path)
+    with _memory_cache_lock:
+        index = _memory_cache.get(key)
+        if index is not None:
+            _memory_cache.move_to_end(key)
+            return index
+
+    index_path = cache_dir() / f"{key}.idx"
+    index = _read_shared(index_path) if shared else None
+    if index is None or index.path != real_path:
+        index = build_index(Path(real_path))
+        if shared:
+            _write_shared(index_path, index)
+
+    with _memory_cache_lock:
+        _memory_cache[key] = index
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    return index
+
+
+def clear_cache(shared: bool = True) -> None:
+    """Forget the indexes loaded by this process, and remove the shared index files"""
+    with _memory_cache_lock:
+        _memory_cache.clear()
+    if shared:
+        shutil.rmtree(cache_dir(), ignore_errors=True)
@@ -0,0 +1,608 @@
+"""
+Fetch the pixels of out-db raster bands from their external files.
+
+Out-db bands reference a band of an external raster file by URL, and the window of a
+tile in the file is given by the georeference of the tile relative to that of the
+file. External files are TIFF or GeoTIFF files, uncompressed or deflate compressed,
+with strips or tiles, which are read in chunks: the strips or tiles of the file.
+
+`OutDbResolver.read` resolves the bands of many tiles at once. The chunks needed by
+all the tiles are collected and deduplicated, chunks that are adjacent or close in a
+file are coalesced into single range reads, and the range reads are fetched
+concurrently on a thread pool. Decoded chunks are kept in an LRU cache with a byte
+budget, so that tiles sharing chunks, or read again, don't fetch them again. The
+headers of the files are fetched once per file, concurrently too.
+
+Files are read through backends keyed by URL scheme: local files for `file://` URLs and
+plain paths, and HTTP range requests for `http://` and `https://` URLs.
+"""
+
+import http.client
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+from numpy.typing import NDArray
+
+from raster import Band, RasterTile
+
+HEADER_SIZE = 64 * 1024
+MAX_GAP = 64 * 1024
+MAX_RANGE_SIZE = 16 * 1024 * 1024
+CACHE_BYTES = 256 * 1024 * 1024
+
+# TIFF tags
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIGURATION = 284
+PREDICTOR = 317
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+SAMPLE_FORMAT = 339
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+
+# struct formats of the TIFF field types
+FIELD_TYPES = {
+    1: "B",
+    2: "c",
+    3: "H",
+    4: "I",
+    5: "II",
+    6: "b",
+    7: "B",
+    8: "h",
+    9: "i",
+    10: "ii",
+    11: "f",
+    12: "d",
+    16: "Q",
+    17: "q",
+    18: "Q",
+}
+COMPRESSIONS = {1: None, 8: zlib.decompress, 32946: zlib.decompress}
+SAMPLE_FORMATS = {1: "u", 2: "i", 3: "f"}
+
+
+class LocalBackend:
+    """Read byte ranges of local files, from `file://` URLs or paths"""
+
+    def read(self, url: str, offset: int, length: int) -> bytes:
+        parsed = urlsplit(url)
+        path = unquote(parsed.path) if parsed.scheme == "file" else url
+        with open(path, "rb") as f:
+            return os.pread(f.fileno(), length, offset)
+
+
+class HTTPBackend:
+    """Read byte ranges of files over HTTP with range requests
+
+    Each thread keeps a persistent connection to each host.
+    """
+
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        connections = self._local.__dict__.setdefault("connections", {})
+        if (scheme, netloc) not in connections:
+            connection_class = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connections[scheme, netloc] = connection_class(netloc, timeout=self.timeout)
+        return connections[scheme, netloc]
+
+    def read(self, url: str, offset: int, length: int) -> bytes:
+        parsed = urlsplit(url)
+        target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        for attempt in range(2):
+            connection = self._connection(parsed.scheme, parsed.netloc)
+            try:
+                connection.request("GET", target, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The server may have closed an idle connection, so retry once on a
+                # new one
+                connection.close()
+                if attempt:
+                    raise
+        if response.status == 206:
+            return data
+        if response.status == 200:
+            return data[offset : offset + length]
+        raise OSError(f"HTTP {response.status} reading {url}")
+
+
+def default_backends() -> Dict[str, object]:
+    http_backend = HTTPBackend()
+    return {
+        "": LocalBackend(),
+        "file": LocalBackend(),
+        "http": http_backend,
+        "https": http_backend,
+    }
+
+
+def coalesce_ranges(
+    ranges: Sequence[Tuple[int, int]],
+    max_gap: int = MAX_GAP,
+    max_size: int = MAX_RANGE_SIZE,
+) -> List[Tuple[int, int, List[int]]]:
+    """Merge (offset, length) byte ranges that are less than max_gap bytes apart
+
+    Returns the (offset, length) of the merged ranges, with the indices of the ranges
+    they contain. Merged ranges are at most max_size bytes long, unless a single range
+    is longer.
+    """
+    merged: List[Tuple[int, int, List[int]]] = []
+    for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+        offset, length = ranges[i]
+        if merged:
+            start, end, members = merged[-1]
+            if (
+                offset - end <= max_gap
+                and max(end, offset + length) - start <= max_size
+            ):
+                merged[-1] = (start, max(end, offset + length), members + [i])
+                continue
+        merged.append((offset, offset + length, [i]))
+    return [(start, end - start, members) for start, end, members in merged]
+
+
+@dataclass
+class TiffLayout:
+    """The chunks (strips or tiles) of the first image of a TIFF file"""
+
+    width: int
+    height: int
+    samples: int
+    dtype: np.dtype
+    chunk_width: int
+    chunk_height: int
+    planar: bool
+    compression: int
+    offsets: NDArray[np.int64]
+    byte_counts: NDArray[np.int64]
+    # World coordinates of the upper left corner, if georeferenced
+    origin: Optional[Tuple[float, float]] = None
+    scale: Optional[Tuple[float, float]] = None
+
+    @property
+    def chunks_across(self) -> int:
+        return -(-self.width // self.chunk_width)
+
+    @property
+    def chunks_down(self) -> int:
+        return -(-self.height // self.chunk_height)
+
+    def chunk_indices(
+        self, band: int, col_off: int, row_off: int, width: int, height: int
+    ) -> List[int]:
+        """Indices of the chunks that contain pixels of a band in a window"""
+        plane = band if self.planar else 0
+        first = plane * self.chunks_across * self.chunks_down
+        cx = range(
+            col_off // self.chunk_width, (col_off + width - 1) // self.chunk_width + 1
+        )
+        cy = range(
+            row_off // self.chunk_height,
+            (row_off + height - 1) // self.chunk_height + 1,
+        )
+        return [first + y * self.chunks_across + x for y in cy for x in cx]
+
+    def decode_chunk(self, data: bytes) -> NDArray:
+        """The pixels of a chunk as a (rows, chunk_width, samples) array"""
+        decompress = COMPRESSIONS[self.compression]
+        if decompress is not None:
+            data = decompress(data)
+        samples = 1 if self.planar else self.samples
+        pixels = np.frombuffer(data, self.dtype)
+        rows = len(pixels) // (self.chunk_width * samples)
+        return pixels[: rows * self.chunk_width * samples].reshape(
+            rows, self.chunk_width, samples
+        )
+
+    def chunk_origin(self, index: int) -> Tuple[int, int]:
+        """The column and row of the upper left pixel of a chunk"""
+        index %= self.chunks_across * self.chunks_down
+        y, x = divmod(index, self.chunks_across)
+        return x * self.chunk_width, y * self.chunk_height
+
+
+class _TiffHeaderReader:
+    """Read the values of the first IFD of a TIFF file, fetching as little as needed"""
+
+    def __init__(self, backend, url: str):
+        self.backend = backend
+        self.url = url
+        self.head = backend.read(url, 0, HEADER_SIZE)
+        self._blocks = [(0, self.head)]
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Bytes of the file, from the blocks read so far or from a new block
+
+        Blocks are at least HEADER_SIZE long, since the values of the tags usually
+        follow the IFD.
+        """
+        for start, block in self._blocks:
+            if start <= offset and offset + length <= start + len(block):
+                return block[offset - start : offset - start + length]
+        block = self.backend.read(self.url, offset, max(length, HEADER_SIZE))
+        self._blocks.append((offset, block))
+        return block[:length]
+
+    def tags(self) -> Dict[int, Tuple]:
+        byte_order = {b"II": "<", b"MM": ">"}.get(self.head[:2])
+        if byte_order is None:
+            raise ValueError(f"{self.url} is not a TIFF file")
+        (version,) = struct.unpack(byte_order + "H", self.head[2:4])
+        if version == 42:
+            (ifd_offset,) = struct.unpack(byte_order + "I", self.head[4:8])
+            count_format, entry_format, inline_size = "H", "HHI4s", 4
+        elif version == 43:
+            (ifd_offset,) = struct.unpack(byte_order + "Q", self.head[8:16])
+            count_format, entry_format, inline_size = "Q", "HHQ8s", 8
+        else:
+            raise ValueError(f"{self.url} is not a TIFF file")
+
+        count_size = struct.calcsize(count_format)
+        entry_size = struct.calcsize(byte_order + entry_format)
+        (n_entries,) = struct.unpack(
+            byte_order + count_format, self.read(ifd_offset, count_size)
+        )
+        entries = self.read(ifd_offset + count_size, n_entries * entry_size)
+
+        tags = {}
+        for i in range(n_entries):
+            tag, field_type, count, value = struct.unpack_from(
+                byte_order + entry_format, entries, i * entry_size
+            )
+            if field_type not in FIELD_TYPES:
+                continue
+            value_format = FIELD_TYPES[field_type]
+            size = count * struct.calcsize(byte_order + value_format)
+            if size > inline_size:
+                (offset,) = struct.unpack(
+                    byte_order + ("I" if inline_size == 4 else "Q"), value
+                )
+                value = self.read(offset, size)
+            tags[tag] = struct.unpack(
+                f"{byte_order}{count * len(value_format)}{value_format[0]}",
+                value[:size],
+            )
+        self.byte_order = byte_order
+        return tags
+
+
+def read_tiff_layout(backend, url: str) -> TiffLayout:
+    """Read the layout of the first image of a TIFF file from its header"""
+    reader = _TiffHeaderReader(backend, url)
+    tags = reader.tags()
+
+    compression = tags.get(COMPRESSION, (1,))[0]
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported TIFF compression {compression} in {url}")
+    if tags.get(PREDICTOR, (1,))[0] != 1:
+        raise ValueError(f"Unsupported TIFF predictor in {url}")
+
+    width = tags[IMAGE_WIDTH][0]
+    height = tags[IMAGE_LENGTH][0]
+    bits = tags.get(BITS_PER_SAMPLE, (1,))[0]
+    if bits % 8:
+        raise ValueError(f"Unsupported TIFF bits per sample {bits} in {url}")
+    sample_format = SAMPLE_FORMATS[tags.get(SAMPLE_FORMAT, (1,))[0]]
+    dtype = np.dtype(f"{reader.byte_order}{sample_format}{bits // 8}")
+    if TILE_OFFSETS in tags:
+        chunk_width, chunk_height = tags[TILE_WIDTH][0], tags[TILE_LENGTH][0]
+        offsets, byte_counts = tags[TILE_OFFSETS], tags[TILE_BYTE_COUNTS]
+    else:
+        chunk_width = width
+        chunk_height = min(tags.get(ROWS_PER_STRIP, (height,))[0], height)
+        offsets, byte_counts = tags[STRIP_OFFSETS], tags[STRIP_BYTE_COUNTS]
+
+    origin = scale = None
+    if MODEL_PIXEL_SCALE in tags and MODEL_TIEPOINT in tags:
+        scale_x, scale_y = tags[MODEL_PIXEL_SCALE][:2]
+        i, j, _, x, y, _ = tags[MODEL_TIEPOINT][:6]
+        origin = (x - i * scale_x, y + j * scale_y)
+        scale = (scale_x, -scale_y)
+
+    return TiffLayout(
+        width=width,
+        height=height,
+        samples=tags.get(SAMPLES_PER_PIXEL, (1,))[0],
+        dtype=dtype,
+        chunk_width=chunk_width,
+        chunk_height=chunk_height,
+        planar=tags.get(PLANAR_CONFIGURATION, (1,))[0] == 2,
+        compression=compression,
+        offsets=np.array(offsets, dtype=np.int64),
+        byte_counts=np.array(byte_counts, dtype=np.int64),
+        origin=origin,
+        scale=scale,
+    )
+
+
+class ChunkCache:
+    """LRU cache of decoded chunks, evicting the least recently used beyond a budget"""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._chunks: "OrderedDict[Tuple[str, int], NDArray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int]) -> Optional[NDArray]:
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._chunks.move_to_end(key)
+            return chunk
+
+    def put(self, key: Tuple[str, int], chunk: NDArray) -> None:
+        if chunk.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._chunks:
+                return
+            self._chunks[key] = chunk
+            self.nbytes += chunk.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._chunks.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+
+@dataclass
+class FetchStatistics:
+    """Counts of the bands resolved and of the reads made for them"""
+
+    bands: int = 0
+    chunks: int = 0
+    chunks_fetched: int = 0
+    range_reads: int = 0
+    bytes_read: int = 0
+    header_reads: int = 0
+
+
+@dataclass
+class BandRequest:
+    """A window of a band of an external raster file"""
+
+    url: str
+    band_number: int
+    col_off: int
+    row_off: int
+    width: int
+    height: int
+
+
+class OutDbResolver:
+    """Read the pixels of out-db bands, batching the reads of many bands
+
+    Parameters
+    ----------
+    backends : dict, optional
+        Backends by URL scheme, with a `read(url, offset, length)` method. Defaults to
+        local files and HTTP.
+    workers : int
+        Number of concurrent reads.
+    cache_bytes : int
+        Budget of the cache of decoded chunks.
+    max_gap : int
+        Ranges of a file less than this many bytes apart are read at once.
+    max_range_size : int
+        Maximum size of a coalesced range read.
+    """
+
+    def __init__(
+        self,
+        backends: Optional[Dict[str, object]] = None,
+        workers: int = 16,
+        cache_bytes: int = CACHE_BYTES,
+        max_gap: int = MAX_GAP,
+        max_range_size: int = MAX_RANGE_SIZE,
+    ):
+        self.backends = backends if backends is not None else default_backends()
+        self.cache = ChunkCache(cache_bytes)
+        self.max_gap = max_gap
+        self.max_range_size = max_range_size
+        self.statistics = FetchStatistics()
+        self._layouts: Dict[str, TiffLayout] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self) -> "OutDbResolver":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def _backend(self, url: str):
+        scheme = urlsplit(url).scheme
+        # Windows paths have a drive letter where the scheme would be
+        if len(scheme) == 1:
+            scheme = ""
+        if scheme not in self.backends:
+            raise ValueError(f"Unsupported URL scheme in {url}")
+        return self.backends[scheme]
+
+    def layouts(self, urls: Sequence[str]) -> Dict[str, TiffLayout]:
+        """The layouts of files, reading the headers of new files concurrently"""
+        new = sorted(set(urls) - set(self._layouts))
+        for url, layout in zip(
+            new,
+            self._executor.map(
+                lambda url: read_tiff_layout(self._backend(url), url), new
+            ),
+        ):
+            self._layouts[url] = layout
+        self.statistics.header_reads += len(new)
+        return {url: self._layouts[url] for url in urls}
+
+    def _fetch_chunks(
+        self, keys: Sequence[Tuple[str, int]]
+    ) -> Dict[Tuple[str, int], NDArray]:
+        """Decoded chunks, from the cache or coalesced concurrent range reads"""
+        chunks = {}
+        missing: Dict[str, List[int]] = {}
+        for key in dict.fromkeys(keys):
+            chunk = self.cache.get(key)
+            if chunk is None:
+                missing.setdefault(key[0], []).append(key[1])
+            else:
+                chunks[key] = chunk
+
+        reads = []
+        for url, indices in missing.items():
+            layout = self._layouts[url]
+            ranges = [
+                (int(layout.offsets[i]), int(layout.byte_counts[i])) for i in indices
+            ]
+            for offset, length, members in coalesce_ranges(
+                ranges, self.max_gap, self.max_range_size
+            ):
+                parts = [
+                    (indices[m], ranges[m][0] - offset, ranges[m][1]) for m in members
+                ]
+                reads.append((url, offset, length, parts))
+
+        def read(url: str, offset: int, length: int, parts) -> List:
+            data = self._backend(url).read(url, offset, length)
+            layout = self._layouts[url]
+            return [
+                (url, index, layout.decode_chunk(data[start : start + size]))
+                for index, start, size in parts
+            ]
+
+        futures = [self._executor.submit(read, *args) for args in reads]
+        for args, future in zip(reads, futures):
+            for url, index, chunk in future.result():
+                chunks[url, index] = chunk
+                self.cache.put((url, index), chunk)
+            self.statistics.range_reads += 1
+            self.statistics.bytes_read += args[2]
+            self.statistics.chunks_fetched += len(args[3])
+        return chunks
+
+    def fetch(self, requests: Sequence[BandRequest]) -> List[NDArray]:
+        """The pixels of windows of bands of external files, as (height, width) arrays"""
+        layouts = self.layouts([request.url for request in requests])
+        needed = []
+        for request in requests:
+            layout = layouts[request.url]
+            if not (
+                0 <= request.col_off
+                and 0 <= request.row_off
+                and request.col_off + request.width <= layout.width
+                and request.row_off + request.height <= layout.height
+            ):
+                raise ValueError(f"Window outside of {request.url}: {request}")
+            if request.band_number >= layout.samples:
+                raise ValueError(f"No band {request.band_number} in {request.url}")
+            needed.append(
+                [
+                    (request.url, index)
+                    for index in layout.chunk_indices(
+                        request.band_number,
+                        request.col_off,
+                        request.row_off,
+                        request.width,
+                        request.height,
+                    )
+                ]
+            )
+        chunks = self._fetch_chunks([key for keys in needed for key in keys])
+        self.statistics.bands += len(requests)
+        self.statistics.chunks += sum(len(keys) for keys in needed)
+
+        results = []
+        for request, keys in zip(requests, needed):
+            layout = layouts[request.url]
+            sample = 0 if layout.planar else request.band_number
+            pixels = np.empty((request.height, request.width), dtype=layout.dtype)
+            for key in keys:
+                chunk = chunks[key]
+                chunk_col, chunk_row = layout.chunk_origin(key[1])
+                col0 = max(request.col_off, chunk_col)
+                row0 = max(request.row_off, chunk_row)
+                col1 = min(
+                    request.col_off + request.width, chunk_col + layout.chunk_width
+                )
+                row1 = min(request.row_off + request.height, chunk_row + len(chunk))
+                pixels[
+                    row0 - request.row_off : row1 - request.row_off,
+                    col0 - request.col_off : col1 - request.col_off,
+                ] = chunk[
+                    row0 - chunk_row : row1 - chunk_row,
+                    col0 - chunk_col : col1 - chunk_col,
+                    sample,
+                ]
+            results.append(pixels)
+        return results
+
+    def band_request(self, tile: RasterTile, band: Band) -> BandRequest:
+        """The window of a file that an out-db band of a tile references"""
+        band_number, url = band.offline_reference
+        layout = self.layouts([url])[url]
+        col_off = row_off = 0
+        if layout.origin is not None:
+            col_off = round((tile.transform.ip_x - layout.origin[0]) / layout.scale[0])
+            row_off = round((tile.transform.ip_y - layout.origin[1]) / layout.scale[1])
+        return BandRequest(url, band_number, col_off, row_off, tile.width, tile.height)
+
+    def read(
+        self, tiles: Sequence[RasterTile], bands: Optional[Sequence[int]] = None
+    ) -> List[List[NDArray]]:
+        """The pixels of bands of many tiles, in-db or out-db, as (height, width) arrays
+
+        The reads of the out-db bands of all the tiles are batched together.
+        """
+        results: List[List[Optional[NDArray]]] = []
+        offline = []
+        for tile in tiles:
+            tile_bands = tile.bands
+            selected = range(len(tile_bands)) if bands is None else bands
+            row: List[Optional[NDArray]] = []
+            for i in selected:
+                band = tile_bands[i]
+                if band.is_offline:
+                    offline.append((len(results), len(row), tile, band))
+                    row.append(None)
+                else:
+                    row.append(band.to_numpy())
+            results.append(row)
+
+        # Fetch the headers of all the files at once before resolving the windows
+        self.layouts([band.offline_reference[1] for _, _, _, band in offline])
+        requests = [self.band_request(tile, band) for _, _, tile, band in offline]
+        for (i, j, _, band), pixels in zip(offline, self.fetch(requests)):
+            results[i][j] = pixels.astype(band.dtype, copy=False)
+        return results
@@ -0,0 +1,240 @@
+"""
+Write nz-building-outlines as a spatially partitioned, multi-file GeoParquet dataset.
+
+Features are split into partitions of roughly equal count by a balanced KD-tree over the
+centres of their bounding boxes, and each partition is written to its own GeoParquet
+file with its own tight `bbox`. A `_partitions.json` manifest lists the bbox of each
+file, so readers can prune whole files without opening their footers.
+"""
+
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import click
+import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+from numpy.typing import NDArray
+
+from spatial_sort import AVAILABLE_SORTS, bbox_centers, sort_order
+from write_nz_building_outline import (
+    AVAILABLE_COMPRESSIONS,
+    PathType,
+    cast_dtypes,
+    geopandas_to_arrow,
+)
+
+MANIFEST_NAME = "_partitions.json"
+
+
+def kdtree_partition(
+    x: NDArray[np.float64], y: NDArray[np.float64], n_partitions: int
+) -> NDArray[np.int64]:
+    """Assign points to partitions with a balanced KD-tree
+
+    Each node is split along the axis with the largest spread, at the point that
+    divides its points in proportion to the number of partitions on each side, so
+    that any number of partitions (not only powers of two) get roughly equal counts.
+    Points with NaN coordinates (missing or empty geometries) end up in the last
+    partitions.
+
+    Returns
+    -------
+    The partition index of each point.
+    """
+    labels = np.empty(len(x), dtype=np.int64)
+    coords = np.column_stack([x, y])
+
+    # Iterative to avoid deep recursion: (indices, n_partitions, first label)
+    stack = [(np.arange(len(x)), n_partitions, 0)]
+    while stack:
+        indices, n, first_label = stack.pop()
+        if n == 1 or len(indices) == 0:
+            labels[indices] = first_label
+            continue
+
+        node = coords[indices]
+        spread = np.nanmax(node, axis=0) - np.nanmin(node, axis=0)
+        axis = int(np.nanargmax(spread)) if not np.isnan(spread).all() else 0
+
+        n_left = n // 2
+        k = len(indices) * n_left // n
+        order = np.argpartition(node[:, axis], k) if 0 < k < len(indices) else None
+        if order is None:
+            left, right = indices[:k], indices[k:]
+        else:
+            left, right = indices[order[:k]], indices[order[k:]]
+
+        stack.append((left, n_left, first_label))
+        stack.append((right, n - n_left, first_label + n_left))
+
+    return labels
+
+
+def _write_partition(
+    df: gpd.GeoDataFrame,
+    path: Path,
+    compression: str,
+    covering: bool,
+    sort: Optional[str],
+) -> Dict[str, Any]:
+    """Write a single partition and return its manifest entry"""
+    if sort is not None:
+        df = df.take(sort_order(df.geometry.values, sort, crs=df.crs))
+
+    table = geopandas_to_arrow(df, covering=covering)
+    pq.write_table(table, path, compression=compression, write_statistics=True)
+
+    geo_metadata = json.loads(table.schema.metadata[b"geo"])
+    primary_column = geo_metadata["primary_column"]
+    return {
+        "path": path.name,
+        "num_rows": len(table),
+        "bbox": geo_metadata["columns"][primary_column].get("bbox"),
+    }
+
+
+def write_partitioned(
+    df: gpd.GeoDataFrame,
+    output: Path,
+    n_partitions: int,
+    compression: str = "SNAPPY",
+    covering: bool = False,
+    sort: Optional[str] = None,
+    workers: int = 1,
+) -> List[Dict[str, Any]]:
+    """Write a GeoDataFrame as one GeoParquet file per KD-tree leaf
+
+    Partitions are written in parallel on a process pool. The manifest, with the path
+    (relative to `output`), number of rows and bbox of each file, is written to
+    `output / MANIFEST_NAME` and returned.
+    """
+    output.mkdir(parents=True, exist_ok=True)
+    x, y = bbox_centers(np.asarray(df.geometry.values))
+    labels = kdtree_partition(x, y, n_partitions)
+
+    partitions = []
+    for i in range(n_partitions):
+        partition = df.iloc[np.flatnonzero(labels == i)]
+        if len(partition):
+            partitions.append((partition, output / f"part-{i:05d}.parquet"))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _write_partition, partition, path, compression, covering, sort
+            )
+            for partition, path in partitions
+        ]
+        manifest = [future.result() for future in futures]
+
+    with open(output / MANIFEST_NAME, "w") as f:
+        json.dump({"partitions": manifest}, f, indent=2)
+
+    return manifest
+
+
+def read_manifest(
+    directory: Path, bbox: Optional[Sequence[float]] = None
+) -> List[Dict[str, Any]]:
+    """Read the partition manifest, keeping only files that intersect bbox"""
+    with open(directory / MANIFEST_NAME) as f:
+        partitions = json.load(f)["partitions"]
+
+    if bbox is None:
+        return partitions
+
+    # Partitions without any non-empty geometries have no bbox
+    xmin, ymin, xmax, ymax = bbox
+    return [
+        partition
+        for partition in partitions
+        if partition["bbox"] is not None
+        and partition["bbox"][0] <= xmax
+        and partition["bbox"][2] >= xmin
+        and partition["bbox"][1] <= ymax
+        and partition["bbox"][3] >= ymin
+    ]
+
+
+@click.command()
+@click.option(
+    "-i",
+    "--input",
+    type=PathType(exists=True, file_okay=True, dir_okay=False, readable=True),
+    help="Path to input nz-building-outlines.gpkg",
+    required=True,
+)
+@click.option(
+    "--layer-name",
+    type=str,
+    required=False,
+    help="Name of layer within GeoPackage",
+    show_default=True,
+    default="nz_building_outlines",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=PathType(file_okay=False, dir_okay=True, writable=True),
+    help="Path to output directory.",
+    required=True,
+)
+@click.option(
+    "-n",
+    "--partitions",
+    type=click.IntRange(min=1),
+    default=16,
+    help="Number of files to partition the features into.",
+    show_default=True,
+)
+@click.option(
+    "--compression",
+    type=click.Choice(AVAILABLE_COMPRESSIONS, case_sensitive=False),
+    default="SNAPPY",
+    help="Compression codec to use when writing to Parquet.",
+    show_default=True,
+)
+@click.option(
+    "--covering/--no-covering",
+    default=False,
+    help="Add a bbox covering column with per-row-group statistics.",
+    show_default=True,
+)
+@click.option(
+    "--sort",
+    type=click.Choice(AVAILABLE_SORTS),
+    default=None,
+    help="Spatially order rows within each file along a space-filling curve.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of processes writing partitions. Defaults to the number of CPUs.",
+)
+def main(
+    input: Path,
+    layer_name: str,
+    output: Path,
+    partitions: int,
+    compression: str,
+    covering: bool,
+    sort: Optional[str],
+    workers: Optional[int],
+):
+    print("Starting to read geopackage", file=sys.stderr)
+    df = gpd.read_file(input, layer=layer_name)
+    print("Finished reading geopackage", file=sys.stderr)
+    df = cast_dtypes(df)
+
+    print(f"Starting write of {partitions} partitions", file=sys.stderr)
+    write_partitioned(df, output, partitions, compression, covering, sort, workers)
+    print("Finished write of partitions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,747 @@
+"""
+Write and read rasters in the Parquet Raster layout of `format-specs/parquet-raster.md`.
+
+Rasters are split into tiles, and each tile is a row with a raster struct column and a
+WKB footprint geometry column, so that GeoParquet readers can filter tiles spatially. A
+bbox covering column of the footprints is written too, so that readers can skip whole
+row groups. Tiles are written one row group at a time from NumPy arrays, which can be
+memory-mapped, so scenes larger than memory can be written.
+
+When reading a window, only the row groups and tiles whose footprint intersects the
+window are read, and bands are decoded lazily. In-db bands that aren't GZIP compressed
+are decoded as NumPy views of the Arrow buffers, without copying.
+
+Footprints, bounds, pixel to world and world to pixel transformations, and the pixel
+windows of a world window are computed for whole columns of raster structs at once with
+NumPy, from the georeference fields of the column.
+
+The specification is a work in progress. Where it is ambiguous, this module follows the
+PostGIS WKB raster format it is based on: the flags of a band are the high bits of its
+first byte (isOffline 0x80, hasNodataValue 0x40, isAllNodata 0x20, isGZIPPed 0x10) and
+the pixel type its low 4 bits. `ip_x` and `ip_y` are the world coordinates of the upper
+left corner of the raster, as in the affine transformation of the specification.
+"""
+
+import gzip
+import json
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from numpy.typing import NDArray
+from pyproj import CRS
+
+from read_geoparquet import prune_row_groups
+from schema_registry import get_schema
+from write_nz_building_outline import bounds_covering
+
+RASTER_VERSION = "0.1.0"
+
+OFFLINE = 0x80
+HAS_NODATA = 0x40
+ALL_NODATA = 0x20
+GZIPPED = 0x10
+
+# NumPy dtypes of the pixel types. 1, 2 and 4-bit values are stored as 1 byte each.
+PIXEL_TYPES: Dict[int, np.dtype] = {
+    0: np.dtype("u1"),
+    1: np.dtype("u1"),
+    2: np.dtype("u1"),
+    3: np.dtype("i1"),
+    4: np.dtype("u1"),
+    5: np.dtype("<i2"),
+    6: np.dtype("<u2"),
+    7: np.dtype("<i4"),
+    8: np.dtype("<u4"),
+    10: np.dtype("<f4"),
+    11: np.dtype("<f8"),
+}
+DTYPE_PIXEL_TYPES: Dict[np.dtype, int] = {
+    np.dtype("bool"): 0,
+    np.dtype("i1"): 3,
+    np.dtype("u1"): 4,
+    np.dtype("i2"): 5,
+    np.dtype("u2"): 6,
+    np.dtype("i4"): 7,
+    np.dtype("u4"): 8,
+    np.dtype("f4"): 10,
+    np.dtype("f8"): 11,
+}
+
+RASTER_TYPE = pa.struct(
+    [
+        pa.field("crs", pa.string()),
+        pa.field("scale_x", pa.float64(), nullable=False),
+        pa.field("scale_y", pa.float64(), nullable=False),
+        pa.field("ip_x", pa.float64(), nullable=False),
+        pa.field("ip_y", pa.float64(), nullable=False),
+        pa.field("skew_x", pa.float64(), nullable=False),
+        pa.field("skew_y", pa.float64(), nullable=False),
+        pa.field("width", pa.int32(), nullable=False),
+        pa.field("height", pa.int32(), nullable=False),
+        pa.field("bands", pa.list_(pa.binary()), nullable=False),
+    ]
+)
+GEOREFERENCE_FIELDS = ["ip_x", "ip_y", "scale_x", "scale_y", "skew_x", "skew_y"]
+
+
+@dataclass(frozen=True)
+class GeoTransform:
+    """Affine transformation from the pixel grid to world coordinates
+
+    (col, row) = (0, 0) is the upper left corner of the upper left pixel, so the
+    centre of a pixel is at (col + 0.5, row + 0.5).
+    """
+
+    ip_x: float
+    ip_y: float
+    scale_x: float
+    scale_y: float
+    skew_x: float = 0.0
+    skew_y: float = 0.0
+
+    def to_world(
+        self, col: NDArray[np.float64], row: NDArray[np.float64]
+    ) -> Tuple[NDArray[np.float64], NDArray[np.float64]]:
+        x = self.ip_x + col * self.scale_x + row * self.skew_x
+        y = self.ip_y + col * self.skew_y + row * self.scale_y
+        return x, y
+
+    def window(self, col_off: int, row_off: int) -> "GeoTransform":
+        """The transformation of a window starting at (col_off, row_off)"""
+        ip_x, ip_y = self.to_world(col_off, row_off)
+        return GeoTransform(
+            float(ip_x),
+            float(ip_y),
+            self.scale_x,
+            self.scale_y,
+            self.skew_x,
+            self.skew_y,
+        )
+
+
+Georeference = Dict[str, NDArray]
+
+# WKB of a polygon with one ring of 5 points, as written by shapely
+FOOTPRINT_WKB_DTYPE = np.dtype(
+    [
+        ("byte_order", "u1"),
+        ("geometry_type", "<u4"),
+        ("rings", "<u4"),
+        ("points", "<u4"),
+        ("coords", "<f8", (5, 2)),
+    ]
+)
+
+
+def georeference(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+) -> Georeference:
+    """The georeference, width and height of a column of rasters as NumPy arrays
+
+    Fields without nulls are converted without copying. The "valid" array is False
+    for null rasters. A dict returned by this function is passed through, so that it
+    can be computed once for several of the functions below.
+    """
+    if isinstance(rasters, dict):
+        return rasters
+    if isinstance(rasters, pa.ChunkedArray):
+        rasters = rasters.combine_chunks()
+    arrays = {
+        name: rasters.field(name).to_numpy(zero_copy_only=False)
+        for name in GEOREFERENCE_FIELDS + ["width", "height"]
+    }
+    arrays["valid"] = rasters.is_valid().to_numpy(zero_copy_only=False)
+    return arrays
+
+
+def _per_raster(values: NDArray, ndim: int) -> NDArray:
+    """Values of each raster shaped to broadcast against (n, ...) arrays of points"""
+    return values.reshape(values.shape + (1,) * (ndim - 1))
+
+
+def pixel_to_world(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+    col: NDArray,
+    row: NDArray,
+) -> Tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """World coordinates of the centres of pixels
+
+    col and row are arrays of shape (n,) or (n, k), with one or k pixels for each of
+    the n rasters.
+    """
+    g = georeference(rasters)
+    col = np.asarray(col, dtype=np.float64) + 0.5
+    row = np.asarray(row, dtype=np.float64) + 0.5
+    ndim = max(col.ndim, row.ndim, 1)
+    ip_x, ip_y, scale_x, scale_y, skew_x, skew_y = [
+        _per_raster(g[name], ndim) for name in GEOREFERENCE_FIELDS
+    ]
+    x = ip_x + col * scale_x + row * skew_x
+    y = ip_y + col * skew_y + row * scale_y
+    return x, y
+
+
+def _world_to_grid(
+    g: Georeference, x: NDArray, y: NDArray
+) -> Tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """Inverse of the affine transformation, to coordinates in the pixel grid where
+    (0, 0) is the upper left corner of the raster"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ndim = max(x.ndim, y.ndim, 1)
+    ip_x, ip_y, scale_x, scale_y, skew_x, skew_y = [
+        _per_raster(g[name], ndim) for name in GEOREFERENCE_FIELDS
+    ]
+    determinant = scale_x * scale_y - skew_x * skew_y
+    if (determinant[g["valid"]] == 0).any():
+        raise ValueError("Rasters with a non-invertible transformation")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dx = x - ip_x
+        dy = y - ip_y
+        col = (scale_y * dx - skew_x * dy) / determinant
+        row = (scale_x * dy - skew_y * dx) / determinant
+    return col, row
+
+
+def world_to_pixel(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+    x: NDArray,
+    y: NDArray,
+) -> Tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """Column and row of the pixels containing points
+
+    x and y are arrays of shape (n,) or (n, k), with one or k points for each of the n
+    rasters. Points outside of a raster get a column or row outside of its size.
+    """
+    col, row = _world_to_grid(georeference(rasters), x, y)
+    return np.floor(col).astype(np.int64), np.floor(row).astype(np.int64)
+
+
+def _corners(g: Georeference) -> Tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """(n, 5) world coordinates of the closed outline of each raster"""
+    right_x = g["width"] * g["scale_x"]
+    right_y = g["width"] * g["skew_y"]
+    down_x = g["height"] * g["skew_x"]
+    down_y = g["height"] * g["scale_y"]
+    x = np.empty((len(right_x), 5))
+    y = np.empty((len(right_x), 5))
+    x[:, 0] = x[:, 4] = g["ip_x"]
+    y[:, 0] = y[:, 4] = g["ip_y"]
+    np.add(x[:, 0], right_x, out=x[:, 1])
+    np.add(y[:, 0], right_y, out=y[:, 1])
+    np.add(x[:, 1], down_x, out=x[:, 2])
+    np.add(y[:, 1], down_y, out=y[:, 2])
+    np.add(x[:, 0], down_x, out=x[:, 3])
+    np.add(y[:, 0], down_y, out=y[:, 3])
+    return x, y
+
+
+def raster_footprints(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+) -> NDArray[np.object_]:
+    """Polygons of the outlines of rasters, None for null rasters"""
+    g = georeference(rasters)
+    x, y = _corners(g)
+    polygons = shapely.polygons(np.stack([x, y], axis=-1))
+    polygons[~g["valid"]] = None
+    return polygons
+
+
+def raster_bounds(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+) -> NDArray[np.float64]:
+    """(n, 4) bounds of the outlines of rasters, NaN for null rasters"""
+    g = georeference(rasters)
+    x, y = _corners(g)
+    # Reductions along short rows are slow in NumPy, so reduce the corners pairwise
+    bounds = np.column_stack(
+        [
+            np.minimum(np.minimum(x[:, 0], x[:, 1]), np.minimum(x[:, 2], x[:, 3])),
+            np.minimum(np.minimum(y[:, 0], y[:, 1]), np.minimum(y[:, 2], y[:, 3])),
+            np.maximum(np.maximum(x[:, 0], x[:, 1]), np.maximum(x[:, 2], x[:, 3])),
+            np.maximum(np.maximum(y[:, 0], y[:, 1]), np.maximum(y[:, 2], y[:, 3])),
+        ]
+    )
+    bounds[~g["valid"]] = np.nan
+    return bounds
+
+
+def window_to_pixels(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+    window: Sequence[float],
+) -> NDArray[np.int64]:
+    """(n, 4) col_off, row_off, width and height of the pixels of each raster that
+    intersect a (xmin, ymin, xmax, ymax) window
+
+    Windows are clipped to the rasters, and are empty for rasters that don't intersect
+    the window. For skewed rasters, the window of pixels covers the window, but may
+    include pixels outside of it.
+    """
+    g = georeference(rasters)
+    xmin, ymin, xmax, ymax = window
+    col_min = row_min = np.inf
+    col_max = row_max = -np.inf
+    for x, y in [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]:
+        col, row = _world_to_grid(g, x, y)
+        col_min, col_max = np.minimum(col_min, col), np.maximum(col_max, col)
+        row_min, row_max = np.minimum(row_min, row), np.maximum(row_max, row)
+    col0 = np.clip(np.floor(col_min), 0, g["width"])
+    col1 = np.clip(np.ceil(col_max), 0, g["width"])
+    row0 = np.clip(np.floor(row_min), 0, g["height"])
+    row1 = np.clip(np.ceil(row_max), 0, g["height"])
+    pixels = np.column_stack([col0, row0, col1 - col0, row1 - row0])
+    pixels[~g["valid"]] = 0
+    return pixels.astype(np.int64)
+
+
+def footprints_wkb(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+) -> pa.Array:
+    """WKB of the outlines of rasters, null for null rasters
+
+    The WKB is written directly from the corner coordinates, without creating shapely
+    geometries, and is the same as that of `shapely.to_wkb(raster_footprints(...))`.
+    """
+    g = georeference(rasters)
+    x, y = _corners(g)
+    n = len(x)
+    wkb = np.empty(n, dtype=FOOTPRINT_WKB_DTYPE)
+    wkb["byte_order"] = 1
+    wkb["geometry_type"] = 3
+    wkb["rings"] = 1
+    wkb["points"] = 5
+    wkb["coords"][:, :, 0] = x
+    wkb["coords"][:, :, 1] = y
+
+    size = FOOTPRINT_WKB_DTYPE.itemsize
+    valid = g["valid"]
+    lengths = np.where(valid, size, 0)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    data = (wkb if valid.all() else wkb[valid]).view(np.uint8)
+    if offsets[-1] < 2**31:
+        arrow_type, offsets = pa.binary(), offsets.astype(np.int32)
+    else:
+        arrow_type = pa.large_binary()
+    return pa.Array.from_buffers(
+        arrow_type,
+        n,
+        [
+            None if valid.all() else pa.array(valid).buffers()[1],
+            pa.py_buffer(offsets),
+            pa.py_buffer(data),
+        ],
+    )
+
+
+def companion_columns(
+    rasters: Union[pa.StructArray, pa.ChunkedArray, Georeference],
+) -> Tuple[pa.Array, pa.StructArray]:
+    """The footprint geometry column and its bbox covering column for rasters"""
+    g = georeference(rasters)
+    return footprints_wkb(g), bounds_covering(raster_bounds(g))
+
+
+def crs_string(crs: Any) -> str:
+    """The `type:value` string of a CRS, for the crs field of a raster"""
+    crs = CRS.from_user_input(crs)
+    return "projjson:" + crs.to_json()
+
+
+def parse_crs(value: Optional[str]) -> Optional[CRS]:
+    if value is None:
+        return None
+    kind, _, definition = value.partition(":")
+    if kind == "srid":
+        return CRS.from_epsg(int(definition))
+    if kind == "projjson":
+        return CRS.from_json(definition)
+    return CRS.from_user_input(value)
+
+
+def encode_band(
+    pixels: NDArray, nodata: Optional[float] = None, compress: bool = False
+) -> bytes:
+    """Encode the pixels of a band as in-db band data"""
+    pixtype = DTYPE_PIXEL_TYPES[pixels.dtype]
+    dtype = PIXEL_TYPES[pixtype]
+    flags = pixtype
+    if nodata is not None:
+        flags |= HAS_NODATA
+        if (pixels == nodata).all():
+            flags |= ALL_NODATA
+    data = np.ascontiguousarray(pixels, dtype=dtype).tobytes()
+    if compress:
+        flags |= GZIPPED
+        data = gzip.compress(data, compresslevel=6)
+
+    nodata_bytes = np.array(0 if nodata is None else nodata, dtype=dtype).tobytes()
+    return b"".join([bytes([flags]), nodata_bytes, struct.pack("<q", len(data)), data])
+
+
+def encode_offline_band(
+    url: str, band_number: int, dtype: np.dtype, nodata: Optional[float] = None
+) -> bytes:
+    """Encode a reference to a band of an external raster file as out-db band data"""
+    pixtype = DTYPE_PIXEL_TYPES[np.dtype(dtype)]
+    flags = OFFLINE | pixtype | (HAS_NODATA if nodata is not None else 0)
+    nodata_bytes = np.array(
+        0 if nodata is None else nodata, dtype=PIXEL_TYPES[pixtype]
+    ).tobytes()
+    encoded_url = url.encode()
+    data = struct.pack("<bh", band_number, len(encoded_url)) + encoded_url
+    return b"".join([bytes([flags]), nodata_bytes, struct.pack("<q", len(data)), data])
+
+
+class Band:
+    """A band of a raster tile, of which only the header is decoded
+
+    The pixels are decoded when calling `to_numpy`.
+    """
+
+    def __init__(self, buffer: pa.Buffer, width: int, height: int):
+        self.width = width
+        self.height = height
+        flags = buffer[0]
+        self.pixtype = flags & 0x0F
+        self.dtype = PIXEL_TYPES[self.pixtype]
+        self.is_offline = bool(flags & OFFLINE)
+        self.is_all_nodata = bool(flags & ALL_NODATA)
+        self.is_gzipped = bool(flags & GZIPPED)
+        nodata = np.frombuffer(buffer, self.dtype, count=1, offset=1)[0]
+        self.nodata = nodata.item() if flags & HAS_NODATA else None
+        header_size = 1 + self.dtype.itemsize
+        (length,) = struct.unpack_from("<q", buffer, header_size)
+        self.data = buffer.slice(header_size + 8, length)
+
+    @property
+    def offline_reference(self) -> Tuple[int, str]:
+        """The band number and URL of an out-db band"""
+        if not self.is_offline:
+            raise ValueError("Band is stored in-db")
+        band_number, length = struct.unpack_from("<bh", self.data)
+        return band_number, self.data.to_pybytes()[3 : 3 + length].decode()
+
+    def to_numpy(self) -> NDArray:
+        """The pixels as a (height, width) array
+
+        Without GZIP compression, this is a read-only view of the Arrow buffer, which
+        may not be aligned.
+        """
+        if self.is_offline:
+            raise ValueError("Out-db bands are read with outdb.OutDbResolver")
+        data = gzip.decompress(self.data) if self.is_gzipped else self.data
+        pixels = np.frombuffer(data, self.dtype, count=self.width * self.height)
+        return pixels.reshape(self.height, self.width)
+
+
+@dataclass
+class RasterTile:
+    """A raster read from a row, with its bands decoded lazily"""
+
+    transform: GeoTransform
+    width: int
+    height: int
+    crs: Optional[str]
+    band_buffers: List[pa.Buffer]
+
+    @property
+    def bands(self) -> List[Band]:
+        return [Band(buffer, self.width, self.height) for buffer in self.band_buffers]
+
+    def band(self, index: int) -> Band:
+        return Band(self.band_buffers[index], self.width, self.height)
+
+    @property
+    def footprint(self) -> shapely.Polygon:
+        georeference = {
+            name: np.array([getattr(self.transform, name)])
+            for name in GEOREFERENCE_FIELDS
+        }
+        georeference["width"] = np.array([self.width])
+        georeference["height"] = np.array([self.height])
+        georeference["valid"] = np.array([True])
+        return raster_footprints(georeference)[0]
+
+
+def iter_tiles(
+    array: NDArray, tile_size: Tuple[int, int]
+) -> Iterator[Tuple[int, int, NDArray]]:
+    """(col_off, row_off, pixels) of the tiles of a (bands, height, width) array,
+    row of tiles after row of tiles
+
+    Tiles on the right and bottom edges are smaller if the tile size doesn't divide
+    the size of the array.
+    """
+    tile_width, tile_height = tile_size
+    _, height, width = array.shape
+    for row_off in range(0, height, tile_height):
+        for col_off in range(0, width, tile_width):
+            tile = array[
+                :, row_off : row_off + tile_height, col_off : col_off + tile_width
+            ]
+            yield col_off, row_off, tile
+
+
+class RasterWriter:
+    """Write rasters as tiles to a Parquet Raster file, one row group at a time
+
+    Each tile is a row with a raster struct column, its footprint as a WKB geometry
+    column, and a bbox covering column of the footprint. The raster and geo metadata
+    are added to the footer when closing the file.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        crs: Optional[Any] = None,
+        row_group_size: int = 64,
+        compression: str = "ZSTD",
+        compress_bands: bool = False,
+    ):
+        self.path = path
+        self.crs = None if crs is None else CRS.from_user_input(crs)
+        self.row_group_size = row_group_size
+        self.compress_bands = compress_bands
+        self._crs_string = None if crs is None else crs_string(self.crs)
+        self._bbox = np.full(4, np.nan)
+        self._rows: List[Dict[str, Any]] = []
+        self._schema = pa.schema(
+            [
+                pa.field("raster", RASTER_TYPE),
+                pa.field("geometry", pa.binary()),
+                pa.field("bbox", bounds_covering(np.empty((0, 4))).type),
+            ]
+        )
+        self._writer = pq.ParquetWriter(
+            path, self._schema, compression=compression, store_schema=False
+        )
+
+    def __enter__(self) -> "RasterWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(
+        self,
+        array: NDArray,
+        transform: GeoTransform,
+        nodata: Optional[float] = None,
+        tile_size: Tuple[int, int] = (256, 256),
+    ) -> None:
+        """Write the tiles of a (bands, height, width) or (height, width) array
+
+        Only the pixels of the tiles of a row group are read from the array at a time,
+        so it can be memory-mapped.
+        """
+        if array.ndim == 2:
+            array = array[None]
+        for col_off, row_off, tile in iter_tiles(array, tile_size):
+            bands = [encode_band(band, nodata, self.compress_bands) for band in tile]
+            self._append(
+                transform.window(col_off, row_off), tile.shape[2], tile.shape[1], bands
+            )
+
+    def write_outdb(
+        self,
+        url: str,
+        transform: GeoTransform,
+        width: int,
+        height: int,
+        dtype: np.dtype,
+        band_numbers: Sequence[int] = (0,),
+        nodata: Optional[float] = None,
+        tile_size: Tuple[int, int] = (256, 256),
+    ) -> None:
+        """Write the tiles of an external raster file as out-db bands
+
+        The tiles reference the bands of the whole file, and their window in it is
+        given by their georeference. The file isn't read.
+        """
+        bands = [
+            encode_offline_band(url, band_number, dtype, nodata)
+            for band_number in band_numbers
+        ]
+        tile_width, tile_height = tile_size
+        for row_off in range(0, height, tile_height):
+            for col_off in range(0, width, tile_width):
+                self._append(
+                    transform.window(col_off, row_off),
+                    min(tile_width, width - col_off),
+                    min(tile_height, height - row_off),
+                    bands,
+                )
+
+    def _append(
+        self, transform: GeoTransform, width: int, height: int, bands: List[bytes]
+    ) -> None:
+        self._rows.append(
+            {
+                "crs": self._crs_string,
+                **{name: getattr(transform, name) for name in GEOREFERENCE_FIELDS},
+                "width": width,
+                "height": height,
+                "bands": bands,
+            }
+        )
+        if len(self._rows) == self.row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        rasters = pa.array(self._rows, type=RASTER_TYPE)
+        g = georeference(rasters)
+        bounds = raster_bounds(g)
+        self._bbox[:2] = np.fmin(self._bbox[:2], bounds[:, :2].min(axis=0))
+        self._bbox[2:] = np.fmax(self._bbox[2:], bounds[:, 2:].max(axis=0))
+        batch = pa.RecordBatch.from_arrays(
+            [rasters, footprints_wkb(g), bounds_covering(bounds)],
+            schema=self._schema,
+        )
+        self._writer.write_batch(batch, row_group_size=len(self._rows))
+        self._rows = []
+
+    def metadata(self) -> Dict[str, Dict[str, Any]]:
+        """The raster and geo metadata of the tiles written so far"""
+        geometry_metadata: Dict[str, Any] = {
+            "encoding": "WKB",
+            "geometry_types": ["Polygon"],
+            "crs": None if self.crs is None else self.crs.to_json_dict(),
+            "covering": {
+                "bbox": {
+                    name: ["bbox", name] for name in ["xmin", "ymin", "xmax", "ymax"]
+                }
+            },
+        }
+        if not np.isnan(self._bbox).any():
+            geometry_metadata["bbox"] = self._bbox.tolist()
+        return {
+            "raster": {
+                "version": RASTER_VERSION,
+                "primary_column": "raster",
+                "columns": {"raster": {"geometry": "geometry"}},
+            },
+            "geo": {
+                "version": get_schema()["properties"]["version"]["const"],
+                "primary_column": "geometry",
+                "columns": {"geometry": geometry_metadata},
+            },
+        }
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        try:
+            self._flush()
+            self._writer.add_key_value_metadata(
+                {key: json.dumps(value) for key, value in self.metadata().items()}
+            )
+        finally:
+            self._writer.close()
+            self._writer = None
+
+
+def write_raster(
+    path: Path,
+    array: NDArray,
+    transform: GeoTransform,
+    crs: Optional[Any] = None,
+    nodata: Optional[float] = None,
+    tile_size: Tuple[int, int] = (256, 256),
+    row_group_size: int = 64,
+    compression: str = "ZSTD",
+    compress_bands: bool = False,
+) -> None:
+    """Write a (bands, height, width) or (height, width) array as a tiled raster"""
+    with RasterWriter(path, crs, row_group_size, compression, compress_bands) as writer:
+        writer.write(array, transform, nodata, tile_size)
+
+
+def get_raster_metadata(metadata: pq.FileMetaData) -> Dict[str, Any]:
+    key_value_metadata = metadata.metadata or {}
+    if b"raster" not in key_value_metadata:
+        raise ValueError("No 'raster' metadata found in parquet file")
+    return json.loads(key_value_metadata[b"raster"])
+
+
+def _tiles(rasters: pa.StructArray) -> Iterator[RasterTile]:
+    georeference = {
+        name: rasters.field(name).to_numpy() for name in GEOREFERENCE_FIELDS
+    }
+    widths = rasters.field("width").to_numpy()
+    heights = rasters.field("height").to_numpy()
+    crs = rasters.field("crs")
+    bands = rasters.field("bands")
+    offsets = bands.offsets.to_numpy()
+    values = bands.values
+    for i in range(len(rasters)):
+        yield RasterTile(
+            transform=GeoTransform(
+                **{name: float(georeference[name][i]) for name in GEOREFERENCE_FIELDS}
+            ),
+            width=int(widths[i]),
+            height=int(heights[i]),
+            crs=crs[i].as_py(),
+            band_buffers=[
+                values[j].as_buffer() for j in range(offsets[i], offsets[i + 1])
+            ],
+        )
+
+
+def read_window(
+    path: Path,
+    window: Optional[Sequence[float]] = None,
+    column: Optional[str] = None,
+) -> Iterator[RasterTile]:
+    """The tiles of a Parquet Raster file whose footprint intersects a window
+
+    Parameters
+    ----------
+    path : Path
+    window : sequence of float, optional
+        (xmin, ymin, xmax, ymax) in the CRS of the raster. If not given, all the tiles
+        are returned.
+    column : str, optional
+        Raster column to read. Defaults to the primary column.
+
+    Row groups are pruned with the statistics of the footprint column, the footprints
+    of the remaining row groups are tested exactly, and the raster column is only read
+    for the row groups that have intersecting tiles. Band pixels are only decoded
+    when calling `Band.to_numpy`.
+    """
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    column = column or get_raster_metadata(metadata)["primary_column"]
+    geometry = get_raster_metadata(metadata)["columns"][column]["geometry"]
+
+    if window is None:
+        row_groups = list(range(metadata.num_row_groups))
+    else:
+        row_groups = prune_row_groups(metadata, window, geometry)
+        query = shapely.box(*window)
+        shapely.prepare(query)
+
+    for i in row_groups:
+        if window is None:
+            rows = None
+        else:
+            wkb = parquet_file.read_row_group(i, columns=[geometry]).column(0)
+            mask = shapely.intersects(
+                query, shapely.from_wkb(wkb.to_numpy(zero_copy_only=False))
+            )
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                continue
+
+        rasters = parquet_file.read_row_group(i, columns=[column]).column(0)
+        if rows is not None:
+            rasters = rasters.take(rows)
+        for chunk in rasters.chunks:
+            yield from _tiles(chunk)
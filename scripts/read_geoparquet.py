@@ -0,0 +1,319 @@
+"""
+Read GeoParquet files filtered by a bounding box.
+
+Row groups whose bounds don't intersect the query box are skipped without being read.
+Their bounds come from the Parquet geospatial statistics of the geometry column or from
+the statistics of the bbox covering column. The rows of the remaining row groups are
+then filtered exactly with a vectorized shapely intersects test.
+
+With `memory_map`, the file is memory-mapped rather than read into private buffers, and
+its footer and row group bounds come from the cache of `metadata_cache`, so that
+processes reading the same files share them through the OS page cache.
+"""
+
+import json
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import click
+import geoarrow.pyarrow as ga
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from numpy.typing import NDArray
+
+from inspect_metadata import row_group_bounds
+from metadata_cache import load_index
+
+# geoarrow types of the GeoParquet 1.1 native encodings
+NATIVE_TYPES = {
+    "point": ga.point,
+    "linestring": ga.linestring,
+    "polygon": ga.polygon,
+    "multipoint": ga.multipoint,
+    "multilinestring": ga.multilinestring,
+    "multipolygon": ga.multipolygon,
+}
+DIMENSIONS = {
+    "xy": ga.Dimensions.XY,
+    "xyz": ga.Dimensions.XYZ,
+    "xym": ga.Dimensions.XYM,
+    "xyzm": ga.Dimensions.XYZM,
+}
+
+
+@dataclass
+class ReadStatistics:
+    """How much of a file a filtered read could skip"""
+
+    row_groups: int = 0
+    row_groups_read: int = 0
+    bytes: int = 0
+    bytes_read: int = 0
+    rows_read: int = 0
+    rows_matched: int = 0
+
+    @property
+    def row_groups_skipped(self) -> int:
+        return self.row_groups - self.row_groups_read
+
+    @property
+    def bytes_skipped(self) -> int:
+        return self.bytes - self.bytes_read
+
+    def __str__(self):
+        return (
+            f"read {self.row_groups_read} of {self.row_groups} row groups "
+            f"({self.bytes_read} of {self.bytes} compressed bytes), "
+            f"{self.rows_matched} of {self.rows_read} rows read matched"
+        )
+
+
+def get_geo_metadata(metadata: pq.FileMetaData) -> Dict[str, Any]:
+    key_value_metadata = metadata.metadata or {}
+    if b"geo" not in key_value_metadata:
+        raise ValueError("No 'geo' metadata found in parquet file")
+    return json.loads(key_value_metadata[b"geo"])
+
+
+def intersects_bbox(bounds: Sequence[float], bbox: Sequence[float]) -> bool:
+    return (
+        bounds[0] <= bbox[2]
+        and bounds[2] >= bbox[0]
+        and bounds[1] <= bbox[3]
+        and bounds[3] >= bbox[1]
+    )
+
+
+def _coordinate_dimensions(storage_type: pa.DataType) -> str:
+    """Dimensions of a native GeoArrow storage type, from its coordinate fields"""
+    while not pa.types.is_struct(storage_type):
+        storage_type = storage_type.value_type
+    return "".join(storage_type.field(i).name for i in range(storage_type.num_fields))
+
+
+def to_geoarrow(column: Union[pa.Array, pa.ChunkedArray], encoding: str) -> pa.Array:
+    """Wrap a WKB or native geometry column as a geoarrow extension array
+
+    This doesn't copy or parse the geometries, so that they can be processed by the
+    geoarrow compute functions.
+    """
+    storage = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    if isinstance(storage, pa.ExtensionArray):
+        storage = storage.storage
+
+    if encoding == "WKB":
+        geoarrow_type = (
+            ga.large_wkb() if pa.types.is_large_binary(storage.type) else ga.wkb()
+        )
+    else:
+        geoarrow_type = (
+            NATIVE_TYPES[encoding]()
+            .with_coord_type(ga.CoordType.SEPARATED)
+            .with_dimensions(DIMENSIONS[_coordinate_dimensions(storage.type)])
+        )
+    return geoarrow_type.wrap_array(storage)
+
+
+def to_shapely(column: pa.ChunkedArray, encoding: str) -> NDArray[np.object_]:
+    """Decode a WKB or native GeoArrow geometry column to shapely geometries"""
+    if encoding == "WKB":
+        return shapely.from_wkb(column.to_numpy(zero_copy_only=False))
+
+    wkb = ga.as_wkb(to_geoarrow(column, encoding))
+    return shapely.from_wkb(wkb.storage.to_numpy(zero_copy_only=False))
+
+
+def covering_bounds(
+    table: pa.Table, covering: Dict[str, List[str]]
+) -> NDArray[np.float64]:
+    """The (n, 4) bounds of the rows of table, from its bbox covering column"""
+    bounds = []
+    for key in ["xmin", "ymin", "xmax", "ymax"]:
+        column, field = covering[key]
+        values = table.column(column).combine_chunks().field(field)
+        bounds.append(values.to_numpy(zero_copy_only=False))
+    return np.column_stack(bounds).astype(np.float64)
+
+
+def filter_bbox(
+    table: pa.Table, column: str, column_metadata: Dict[str, Any], bbox: Sequence[float]
+) -> NDArray[np.bool_]:
+    """Mask of the rows whose geometry intersects bbox
+
+    Rows are first filtered by their bounds (from the covering column if there is
+    one, which avoids decoding geometries that are clearly outside the box), and the
+    remaining candidates are then tested exactly.
+    """
+    covering = column_metadata.get("covering", {}).get("bbox")
+    encoding = column_metadata.get("encoding", "WKB")
+
+    if covering is not None:
+        bounds = covering_bounds(table, covering)
+        candidates = np.flatnonzero(
+            (bounds[:, 0] <= bbox[2])
+            & (bounds[:, 2] >= bbox[0])
+            & (bounds[:, 1] <= bbox[3])
+            & (bounds[:, 3] >= bbox[1])
+        )
+        geometries = to_shapely(table.column(column).take(candidates), encoding)
+    else:
+        candidates = np.arange(len(table))
+        geometries = to_shapely(table.column(column), encoding)
+
+    query = shapely.box(*bbox)
+    shapely.prepare(query)
+    mask = np.zeros(len(table), dtype=bool)
+    mask[candidates] = shapely.intersects(query, geometries)
+    return mask
+
+
+def columns_compressed_size(
+    row_group: pq.RowGroupMetaData, columns: Optional[List[str]]
+) -> int:
+    """Compressed size of the chunks of these top-level columns in a row group"""
+    size = 0
+    for i in range(row_group.num_columns):
+        chunk = row_group.column(i)
+        if columns is None or chunk.path_in_schema.split(".")[0] in columns:
+            size += chunk.total_compressed_size
+    return size
+
+
+def prune_row_groups(
+    metadata: pq.FileMetaData,
+    bbox: Sequence[float],
+    column: Optional[str] = None,
+) -> List[int]:
+    """Indices of the row groups that may contain geometries intersecting bbox
+
+    Row groups without usable statistics are always kept.
+    """
+    geo_metadata = get_geo_metadata(metadata)
+    column = column or geo_metadata["primary_column"]
+    column_metadata = geo_metadata["columns"][column]
+
+    file_bbox = column_metadata.get("bbox")
+    if file_bbox is not None and len(file_bbox) == 4:
+        if not intersects_bbox(file_bbox, bbox):
+            return []
+
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        bounds, _ = row_group_bounds(metadata, i, column, column_metadata)
+        if bounds is None or intersects_bbox(bounds, bbox):
+            row_groups.append(i)
+    return row_groups
+
+
+def read_geoparquet(
+    path: Path,
+    bbox: Optional[Sequence[float]] = None,
+    columns: Optional[List[str]] = None,
+    column: Optional[str] = None,
+    memory_map: bool = False,
+) -> Tuple[pa.Table, ReadStatistics]:
+    """Read a GeoParquet file, keeping only the rows that intersect bbox
+
+    Parameters
+    ----------
+    path : Path
+    bbox : sequence of float, optional
+        (xmin, ymin, xmax, ymax) in the CRS of the geometry column. If not given, the
+        whole file is read.
+    columns : list of str, optional
+        Columns to read. Defaults to all columns.
+    column : str, optional
+        Geometry column to filter on. Defaults to the primary column.
+    memory_map : bool
+        If True, memory-map the file and use the shared metadata cache.
+
+    Returns
+    -------
+    The filtered table and statistics on how much of the file was skipped.
+    """
+    if memory_map:
+        index = load_index(path)
+        metadata = index.metadata
+        parquet_file = pq.ParquetFile(path, memory_map=True, metadata=metadata)
+    else:
+        parquet_file = pq.ParquetFile(path)
+        metadata = parquet_file.metadata
+    geo_metadata = get_geo_metadata(metadata)
+    column = column or geo_metadata["primary_column"]
+    column_metadata = geo_metadata["columns"][column]
+
+    if bbox is None:
+        row_groups = list(range(metadata.num_row_groups))
+    elif memory_map:
+        row_groups = index.prune(bbox, column)
+    else:
+        row_groups = prune_row_groups(metadata, bbox, column)
+
+    # The geometry and covering columns are needed for filtering even when they
+    # aren't requested
+    read_columns = columns
+    if columns is not None and bbox is not None:
+        covering = column_metadata.get("covering", {}).get("bbox", {})
+        extra = {column} | {path[0] for path in covering.values()}
+        read_columns = columns + sorted(extra - set(columns))
+
+    # Bytes read and skipped are counted over the same columns
+    statistics = ReadStatistics(row_groups=metadata.num_row_groups)
+    for i in range(metadata.num_row_groups):
+        statistics.bytes += columns_compressed_size(metadata.row_group(i), read_columns)
+
+    table = parquet_file.read_row_groups(row_groups, columns=read_columns)
+    statistics.row_groups_read = len(row_groups)
+    statistics.bytes_read = sum(
+        columns_compressed_size(metadata.row_group(i), read_columns) for i in row_groups
+    )
+    statistics.rows_read = len(table)
+
+    if bbox is not None and len(table):
+        table = table.filter(filter_bbox(table, column, column_metadata, bbox))
+    if read_columns is not columns:
+        table = table.select(columns)
+
+    statistics.rows_matched = len(table)
+    return table, statistics
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--bbox",
+    type=float,
+    nargs=4,
+    default=None,
+    help="Bounding box to filter on: xmin ymin xmax ymax.",
+)
+@click.option(
+    "--column",
+    type=str,
+    default=None,
+    help="Geometry column to filter on. Defaults to the primary column.",
+)
+@click.option(
+    "--memory-map",
+    is_flag=True,
+    help="Memory-map the file and use the shared metadata cache.",
+)
+def main(
+    path: Path,
+    bbox: Optional[Tuple[float, ...]],
+    column: Optional[str],
+    memory_map: bool,
+):
+    """Read PATH filtered by bbox and report how much of the file was skipped"""
+    table, statistics = read_geoparquet(
+        path, bbox=bbox, column=column, memory_map=memory_map
+    )
+    print(statistics, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
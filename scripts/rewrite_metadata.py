@@ -0,0 +1,302 @@
+"""
+Update the geo metadata of GeoParquet files without rewriting their data.
+
+The key-value metadata of a Parquet file lives in its footer, after all the column
+chunks, and the column chunks are located by absolute file offsets that don't depend on
+the footer. So the metadata can be changed by re-serializing only the footer: the bytes
+before it are copied as they are to a new file, in the kernel where possible. With
+`--in-place`, the new file is written next to the original and then replaces it, so the
+file is valid at every moment even if the update is interrupted.
+
+The footer is Thrift compact-encoded. Only the top-level fields of its FileMetaData are
+decoded, and all fields other than the key-value metadata are copied verbatim, so
+schemas, statistics and page indexes are preserved exactly. Besides the `geo` key,
+pyarrow stores the schema metadata in the serialized Arrow schema (`ARROW:schema`),
+which takes precedence when the file is read with pyarrow, so it is updated as well.
+"""
+
+import base64
+import json
+import os
+import shutil
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import click
+import geoarrow.pyarrow as ga
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from check_geoparquet import geometry_type_names
+from geoparquet_names import covering_column_name
+from inspect_metadata import PARQUET_MAGIC, read_footer_bytes
+from read_geoparquet import get_geo_metadata, to_geoarrow
+from schema_registry import get_schema, get_validator
+from thrift_compact import (
+    BINARY,
+    LIST,
+    STOP,
+    STRUCT,
+    iter_fields,
+    list_items,
+    read_varint,
+    write_binary,
+    write_field_header,
+    write_list_header,
+    write_struct,
+)
+from wkb_scan import wkb_statistics
+
+# Field id of key_value_metadata in the Parquet FileMetaData struct
+KEY_VALUE_METADATA = 5
+
+COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+KeyValueMetadata = Dict[bytes, Optional[bytes]]
+
+
+def decode_key_value_metadata(buf: bytes) -> KeyValueMetadata:
+    """Decode a Thrift list<KeyValue>"""
+    metadata = {}
+    for pos, _ in list_items(buf, 0):
+        key = value = None
+        for field_id, _, start, _ in iter_fields(buf, pos):
+            length, start = read_varint(buf, start)
+            if field_id == 1:
+                key = buf[start : start + length]
+            elif field_id == 2:
+                value = buf[start : start + length]
+        metadata[key] = value
+    return metadata
+
+
+def encode_key_value_metadata(metadata: KeyValueMetadata) -> bytes:
+    """Encode a Thrift list<KeyValue>"""
+    out = bytearray(write_list_header(STRUCT, len(metadata)))
+    for key, value in metadata.items():
+        out += write_field_header(1, 0, BINARY) + write_binary(key)
+        if value is not None:
+            out += write_field_header(2, 1, BINARY) + write_binary(value)
+        out.append(STOP)
+    return bytes(out)
+
+
+def replace_key_value_metadata(
+    footer: bytes, update: Callable[[KeyValueMetadata], KeyValueMetadata]
+) -> bytes:
+    """Re-serialize a FileMetaData with its key-value metadata replaced
+
+    Only the top-level field headers are re-encoded, as the field ids are delta
+    encoded. All other field values are copied verbatim.
+    """
+    fields = []
+    metadata: KeyValueMetadata = {}
+    for field_id, field_type, start, end in iter_fields(footer, 0):
+        if field_id == KEY_VALUE_METADATA:
+            metadata = decode_key_value_metadata(footer[start:end])
+        else:
+            fields.append((field_id, field_type, footer[start:end]))
+
+    fields.append(
+        (KEY_VALUE_METADATA, LIST, encode_key_value_metadata(update(metadata)))
+    )
+    return write_struct(fields)
+
+
+def _update_arrow_schema(encoded: bytes, geo: bytes) -> bytes:
+    """Set the geo metadata of a base64-encoded serialized Arrow schema"""
+    schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(encoded)))
+    schema = schema.with_metadata({**(schema.metadata or {}), b"geo": geo})
+    return base64.b64encode(schema.serialize().to_pybytes())
+
+
+def _copy_range(src, dst, length: int) -> None:
+    """Copy the first length bytes of src to dst, in the kernel if possible"""
+    offset = 0
+    try:
+        while offset < length:
+            copied = os.copy_file_range(
+                src.fileno(), dst.fileno(), length - offset, offset, offset
+            )
+            if copied == 0:
+                break
+            offset += copied
+        return
+    except (AttributeError, OSError):
+        pass
+
+    src.seek(offset)
+    dst.seek(offset)
+    while offset < length:
+        chunk = src.read(min(COPY_CHUNK_SIZE, length - offset))
+        if not chunk:
+            raise ValueError("Unexpected end of file")
+        dst.write(chunk)
+        offset += len(chunk)
+
+
+def _write_file(path: Path, output: Path, data_length: int, new_tail: bytes) -> None:
+    """Write the data pages of path followed by a new footer to output"""
+    with open(path, "rb") as src, open(output, "wb") as dst:
+        _copy_range(src, dst, data_length)
+        dst.seek(data_length)
+        dst.write(new_tail)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+
+def rewrite_geo_metadata(
+    path: Path, geo_metadata: Dict[str, Any], output: Optional[Path] = None
+) -> None:
+    """Replace the geo metadata of a GeoParquet file, rewriting only its footer
+
+    Parameters
+    ----------
+    path : Path
+    geo_metadata : dict
+        The new geo metadata.
+    output : Path, optional
+        The file to write. The data pages of path are copied to it byte for byte. If
+        not given, path is updated in place: the updated file is written to a
+        temporary file next to it, which then atomically replaces it.
+    """
+    geo = json.dumps(geo_metadata).encode()
+
+    def update(metadata: KeyValueMetadata) -> KeyValueMetadata:
+        metadata = dict(metadata)
+        metadata[b"geo"] = geo
+        if metadata.get(b"ARROW:schema") is not None:
+            metadata[b"ARROW:schema"] = _update_arrow_schema(
+                metadata[b"ARROW:schema"], geo
+            )
+        return metadata
+
+    tail = read_footer_bytes(path)
+    footer = replace_key_value_metadata(tail[:-8], update)
+    new_tail = footer + struct.pack("<i", len(footer)) + PARQUET_MAGIC
+    data_length = path.stat().st_size - len(tail)
+
+    if output is not None:
+        _write_file(path, output, data_length, new_tail)
+        return
+
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        _write_file(path, tmp, data_length, new_tail)
+        shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def column_statistics(
+    path: Path, column: str, encoding: str
+) -> Tuple[List[str], List[float]]:
+    """The geometry types and bbox of a geometry column, from its data
+
+    Only the geometry column is read, one batch at a time. WKB is scanned without
+    parsing the geometries.
+    """
+    types = set()
+    bounds = np.array([np.inf, np.inf, -np.inf, -np.inf])
+    for batch in pq.ParquetFile(path).iter_batches(columns=[column]):
+        if encoding == "WKB":
+            batch_types, batch_bounds = wkb_statistics(batch.column(0))
+        else:
+            array = to_geoarrow(batch.column(0), encoding)
+            batch_types = geometry_type_names(array)
+            box = ga.box_agg(array).as_py()
+            batch_bounds = [box["xmin"], box["ymin"], box["xmax"], box["ymax"]]
+        types |= set(batch_types)
+        bounds[:2] = np.fmin(bounds[:2], batch_bounds[:2])
+        bounds[2:] = np.fmax(bounds[2:], batch_bounds[2:])
+    return sorted(types), bounds.tolist()
+
+
+def add_covering(geo_metadata: Dict[str, Any], schema: pa.Schema) -> None:
+    """Declare the bbox covering columns found in schema"""
+    for col, column_metadata in geo_metadata["columns"].items():
+        name = covering_column_name(geo_metadata["primary_column"], col)
+        if name not in schema.names:
+            continue
+        field_type = schema.field(name).type
+        keys = ["xmin", "ymin", "xmax", "ymax"]
+        if pa.types.is_struct(field_type) and all(
+            field_type.get_field_index(key) >= 0 for key in keys
+        ):
+            column_metadata["covering"] = {"bbox": {key: [name, key] for key in keys}}
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the updated file to this path.",
+)
+@click.option(
+    "--in-place",
+    is_flag=True,
+    help="Update PATH in place, replacing it once the updated file is written.",
+)
+@click.option(
+    "--upgrade",
+    is_flag=True,
+    help="Set the version to that of format-specs/schema.json.",
+)
+@click.option(
+    "--recompute",
+    is_flag=True,
+    help="Recompute the bbox and geometry_types of each geometry column from its data.",
+)
+@click.option(
+    "--covering",
+    is_flag=True,
+    help="Declare existing bbox struct columns as the covering of their geometry.",
+)
+def main(
+    path: Path,
+    output: Optional[Path],
+    in_place: bool,
+    upgrade: bool,
+    recompute: bool,
+    covering: bool,
+):
+    """Update the geo metadata of the GeoParquet file PATH without rewriting its data"""
+    if (output is None) == (not in_place):
+        raise click.UsageError("Exactly one of --output and --in-place is required")
+    if output is not None and output.exists() and output.samefile(path):
+        raise click.UsageError("Use --in-place to update a file in place")
+
+    metadata = pq.read_metadata(path)
+    geo_metadata = get_geo_metadata(metadata)
+
+    if upgrade:
+        geo_metadata["version"] = get_schema()["properties"]["version"]["const"]
+    if recompute:
+        for col, column_metadata in geo_metadata["columns"].items():
+            encoding = column_metadata.get("encoding", "WKB")
+            types, bbox = column_statistics(path, col, encoding)
+            column_metadata["geometry_types"] = types
+            if np.isfinite(bbox).all():
+                column_metadata["bbox"] = bbox
+            else:
+                # There are no non-empty geometries
+                column_metadata.pop("bbox", None)
+    if covering:
+        add_covering(geo_metadata, metadata.schema.to_arrow_schema())
+
+    for error in get_validator().iter_errors(geo_metadata):
+        print(f"Warning: {error.json_path}: {error.message}", file=sys.stderr)
+
+    rewrite_geo_metadata(path, geo_metadata, output)
+    print(f"Updated the geo metadata of {output or path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
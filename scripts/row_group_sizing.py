@@ -0,0 +1,145 @@
+"""
+Size Parquet row groups by a byte budget rather than a row count.
+
+The number of rows that fit in a row group depends heavily on the geometries, so a fixed
+row count gives row groups of very different sizes between datasets. Instead, the
+encoded size of a row (WKB plus attributes, as laid out in Arrow memory) is estimated
+from the tables seen so far and row groups are closed once they reach the byte target.
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# The distributing guide recommends row groups of 128-256 MB for remote access
+DEFAULT_ROW_GROUP_BYTES = 128 * 1024 * 1024
+
+_BYTE_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 1024,
+    "MB": 1024**2,
+    "GB": 1024**3,
+}
+
+
+def parse_byte_size(value: str) -> int:
+    """Parse a human readable byte size like "128MB" into a number of bytes"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*", value.upper())
+    if match is None:
+        raise ValueError(f"Invalid byte size {value!r}, expected e.g. 128MB")
+    number, unit = match.groups()
+    return int(float(number) * _BYTE_UNITS[unit])
+
+
+def rows_per_row_group(
+    bytes_per_row: float, row_group_bytes: int, max_rows: Optional[int] = None
+) -> int:
+    """Number of rows that fit in a row group of row_group_bytes"""
+    n_rows = max(1, int(row_group_bytes // max(bytes_per_row, 1.0)))
+    if max_rows is not None:
+        n_rows = min(n_rows, max_rows)
+    return n_rows
+
+
+class ByteBudgetWriter:
+    """A ParquetWriter that closes row groups at a byte target
+
+    Incoming tables are buffered until the estimated size of the buffered rows
+    reaches `row_group_bytes` (or `max_rows` rows), and the buffer is then written as
+    a single row group. The estimate of the size of a row is the running average
+    over all tables written so far, so it adapts as the data changes.
+
+    Other keyword arguments are passed on to `pq.ParquetWriter`.
+    """
+
+    def __init__(
+        self,
+        where: Union[str, Path],
+        schema: pa.Schema,
+        row_group_bytes: int = DEFAULT_ROW_GROUP_BYTES,
+        max_rows: Optional[int] = None,
+        **kwargs,
+    ):
+        self.row_group_bytes = row_group_bytes
+        self.max_rows = max_rows
+        self._writer = pq.ParquetWriter(where, schema, **kwargs)
+        self._buffer: List[pa.Table] = []
+        self._buffered_rows = 0
+        self._sampled_bytes = 0
+        self._sampled_rows = 0
+
+    @property
+    def schema(self) -> pa.Schema:
+        return self._writer.schema
+
+    @property
+    def bytes_per_row(self) -> float:
+        if self._sampled_rows == 0:
+            return 0.0
+        return self._sampled_bytes / self._sampled_rows
+
+    def _rows_per_row_group(self) -> int:
+        return rows_per_row_group(
+            self.bytes_per_row, self.row_group_bytes, self.max_rows
+        )
+
+    def write_table(self, table: pa.Table) -> None:
+        self._sampled_bytes += table.nbytes
+        self._sampled_rows += len(table)
+        self._buffer.append(table)
+        self._buffered_rows += len(table)
+
+        n_rows = self._rows_per_row_group()
+        if self._buffered_rows >= n_rows:
+            buffered = pa.concat_tables(self._buffer)
+            offset = 0
+            while len(buffered) - offset >= n_rows:
+                row_group = buffered.slice(offset, n_rows)
+                self._writer.write_table(row_group, row_group_size=n_rows)
+                offset += n_rows
+
+            remainder = buffered.slice(offset)
+            self._buffer = [remainder] if len(remainder) else []
+            self._buffered_rows = len(remainder)
+
+    def flush(self) -> None:
+        """Write any buffered rows as a final, smaller row group"""
+        if self._buffered_rows:
+            buffered = pa.concat_tables(self._buffer)
+            self._writer.write_table(buffered, row_group_size=len(buffered))
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def add_key_value_metadata(self, key_value_metadata: Dict) -> None:
+        self._writer.add_key_value_metadata(key_value_metadata)
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_table(
+    table: pa.Table,
+    where: Union[str, Path],
+    row_group_bytes: int = DEFAULT_ROW_GROUP_BYTES,
+    max_rows: Optional[int] = None,
+    **kwargs,
+) -> None:
+    """Write a table with row groups sized by a byte target
+
+    This is a drop-in replacement for `pq.write_table`. Other keyword arguments are
+    passed on to `pq.write_table`.
+    """
+    bytes_per_row = table.nbytes / len(table) if len(table) else 0.0
+    row_group_size = rows_per_row_group(bytes_per_row, row_group_bytes, max_rows)
+    pq.write_table(table, where, row_group_size=row_group_size, **kwargs)
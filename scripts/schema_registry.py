@@ -0,0 +1,134 @@
+"""
+Offline resolution of the JSON schemas referenced by `format-specs/schema.json`.
+
+The GeoParquet schema references the PROJJSON schema by URI. Rather than fetching it
+over the network every time the schema is used, schemas are resolved in this order:
+
+1. the in-process cache,
+2. the on-disk cache, keyed by a hash of the URI and checked against the hash of the
+   content it was stored with,
+3. the copies bundled in the `schemas` directory,
+4. the network, after which the schema is written to the on-disk cache.
+
+Schema URIs are versioned (e.g. `.../v0.7/projjson.schema.json`), so a cached copy
+never goes stale. The compiled validator is also built once per process.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import urllib.request
+from typing import Any, Dict, Optional
+
+from jsonschema.validators import Draft7Validator
+from referencing import Registry, Resource
+from referencing.exceptions import NoSuchResource
+
+HERE = pathlib.Path(__file__).parent
+SCHEMA_SRC = HERE / ".." / "format-specs" / "schema.json"
+
+PROJJSON_URI = "https://proj.org/schemas/v0.7/projjson.schema.json"
+
+# Copies of referenced schemas that ship with the scripts, for offline use
+BUNDLED_SCHEMAS = {
+    PROJJSON_URI: HERE / "schemas" / "projjson-v0.7.schema.json",
+}
+
+
+def cache_dir() -> pathlib.Path:
+    """Directory of the on-disk schema cache
+
+    This is $GEOPARQUET_SCHEMA_CACHE if set, and otherwise a directory in the user's
+    cache directory.
+    """
+    if "GEOPARQUET_SCHEMA_CACHE" in os.environ:
+        return pathlib.Path(os.environ["GEOPARQUET_SCHEMA_CACHE"])
+    base = os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")
+    return pathlib.Path(base) / "geoparquet-scripts" / "schemas"
+
+
+def _cache_path(uri: str) -> pathlib.Path:
+    return cache_dir() / f"{hashlib.sha256(uri.encode()).hexdigest()}.json"
+
+
+def _read_cache(uri: str) -> Optional[Dict[str, Any]]:
+    """Read a schema from the on-disk cache, ignoring missing or corrupt entries"""
+    try:
+        entry = json.loads(_cache_path(uri).read_text())
+    except (OSError, ValueError):
+        return None
+
+    content = entry.get("content", "")
+    if entry.get("uri") != uri or (
+        hashlib.sha256(content.encode()).hexdigest() != entry.get("sha256")
+    ):
+        return None
+    return json.loads(content)
+
+
+def _write_cache(uri: str, content: str) -> None:
+    """Atomically write a schema to the on-disk cache; failures are not fatal"""
+    path = _cache_path(uri)
+    entry = {
+        "uri": uri,
+        "sha256": hashlib.sha256(content.encode()).hexdigest(),
+        "content": content,
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(entry))
+        tmp_path.replace(path)
+    except OSError:
+        pass
+
+
+def fetch_remote_schema(uri: str) -> dict:
+    """Fetch a remote schema and return its contents."""
+    req = urllib.request.Request(uri, headers={"User-Agent": "geoparquet-tests"})
+    with urllib.request.urlopen(req) as response:
+        return json.load(response)
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema(uri: str) -> Dict[str, Any]:
+    """Resolve a schema by URI, going to the network only as a last resort"""
+    schema = _read_cache(uri)
+    if schema is not None:
+        return schema
+
+    if uri in BUNDLED_SCHEMAS:
+        return json.loads(BUNDLED_SCHEMAS[uri].read_text())
+
+    schema = fetch_remote_schema(uri)
+    _write_cache(uri, json.dumps(schema))
+    return schema
+
+
+def _retrieve(uri: str) -> Resource:
+    try:
+        return Resource.from_contents(load_schema(uri))
+    except OSError as e:
+        raise NoSuchResource(ref=uri) from e
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema() -> Dict[str, Any]:
+    """The GeoParquet metadata schema from format-specs/schema.json"""
+    return json.loads(SCHEMA_SRC.read_text())
+
+
+@functools.lru_cache(maxsize=None)
+def get_registry() -> Registry:
+    """A registry with the PROJJSON schema, resolving any other URI lazily"""
+    return Registry(retrieve=_retrieve).with_resources(
+        [(PROJJSON_URI, Resource.from_contents(load_schema(PROJJSON_URI)))]
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator() -> Draft7Validator:
+    """A validator for GeoParquet metadata, compiled once per process"""
+    return Draft7Validator(get_schema(), registry=get_registry())
@@ -0,0 +1,362 @@
+"""
+Filter or join the rows of a GeoParquet file with a set of query geometries.
+
+An STRtree is built once over the query geometries. Row groups whose bounds, from the
+Parquet geospatial statistics or the bbox covering column statistics, don't intersect
+the envelope of any query geometry are skipped without being read. The remaining row
+groups are read in batches on a thread pool: rows whose covering bbox doesn't intersect
+any query envelope are dropped before their geometries are decoded, and the predicate is
+evaluated exactly for the pairs of geometries and query geometries whose envelopes
+intersect. Matching rows are streamed out as Arrow record batches, in file order.
+"""
+
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import click
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from numpy.typing import NDArray
+
+from inspect_metadata import row_group_bounds
+from read_geoparquet import (
+    ReadStatistics,
+    columns_compressed_size,
+    covering_bounds,
+    get_geo_metadata,
+    intersects_bbox,
+    to_shapely,
+)
+
+# predicate(geometry, query) is evaluated as the converse predicate(query, geometry),
+# so that the prepared query geometries are used
+PREDICATES = {
+    "intersects": shapely.intersects,
+    "contains": shapely.within,
+    "within": shapely.contains,
+}
+QUERY_INDEX_COLUMN = "query_index"
+BATCH_SIZE = 65_536
+
+
+class SpatialFilter:
+    """Match geometries against a set of query geometries with a predicate
+
+    The predicate is evaluated as `predicate(geometry, query)`: with "within", a
+    geometry matches if it is within a query geometry.
+    """
+
+    def __init__(
+        self, queries: Sequence[shapely.Geometry], predicate: str = "intersects"
+    ):
+        if predicate not in PREDICATES:
+            raise ValueError(f"Unsupported predicate: {predicate}")
+        self.predicate = predicate
+        self.queries = np.asarray(queries, dtype=object)
+        # The tree is built on creation, so that it can be queried from many threads
+        self.tree = shapely.STRtree(self.queries)
+        shapely.prepare(self.queries)
+
+    def intersecting_bounds(self, bounds: NDArray[np.float64]) -> NDArray[np.intp]:
+        """Indices of the rows of (xmin, ymin, xmax, ymax) bounds that intersect the
+        envelope of a query geometry"""
+        boxes = shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+        return np.unique(self.tree.query(boxes)[0])
+
+    def match(
+        self, geometries: NDArray[np.object_]
+    ) -> Tuple[NDArray[np.intp], NDArray[np.intp]]:
+        """Indices of the geometries and query geometries of the matching pairs,
+        ordered by geometry"""
+        geometry_index, query_index = self.tree.query(geometries)
+        mask = PREDICATES[self.predicate](
+            self.queries[query_index], geometries[geometry_index]
+        )
+        return geometry_index[mask], query_index[mask]
+
+
+def candidate_row_groups(
+    metadata: pq.FileMetaData, spatial_filter: SpatialFilter, column: str
+) -> List[int]:
+    """Indices of the row groups that may contain matching geometries
+
+    Row groups without usable statistics are always kept.
+    """
+    column_metadata = get_geo_metadata(metadata)["columns"][column]
+    file_bbox = column_metadata.get("bbox")
+    if file_bbox is not None and len(file_bbox) == 4 and len(spatial_filter.queries):
+        if not intersects_bbox(file_bbox, shapely.total_bounds(spatial_filter.queries)):
+            return []
+
+    row_groups, known, bounds = [], [], []
+    for i in range(metadata.num_row_groups):
+        rg_bounds, _ = row_group_bounds(metadata, i, column, column_metadata)
+        if rg_bounds is None:
+            row_groups.append(i)
+        else:
+            known.append(i)
+            bounds.append(rg_bounds)
+    if known:
+        hits = spatial_filter.intersecting_bounds(np.array(bounds, dtype=np.float64))
+        row_groups.extend(np.array(known)[hits].tolist())
+    return sorted(row_groups)
+
+
+def output_schema(schema: pa.Schema, columns: List[str], join: bool) -> pa.Schema:
+    """Schema of the selected columns, followed by the query index when joining"""
+    fields = [schema.field(name) for name in columns]
+    if join:
+        fields.append(pa.field(QUERY_INDEX_COLUMN, pa.int64(), nullable=False))
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def filter_batch(
+    batch: pa.RecordBatch,
+    spatial_filter: SpatialFilter,
+    column: str,
+    column_metadata: Dict[str, Any],
+    schema: pa.Schema,
+) -> pa.RecordBatch:
+    """The rows of batch that match, with the columns of schema
+
+    If schema has a query index column, each row is repeated for every query geometry
+    it matches, otherwise each matching row is kept once.
+    """
+    table = pa.Table.from_batches([batch])
+    covering = column_metadata.get("covering", {}).get("bbox")
+    encoding = column_metadata.get("encoding", "WKB")
+
+    if covering is not None:
+        bounds = covering_bounds(table, covering)
+        candidates = spatial_filter.intersecting_bounds(bounds)
+        geometries = to_shapely(table.column(column).take(candidates), encoding)
+    else:
+        candidates = np.arange(len(table))
+        geometries = to_shapely(table.column(column), encoding)
+
+    geometry_index, query_index = spatial_filter.match(geometries)
+    join = QUERY_INDEX_COLUMN in schema.names
+    rows = candidates[geometry_index] if join else np.unique(candidates[geometry_index])
+
+    table = table.take(rows)
+    names = schema.names[:-1] if join else schema.names
+    arrays = [table.column(name).combine_chunks() for name in names]
+    if join:
+        arrays.append(pa.array(query_index, type=pa.int64()))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _filter_row_group(
+    path: Path,
+    metadata: pq.FileMetaData,
+    row_group: int,
+    read_columns: List[str],
+    batch_size: int,
+    spatial_filter: SpatialFilter,
+    column: str,
+    schema: pa.Schema,
+) -> Tuple[List[pa.RecordBatch], int]:
+    """The matching batches of a row group, and the number of rows read"""
+    # Each task opens its own reader, reusing the parsed footer
+    parquet_file = pq.ParquetFile(path, metadata=metadata)
+    column_metadata = get_geo_metadata(metadata)["columns"][column]
+    batches = []
+    rows_read = 0
+    for batch in parquet_file.iter_batches(
+        batch_size, row_groups=[row_group], columns=read_columns
+    ):
+        rows_read += batch.num_rows
+        matched = filter_batch(batch, spatial_filter, column, column_metadata, schema)
+        if matched.num_rows:
+            batches.append(matched)
+    return batches, rows_read
+
+
+def filter_geoparquet(
+    path: Path,
+    queries: Sequence[shapely.Geometry],
+    predicate: str = "intersects",
+    columns: Optional[List[str]] = None,
+    column: Optional[str] = None,
+    join: bool = False,
+    workers: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Tuple[Iterator[pa.RecordBatch], ReadStatistics]:
+    """Stream the rows of a GeoParquet file that match any of the query geometries
+
+    Parameters
+    ----------
+    path : Path
+    queries : sequence of shapely geometries
+        In the CRS of the geometry column.
+    predicate : str
+        "intersects", "contains" or "within", evaluated as `predicate(row, query)`.
+    columns : list of str, optional
+        Columns to return. Defaults to all columns.
+    column : str, optional
+        Geometry column to filter on. Defaults to the primary column.
+    join : bool
+        If True, return each row once for every query geometry it matches, with the
+        index of the query geometry in a "query_index" column.
+    workers : int, optional
+        Number of row groups filtered concurrently.
+    batch_size : int
+        Number of rows decoded at a time.
+
+    Returns
+    -------
+    An iterator of the matching record batches, and statistics on how much of the file
+    was skipped, which are complete once the iterator is exhausted.
+    """
+    spatial_filter = SpatialFilter(queries, predicate)
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    geo_metadata = get_geo_metadata(metadata)
+    column = column or geo_metadata["primary_column"]
+    covering = geo_metadata["columns"][column].get("covering", {}).get("bbox", {})
+
+    columns = columns if columns is not None else parquet_file.schema_arrow.names
+    schema = output_schema(parquet_file.schema_arrow, columns, join)
+    # The geometry and covering columns are needed for filtering even when they
+    # aren't requested
+    extra = {column} | {field_path[0] for field_path in covering.values()}
+    read_columns = columns + sorted(extra - set(columns))
+
+    # Bytes read and skipped are counted over the same columns
+    statistics = ReadStatistics(row_groups=metadata.num_row_groups)
+    for i in range(metadata.num_row_groups):
+        statistics.bytes += columns_compressed_size(metadata.row_group(i), read_columns)
+    row_groups = candidate_row_groups(metadata, spatial_filter, column)
+    statistics.row_groups_read = len(row_groups)
+    statistics.bytes_read = sum(
+        columns_compressed_size(metadata.row_group(i), read_columns) for i in row_groups
+    )
+
+    def iter_batches() -> Iterator[pa.RecordBatch]:
+        n_workers = workers or os.cpu_count() or 1
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+        # Only a few row groups ahead of the consumer are filtered, so that memory
+        # use doesn't grow with the size of the file
+        prefetch = 2 * n_workers
+        remaining = iter(row_groups)
+        pending: Deque[Future] = deque()
+        try:
+            while True:
+                while len(pending) < prefetch:
+                    row_group = next(remaining, None)
+                    if row_group is None:
+                        break
+                    pending.append(
+                        executor.submit(
+                            _filter_row_group,
+                            path,
+                            metadata,
+                            row_group,
+                            read_columns,
+                            batch_size,
+                            spatial_filter,
+                            column,
+                            schema,
+                        )
+                    )
+                if not pending:
+                    break
+                batches, rows_read = pending.popleft().result()
+                statistics.rows_read += rows_read
+                for batch in batches:
+                    statistics.rows_matched += batch.num_rows
+                    yield batch
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    return iter_batches(), statistics
+
+
+def read_queries(path: Path, crs: Optional[Any]) -> List[shapely.Geometry]:
+    """Read query geometries from a GeoParquet file or any file GDAL can read,
+    reprojected to crs if both are known"""
+    if path.suffix == ".parquet":
+        df = gpd.read_parquet(path)
+    else:
+        df = gpd.read_file(path)
+    if crs is not None and df.crs is not None:
+        df = df.to_crs(crs)
+    return list(df.geometry.values)
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument("queries", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--predicate",
+    type=click.Choice(list(PREDICATES)),
+    default="intersects",
+    show_default=True,
+    help="Predicate that rows must satisfy with a query geometry.",
+)
+@click.option(
+    "--column",
+    type=str,
+    default=None,
+    help="Geometry column to filter on. Defaults to the primary column.",
+)
+@click.option(
+    "--join",
+    is_flag=True,
+    help="Output each row once per matching query geometry, with its index.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the matching rows to this Parquet file.",
+)
+@click.option("--workers", type=int, default=None, help="Number of threads.")
+@click.option("--batch-size", type=int, default=BATCH_SIZE, show_default=True)
+def main(
+    path: Path,
+    queries: Path,
+    predicate: str,
+    column: Optional[str],
+    join: bool,
+    output: Optional[Path],
+    workers: Optional[int],
+    batch_size: int,
+):
+    """Filter the rows of PATH by the geometries of QUERIES"""
+    geo_metadata = get_geo_metadata(pq.read_metadata(path))
+    column = column or geo_metadata["primary_column"]
+    # A missing crs means OGC:CRS84, while a null crs is unknown
+    crs = geo_metadata["columns"][column].get("crs", "OGC:CRS84")
+
+    batches, statistics = filter_geoparquet(
+        path,
+        read_queries(queries, crs),
+        predicate=predicate,
+        column=column,
+        join=join,
+        workers=workers,
+        batch_size=batch_size,
+    )
+    if output is None:
+        for _ in batches:
+            pass
+    else:
+        schema = pq.read_schema(path)
+        schema = output_schema(schema, schema.names, join)
+        with pq.ParquetWriter(output, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    print(statistics, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,759 @@
+"""
+Build and query a sidecar spatial index of a GeoParquet file, as a packed Hilbert
+R-tree.
+
+GeoParquet has no spatial index: readers skip the row groups whose statistics don't
+intersect their query, and then read the row groups that remain in full. This module
+indexes the bounding box of every feature in a file next to it, in the layout of
+FlatGeobuf's index. Features are sorted by the Hilbert index of the centres of their
+bounding boxes and packed into nodes of `node_size` entries. Nodes are then packed level
+by level up to a single root. The tree is a flat array of (xmin, ymin, xmax, ymax,
+offset) nodes, root level first, which is memory-mapped and searched one level at a
+time with NumPy. The offset of a leaf is the row number of its feature in the file, and
+the offset of an internal node is the position of its first child.
+
+The matching rows are mapped to their row groups. For columns with an offset index
+(files written with `write_page_index=True`), only the pages that contain them are
+read: the offset index gives the byte range and first row of every page. The selected
+pages and the dictionary page of their column chunk are decoded by pyarrow as the column
+chunk of a minimal in-memory Parquet file, whose footer is written with the Thrift
+helpers of `thrift_compact`. Columns without an offset index are read in full for the
+row groups with matching rows, as are columns with several leaf columns, like native
+GeoArrow geometries.
+
+The index records the size of the file and a hash of its footer. It is rejected if the
+file has changed since.
+"""
+
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
+from numpy.typing import NDArray
+
+from inspect_metadata import PARQUET_MAGIC, read_footer_bytes
+from outdb import coalesce_ranges
+from read_geoparquet import (
+    ReadStatistics,
+    columns_compressed_size,
+    covering_bounds,
+    filter_bbox,
+    get_geo_metadata,
+    to_shapely,
+)
+from spatial_sort import CURVE_ORDER, hilbert_index, to_grid
+from thrift_compact import (
+    I32,
+    I64,
+    LIST,
+    STRUCT,
+    iter_fields,
+    list_items,
+    read_int,
+    read_varint,
+    skip,
+    write_int,
+    write_list,
+    write_struct,
+)
+from wkb_scan import scan_wkb
+
+INDEX_MAGIC = b"GPQRTREE"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".rtree"
+NODE_SIZE = 16
+# Pages less than this many bytes apart are read together
+MAX_GAP = 4096
+NODE_DTYPE = np.dtype(
+    [
+        ("xmin", "<f8"),
+        ("ymin", "<f8"),
+        ("xmax", "<f8"),
+        ("ymax", "<f8"),
+        ("offset", "<u8"),
+    ]
+)
+
+# Parquet page types
+DATA_PAGE = 0
+DATA_PAGE_V2 = 3
+# Parquet encodings of dictionary-encoded data pages
+DICTIONARY_ENCODINGS = (2, 8)
+# Parquet repetition type of repeated fields
+REPEATED = 2
+
+ThriftFields = Dict[int, Tuple[int, int, int]]
+
+
+def index_path_for(path: Path) -> Path:
+    """Default location of the index of a file"""
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def _footer_hash(footer: bytes) -> str:
+    return hashlib.sha256(footer).hexdigest()
+
+
+def _ranges(starts: NDArray[np.int64], ends: NDArray[np.int64]) -> NDArray[np.int64]:
+    """Concatenation of the ranges [start, end)"""
+    lengths = ends - starts
+    if not len(lengths):
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return shifts + np.arange(lengths.sum())
+
+
+class SpatialIndex:
+    """A packed Hilbert R-tree of the bounding boxes of the rows of a file
+
+    `level_bounds` holds the [start, end) of each level of the tree in `nodes`, root
+    level first.
+    """
+
+    def __init__(
+        self,
+        nodes: NDArray,
+        level_bounds: List[Tuple[int, int]],
+        node_size: int,
+        header: Dict[str, Any],
+    ):
+        self.nodes = nodes
+        self.level_bounds = level_bounds
+        self.node_size = node_size
+        self.header = header
+
+    @property
+    def num_items(self) -> int:
+        if not self.level_bounds:
+            return 0
+        start, end = self.level_bounds[-1]
+        return end - start
+
+    @classmethod
+    def pack(
+        cls,
+        bounds: NDArray[np.float64],
+        node_size: int = NODE_SIZE,
+        header: Optional[Dict[str, Any]] = None,
+    ) -> "SpatialIndex":
+        """Pack the (xmin, ymin, xmax, ymax) bounds of rows into a tree
+
+        Rows with NaN bounds, like null or empty geometries, are left out.
+        """
+        if node_size < 2:
+            raise ValueError("node_size must be at least 2")
+        rows = np.flatnonzero(~np.isnan(bounds).any(axis=1))
+        bounds = bounds[rows]
+
+        sizes = [len(rows)] if len(rows) else []
+        while sizes and sizes[-1] > 1:
+            sizes.append(math.ceil(sizes[-1] / node_size))
+        sizes.reverse()
+        starts = np.concatenate([[0], np.cumsum(sizes)]).astype(int).tolist()
+        level_bounds = list(zip(starts[:-1], starts[1:]))
+        nodes = np.empty(starts[-1], dtype=NODE_DTYPE)
+
+        if len(rows):
+            x = (bounds[:, 0] + bounds[:, 2]) / 2
+            y = (bounds[:, 1] + bounds[:, 3]) / 2
+            extent = [*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)]
+            keys = hilbert_index(*to_grid(x, y, extent, CURVE_ORDER))
+            order = np.argsort(keys, kind="stable")
+            leaves = nodes[level_bounds[-1][0] :]
+            for i, name in enumerate(["xmin", "ymin", "xmax", "ymax"]):
+                leaves[name] = bounds[order, i]
+            leaves["offset"] = rows[order]
+
+        for level in range(len(level_bounds) - 2, -1, -1):
+            child_start, child_end = level_bounds[level + 1]
+            children = nodes[child_start:child_end]
+            groups = np.arange(0, len(children), node_size)
+            parents = nodes[level_bounds[level][0] : level_bounds[level][1]]
+            for name in ["xmin", "ymin"]:
+                parents[name] = np.minimum.reduceat(children[name], groups)
+            for name in ["xmax", "ymax"]:
+                parents[name] = np.maximum.reduceat(children[name], groups)
+            parents["offset"] = child_start + groups
+
+        return cls(nodes, level_bounds, node_size, dict(header or {}))
+
+    def search(self, bbox: Sequence[float]) -> NDArray[np.int64]:
+        """Sorted row numbers of the rows whose bounds intersect bbox"""
+        xmin, ymin, xmax, ymax = bbox
+        if not self.level_bounds:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.arange(*self.level_bounds[0])
+        last = len(self.level_bounds) - 1
+        for level in range(len(self.level_bounds)):
+            nodes = self.nodes[candidates]
+            hit = (
+                (nodes["xmin"] <= xmax)
+                & (nodes["xmax"] >= xmin)
+                & (nodes["ymin"] <= ymax)
+                & (nodes["ymax"] >= ymin)
+            )
+            offsets = nodes["offset"][hit].astype(np.int64)
+            if level == last:
+                return np.sort(offsets)
+            ends = np.minimum(offsets + self.node_size, self.level_bounds[level + 1][1])
+            candidates = _ranges(offsets, ends)
+        raise AssertionError("unreachable")
+
+    def write(self, path: Path) -> None:
+        header = json.dumps(
+            {
+                **self.header,
+                "version": INDEX_VERSION,
+                "node_size": self.node_size,
+                "level_bounds": self.level_bounds,
+            }
+        ).encode()
+        padding = b"\0" * (-len(header) % 8)
+        with open(path, "wb") as f:
+            f.write(INDEX_MAGIC + struct.pack("<Q", len(header)) + header + padding)
+            f.write(self.nodes.tobytes())
+
+    @classmethod
+    def open(cls, path: Path) -> "SpatialIndex":
+        """Memory-map an index file"""
+        with open(path, "rb") as f:
+            prefix = f.read(16)
+        if len(prefix) < 16 or prefix[:8] != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a GeoParquet spatial index")
+        (header_length,) = struct.unpack("<Q", prefix[8:])
+        with open(path, "rb") as f:
+            f.seek(16)
+            header = json.loads(f.read(header_length))
+        version = header.pop("version")
+        if version != INDEX_VERSION:
+            raise ValueError(f"Unsupported spatial index version {version}")
+
+        level_bounds = [tuple(bounds) for bounds in header.pop("level_bounds")]
+        offset = 16 + header_length + (-header_length % 8)
+        n_nodes = level_bounds[-1][1] if level_bounds else 0
+        if n_nodes:
+            nodes = np.memmap(path, NODE_DTYPE, "r", offset=offset, shape=(n_nodes,))
+        else:
+            nodes = np.empty(0, dtype=NODE_DTYPE)
+        return cls(nodes, level_bounds, header.pop("node_size"), header)
+
+    def check(self, path: Path, footer: bytes) -> None:
+        """Raise if the index wasn't built from this version of the file"""
+        if self.header.get("file_size") != os.path.getsize(path) or self.header.get(
+            "footer_sha256"
+        ) != _footer_hash(footer):
+            raise ValueError(f"The spatial index of {path} is out of date")
+
+
+def feature_bounds(
+    table: pa.Table, column: str, column_metadata: Dict[str, Any]
+) -> NDArray[np.float64]:
+    """(xmin, ymin, xmax, ymax) of each row, NaN for null and empty geometries"""
+    covering = column_metadata.get("covering", {}).get("bbox")
+    if covering is not None:
+        return covering_bounds(table, covering)
+    encoding = column_metadata.get("encoding", "WKB")
+    if encoding == "WKB":
+        return scan_wkb(table.column(column))[1]
+    return shapely.bounds(to_shapely(table.column(column), encoding))
+
+
+def build_index(
+    path: Path,
+    column: Optional[str] = None,
+    node_size: int = NODE_SIZE,
+    index_path: Optional[Path] = None,
+) -> Path:
+    """Index the bounding boxes of a geometry column of a file, one row group at a time
+
+    The bounds come from the bbox covering column if there is one, and from the
+    geometries otherwise. Returns the path of the index, by default next to the file.
+    """
+    footer = read_footer_bytes(path)
+    metadata = pq.read_metadata(pa.BufferReader(PARQUET_MAGIC + footer))
+    geo_metadata = get_geo_metadata(metadata)
+    column = column or geo_metadata["primary_column"]
+    column_metadata = geo_metadata["columns"][column]
+    covering = column_metadata.get("covering", {}).get("bbox")
+    read_columns = sorted(
+        {field[0] for field in covering.values()} if covering else {column}
+    )
+
+    parquet_file = pq.ParquetFile(path, metadata=metadata)
+    bounds = [np.empty((0, 4))]
+    for i in range(metadata.num_row_groups):
+        table = parquet_file.read_row_group(i, columns=read_columns)
+        bounds.append(feature_bounds(table, column, column_metadata))
+
+    header = {
+        "column": column,
+        "num_rows": metadata.num_rows,
+        "file_size": os.path.getsize(path),
+        "footer_sha256": _footer_hash(footer),
+    }
+    index = SpatialIndex.pack(np.concatenate(bounds), node_size, header)
+    index_path = index_path or index_path_for(path)
+    index.write(index_path)
+    return index_path
+
+
+def _fields(buf: bytes, pos: int) -> ThriftFields:
+    """Type, value start and value end of each field of the Thrift struct at pos"""
+    return {
+        field_id: (t, start, end) for field_id, t, start, end in iter_fields(buf, pos)
+    }
+
+
+def _copy_fields(
+    buf: bytes, fields: ThriftFields, ids: Sequence[int]
+) -> List[Tuple[int, int, bytes]]:
+    """The encoded values of some fields of a struct, to write them unchanged"""
+    return [
+        (i, fields[i][0], buf[fields[i][1] : fields[i][2]]) for i in ids if i in fields
+    ]
+
+
+class PageReader:
+    """Read rows of a Parquet file, reading only the pages that contain them where the
+    file has an offset index"""
+
+    def __init__(self, path: Path, footer: Optional[bytes] = None):
+        self.path = path
+        self.footer = footer if footer is not None else read_footer_bytes(path)
+        self.metadata = pq.read_metadata(pa.BufferReader(PARQUET_MAGIC + self.footer))
+        self.parquet_file = pq.ParquetFile(path, metadata=self.metadata)
+        self.schema = self.parquet_file.schema_arrow
+        self.bytes_read = 0
+        self._file = open(path, "rb")
+
+        self._file_fields = _fields(self.footer, 0)
+        schema = list_items(self.footer, self._file_fields[2][1])
+        self._schema = [
+            (start, end, _fields(self.footer, start)) for start, end in schema
+        ]
+        self._row_groups = list_items(self.footer, self._file_fields[4][1])
+
+        # Schema elements and leaf columns of each top-level column
+        self._columns: Dict[str, Tuple[int, int, int, int]] = {}
+        element, leaf = 1, 0
+        for _ in range(self._num_children(0)):
+            end = self._subtree_end(element)
+            leaves = sum(5 not in fields for _, _, fields in self._schema[element:end])
+            name = self._element_name(element)
+            self._columns[name] = (element, end, leaf, leaf + leaves)
+            element, leaf = end, leaf + leaves
+
+    def __enter__(self) -> "PageReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _num_children(self, element: int) -> int:
+        fields = self._schema[element][2]
+        return read_int(self.footer, fields[5][1]) if 5 in fields else 0
+
+    def _subtree_end(self, element: int) -> int:
+        end = element + 1
+        for _ in range(self._num_children(element)):
+            end = self._subtree_end(end)
+        return end
+
+    def _element_name(self, element: int) -> str:
+        _, start, _ = self._schema[element][2][4]
+        length, start = read_varint(self.footer, start)
+        return self.footer[start : start + length].decode()
+
+    def _pread(self, offset: int, length: int) -> bytes:
+        self.bytes_read += length
+        return os.pread(self._file.fileno(), length, offset)
+
+    def read_rows(
+        self, rows: NDArray[np.int64], columns: Optional[List[str]] = None
+    ) -> pa.Table:
+        """The given rows, in ascending order, with the given columns"""
+        columns = columns if columns is not None else self.schema.names
+        rows = np.unique(rows)
+        row_group_starts = np.cumsum(
+            [0]
+            + [
+                self.metadata.row_group(i).num_rows
+                for i in range(len(self._row_groups))
+            ]
+        )
+        row_groups = np.searchsorted(row_group_starts, rows, side="right") - 1
+
+        tables = [self.schema.empty_table().select(columns)]
+        for row_group in np.unique(row_groups):
+            local_rows = rows[row_groups == row_group] - row_group_starts[row_group]
+            arrays = [
+                self.read_column(int(row_group), name, local_rows) for name in columns
+            ]
+            tables.append(
+                pa.Table.from_arrays(
+                    arrays, schema=pa.schema([self.schema.field(n) for n in columns])
+                )
+            )
+        return pa.concat_tables(tables)
+
+    def read_column(
+        self, row_group: int, name: str, local_rows: NDArray[np.int64]
+    ) -> pa.Array:
+        """Rows of a column of a row group, by their row numbers in the row group"""
+        array = self._read_pages(row_group, name, local_rows)
+        if array is None:
+            self.bytes_read += columns_compressed_size(
+                self.metadata.row_group(row_group), [name]
+            )
+            table = self.parquet_file.read_row_group(row_group, columns=[name])
+            array = table.column(name).combine_chunks().take(local_rows)
+        return array
+
+    def compressed_size(self, row_group: int, columns: List[str]) -> int:
+        """Bytes of the column chunks of a row group that reading columns may read
+
+        The offset index of a chunk is read before its pages, so it is counted
+        along with them.
+        """
+        size = columns_compressed_size(self.metadata.row_group(row_group), columns)
+        row_group_fields = _fields(self.footer, self._row_groups[row_group][0])
+        chunks = list_items(self.footer, row_group_fields[1][1])
+        for name in columns:
+            _, _, leaf_start, leaf_end = self._columns[name]
+            for chunk_start, _ in chunks[leaf_start:leaf_end]:
+                chunk = _fields(self.footer, chunk_start)
+                if 5 in chunk:
+                    size += read_int(self.footer, chunk[5][1])
+        return size
+
+    def _element(self, element: int, num_children: Optional[int] = None) -> bytes:
+        """Encoded schema element, optionally with another number of children"""
+        start, end, fields = self._schema[element]
+        if num_children is None:
+            return self.footer[start:end]
+        copied = _copy_fields(self.footer, fields, [i for i in fields if i != 5])
+        return write_struct(copied + [(5, I32, write_int(num_children))])
+
+    def _is_repeated(self, element: int) -> bool:
+        fields = self._schema[element][2]
+        return 3 in fields and read_int(self.footer, fields[3][1]) == REPEATED
+
+    def _read_ranges(self, ranges: List[Tuple[int, int]]) -> List[bytes]:
+        """Read (offset, length) ranges, coalescing those that are close together"""
+        parts: List[bytes] = [b""] * len(ranges)
+        for offset, length, members in coalesce_ranges(ranges, max_gap=MAX_GAP):
+            data = self._pread(offset, length)
+            for i in members:
+                start = ranges[i][0] - offset
+                parts[i] = data[start : start + ranges[i][1]]
+        return parts
+
+    def _read_pages(
+        self, row_group: int, name: str, local_rows: NDArray[np.int64]
+    ) -> Optional[pa.Array]:
+        """Read only the pages of a column containing rows, or None if the column
+        has no offset index or isn't a single leaf column or a struct of them, or
+        all its pages are needed"""
+        element_start, element_end, leaf_start, leaf_end = self._columns[name]
+        row_group_fields = _fields(self.footer, self._row_groups[row_group][0])
+        num_rows = read_int(self.footer, row_group_fields[3][1])
+        chunks = list_items(self.footer, row_group_fields[1][1])
+        type_ = self.schema.field(name).type
+
+        if leaf_end - leaf_start == 1:
+            elements = [self._element(i) for i in range(element_start, element_end)]
+            array = self._read_leaf_pages(
+                chunks[leaf_start][0], num_rows, elements, local_rows
+            )
+            return None if array is None else _cast(array, type_)
+
+        # Structs of leaf columns, like bbox covering columns, are read one field at
+        # a time, each as the only field of the struct
+        children = range(element_start + 1, element_end)
+        if len(children) != leaf_end - leaf_start or any(
+            self._is_repeated(i) for i in range(element_start, element_end)
+        ):
+            return None
+        group = self._element(element_start, num_children=1)
+        fields = []
+        for leaf, element in enumerate(children):
+            array = self._read_leaf_pages(
+                chunks[leaf_start + leaf][0],
+                num_rows,
+                [group, self._element(element)],
+                local_rows,
+            )
+            if array is None:
+                return None
+            fields.append(array.field(0))
+        struct_array = pa.StructArray.from_arrays(
+            fields,
+            names=[self._element_name(i) for i in children],
+            mask=pc.invert(array.is_valid()),
+        )
+        return _cast(struct_array, type_)
+
+    def _read_leaf_pages(
+        self,
+        chunk_start: int,
+        num_rows: int,
+        elements: List[bytes],
+        local_rows: NDArray[np.int64],
+    ) -> Optional[pa.Array]:
+        """Rows of a leaf column chunk, read from the pages that contain them, as a
+        top-level column with the schema elements
+
+        Returns None if the chunk has no offset index, or if all its pages are needed
+        and reading it whole is simpler.
+        """
+        chunk = _fields(self.footer, chunk_start)
+        if 4 not in chunk or 5 not in chunk:
+            return None
+        meta = _fields(self.footer, chunk[3][1])
+
+        offset_index = self._pread(
+            read_int(self.footer, chunk[4][1]), read_int(self.footer, chunk[5][1])
+        )
+        locations = []
+        for location_start, _ in list_items(
+            offset_index, _fields(offset_index, 0)[1][1]
+        ):
+            location = _fields(offset_index, location_start)
+            locations.append(
+                [read_int(offset_index, location[i][1]) for i in (1, 2, 3)]
+            )
+        page_offsets, page_sizes, first_rows = np.array(locations, dtype=np.int64).T
+        page_rows = np.diff(np.append(first_rows, num_rows))
+
+        page_of_row = np.searchsorted(first_rows, local_rows, side="right") - 1
+        pages = np.unique(page_of_row)
+        if len(pages) == len(first_rows):
+            return None
+        ranges = [(int(page_offsets[p]), int(page_sizes[p])) for p in pages]
+        parts = self._read_ranges(ranges)
+
+        num_values = uncompressed_size = 0
+        dictionary_encoded = False
+        for part in parts:
+            header = _fields(part, 0)
+            uncompressed_size += skip(part, 0, STRUCT) + read_int(part, header[2][1])
+            page_type = read_int(part, header[1][1])
+            if page_type in (DATA_PAGE, DATA_PAGE_V2):
+                data_page_header = _fields(
+                    part, header[5 if page_type == DATA_PAGE else 8][1]
+                )
+                num_values += read_int(part, data_page_header[1][1])
+                encoding = data_page_header[2 if page_type == DATA_PAGE else 4][1]
+                dictionary_encoded |= read_int(part, encoding) in DICTIONARY_ENCODINGS
+
+        # The dictionary page precedes the first data page, and is only needed if
+        # the selected pages are dictionary-encoded, which they often aren't once
+        # the writer has fallen back to plain encoding
+        dictionary_length = 0
+        dictionary_offset = read_int(
+            self.footer, meta[11][1] if 11 in meta else meta[9][1]
+        )
+        if dictionary_encoded and dictionary_offset < page_offsets[0]:
+            dictionary_length = int(page_offsets[0]) - dictionary_offset
+            (dictionary,) = self._read_ranges([(dictionary_offset, dictionary_length)])
+            header = _fields(dictionary, 0)
+            uncompressed_size += skip(dictionary, 0, STRUCT)
+            uncompressed_size += read_int(dictionary, header[2][1])
+            parts.insert(0, dictionary)
+        chunk_bytes = b"".join(parts)
+
+        # Footer of a file holding only the selected pages of this column
+        meta_fields = _copy_fields(self.footer, meta, [1, 2, 3, 4])
+        meta_fields += [
+            (5, I64, write_int(num_values)),
+            (6, I64, write_int(uncompressed_size)),
+            (7, I64, write_int(len(chunk_bytes))),
+            (9, I64, write_int(len(PARQUET_MAGIC) + dictionary_length)),
+        ]
+        if dictionary_length:
+            meta_fields.append((11, I64, write_int(len(PARQUET_MAGIC))))
+        column_chunk = write_struct(
+            [
+                (2, I64, write_int(len(PARQUET_MAGIC))),
+                (3, STRUCT, write_struct(meta_fields)),
+            ]
+        )
+        selected_rows = int(page_rows[pages].sum())
+        row_group_struct = write_struct(
+            [
+                (1, LIST, write_list(STRUCT, [column_chunk])),
+                (2, I64, write_int(uncompressed_size)),
+                (3, I64, write_int(selected_rows)),
+            ]
+        )
+        elements = [self._element(0, num_children=1)] + elements
+        file_metadata = write_struct(
+            _copy_fields(self.footer, self._file_fields, [1, 6])
+            + [
+                (2, LIST, write_list(STRUCT, elements)),
+                (3, I64, write_int(selected_rows)),
+                (4, LIST, write_list(STRUCT, [row_group_struct])),
+            ]
+        )
+        data = b"".join(
+            [
+                PARQUET_MAGIC,
+                chunk_bytes,
+                file_metadata,
+                struct.pack("<I", len(file_metadata)),
+                PARQUET_MAGIC,
+            ]
+        )
+        array = pq.read_table(pa.BufferReader(data)).column(0).combine_chunks()
+
+        # Position of each row among the rows of the selected pages
+        selected_starts = np.cumsum(page_rows[pages]) - page_rows[pages]
+        positions = (
+            local_rows
+            - first_rows[page_of_row]
+            + selected_starts[np.searchsorted(pages, page_of_row)]
+        )
+        return array.take(positions)
+
+
+def _cast(array: pa.Array, type_: pa.DataType) -> pa.Array:
+    """Restore the Arrow type of a column read without its Arrow schema"""
+    if array.type == type_:
+        return array
+    if isinstance(type_, pa.ExtensionType):
+        return type_.wrap_array(_cast(array, type_.storage_type))
+    return array.cast(type_)
+
+
+def query_index(
+    path: Path,
+    bbox: Sequence[float],
+    columns: Optional[List[str]] = None,
+    index_path: Optional[Path] = None,
+    exact: bool = True,
+) -> Tuple[pa.Table, ReadStatistics]:
+    """Read the rows of a file that intersect bbox, using its spatial index
+
+    Parameters
+    ----------
+    path : Path
+    bbox : sequence of float
+        (xmin, ymin, xmax, ymax) in the CRS of the indexed geometry column.
+    columns : list of str, optional
+        Columns to read. Defaults to all columns.
+    index_path : Path, optional
+        Defaults to the index next to the file.
+    exact : bool
+        If True, test the geometries of the rows whose bounds intersect bbox exactly.
+
+    Returns
+    -------
+    The matching rows, in file order, and statistics on how much of the file was
+    skipped. `bytes_read` counts the bytes actually read from the file, and `bytes`
+    those of the read columns, including their offset indexes.
+    """
+    footer = read_footer_bytes(path)
+    index = SpatialIndex.open(index_path or index_path_for(path))
+    index.check(path, footer)
+    rows = index.search(bbox)
+
+    with PageReader(path, footer) as reader:
+        metadata = reader.metadata
+        column = index.header["column"]
+        column_metadata = get_geo_metadata(metadata)["columns"][column]
+        names = columns if columns is not None else reader.schema.names
+        read_columns = names
+        if exact:
+            covering = column_metadata.get("covering", {}).get("bbox", {})
+            extra = {column} | {field[0] for field in covering.values()}
+            read_columns = names + sorted(extra - set(names))
+
+        table = reader.read_rows(rows, read_columns)
+        statistics = ReadStatistics(row_groups=metadata.num_row_groups)
+        for i in range(metadata.num_row_groups):
+            statistics.bytes += reader.compressed_size(i, read_columns)
+        row_group_starts = np.cumsum(
+            [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        )
+        statistics.row_groups_read = len(
+            np.unique(np.searchsorted(row_group_starts, rows, side="right"))
+        )
+        statistics.bytes_read = reader.bytes_read
+        statistics.rows_read = len(table)
+
+    if exact and len(table):
+        table = table.filter(filter_bbox(table, column, column_metadata, bbox))
+    table = table.select(names)
+    statistics.rows_matched = len(table)
+    return table, statistics
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--column",
+    type=str,
+    default=None,
+    help="Geometry column to index. Defaults to the primary column.",
+)
+@click.option("--node-size", type=int, default=NODE_SIZE, show_default=True)
+@click.option(
+    "--bbox",
+    type=float,
+    nargs=4,
+    default=None,
+    help="Query the existing index with this box instead: xmin ymin xmax ymax.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Path of the index. Defaults to PATH with an added .rtree suffix.",
+)
+def main(
+    path: Path,
+    column: Optional[str],
+    node_size: int,
+    bbox: Optional[Tuple[float, ...]],
+    output: Optional[Path],
+):
+    """Build the spatial index of PATH, or query it with --bbox"""
+    if bbox is not None:
+        _, statistics = query_index(path, bbox, index_path=output)
+        print(statistics, file=sys.stderr)
+        return
+
+    index_path = build_index(path, column, node_size, output)
+    metadata = pq.read_metadata(path)
+    has_offset_index = all(
+        metadata.row_group(i).column(j).has_offset_index
+        for i in range(metadata.num_row_groups)
+        for j in range(metadata.num_columns)
+    )
+    print(f"Wrote {index_path}", file=sys.stderr)
+    if not has_offset_index:
+        print(
+            "The file has no offset index, so queries will read whole column chunks. "
+            "Write it with write_page_index=True to read only the matching pages.",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
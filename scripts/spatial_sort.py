@@ -0,0 +1,251 @@
+"""
+Space-filling curve keys for spatially ordering GeoParquet rows.
+
+Rows are ordered by the position of the centre of each geometry's bounding box along a
+Hilbert or Z-order curve over the data extent, or by the integer value of its geohash.
+Nearby features then end up in the same row groups, which makes the row group
+statistics tight enough for readers to skip most row groups in a spatial query.
+"""
+
+import tempfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from numpy.typing import NDArray
+from pyproj import CRS, Transformer
+
+AVAILABLE_SORTS = ["hilbert", "zorder", "geohash"]
+
+# Name of the temporary column holding the sort key in the external merge sort
+SORT_KEY_COLUMN = "__sort_key"
+
+# Bits per dimension of the curve, so that keys fit in an uint64
+CURVE_ORDER = 16
+
+# Number of rows read from each sorted run at a time while merging
+MERGE_BATCH_SIZE = 10_000
+
+# Key given to missing and empty geometries, which sorts them last
+MISSING_KEY = np.iinfo(np.uint64).max
+
+GEOGRAPHIC_EXTENT = (-180.0, -90.0, 180.0, 90.0)
+
+
+def _part1by1(values: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """Spread the lower 32 bits of each value to the even bit positions"""
+    values = values & np.uint64(0x00000000FFFFFFFF)
+    values = (values | (values << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x3333333333333333)
+    values = (values | (values << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return values
+
+
+def to_grid(
+    x: NDArray[np.float64],
+    y: NDArray[np.float64],
+    extent: Sequence[float],
+    order: int,
+) -> Sequence[NDArray[np.int64]]:
+    """Scale coordinates within extent to integer cells of a 2**order grid"""
+    xmin, ymin, xmax, ymax = extent
+    n_cells = (1 << order) - 1
+    width = (xmax - xmin) or 1.0
+    height = (ymax - ymin) or 1.0
+    grid_x = np.clip((x - xmin) / width * n_cells, 0, n_cells)
+    grid_y = np.clip((y - ymin) / height * n_cells, 0, n_cells)
+    # Missing geometries are given a key separately, so NaNs can go anywhere
+    grid_x = np.nan_to_num(grid_x, nan=0.0)
+    grid_y = np.nan_to_num(grid_y, nan=0.0)
+    return grid_x.astype(np.int64), grid_y.astype(np.int64)
+
+
+def zorder_index(x: NDArray[np.int64], y: NDArray[np.int64]) -> NDArray[np.uint64]:
+    """Z-order (Morton) index of integer grid cells"""
+    return _part1by1(x.astype(np.uint64)) | (
+        _part1by1(y.astype(np.uint64)) << np.uint64(1)
+    )
+
+
+def hilbert_index(
+    x: NDArray[np.int64], y: NDArray[np.int64], order: int = CURVE_ORDER
+) -> NDArray[np.uint64]:
+    """Hilbert curve index of integer grid cells of a 2**order grid
+
+    This is the classic iterative xy2d algorithm, vectorized over all cells.
+    """
+    x = x.astype(np.int64)
+    y = y.astype(np.int64)
+    n_cells = 1 << order
+    index = np.zeros(len(x), dtype=np.uint64)
+
+    s = n_cells // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += np.uint64(s) * np.uint64(s) * ((3 * rx) ^ ry).astype(np.uint64)
+
+        # Rotate the quadrant so that the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, n_cells - 1 - x, x)
+        y = np.where(flip, n_cells - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s //= 2
+
+    return index
+
+
+def bbox_centers(geometries: NDArray[np.object_]) -> Sequence[NDArray[np.float64]]:
+    """Centre of the bounding box of each geometry
+
+    This is much cheaper than a true centroid and is what packed Hilbert R-trees use
+    to order features. Missing and empty geometries have NaN centres.
+    """
+    bounds = shapely.bounds(geometries)
+    x = (bounds[:, 0] + bounds[:, 2]) / 2
+    y = (bounds[:, 1] + bounds[:, 3]) / 2
+    return x, y
+
+
+def sort_key(
+    geometries: NDArray[np.object_],
+    method: str,
+    extent: Optional[Sequence[float]] = None,
+    crs: Optional[CRS] = None,
+) -> NDArray[np.uint64]:
+    """Compute the space-filling curve key of each geometry
+
+    Parameters
+    ----------
+    geometries : array of shapely geometries
+    method : str
+        One of "hilbert", "zorder" or "geohash".
+    extent : sequence of float, optional
+        (xmin, ymin, xmax, ymax) the curve is laid over. Keys are only comparable
+        between batches computed with the same extent, so this must be given when the
+        geometries are a batch of a larger dataset. Defaults to the bounds of the
+        geometries. Ignored for geohash, which always covers the whole globe.
+    crs : pyproj CRS, optional
+        CRS of the geometries. Geohash keys are computed on longitude/latitude, so
+        projected coordinates are transformed to OGC:CRS84 first.
+
+    Returns
+    -------
+    uint64 array
+    """
+    geometries = np.asarray(geometries)
+    x, y = bbox_centers(geometries)
+    missing = np.isnan(x) | np.isnan(y)
+
+    if method == "geohash":
+        if crs is not None and not CRS.from_user_input(crs).is_geographic:
+            transformer = Transformer.from_crs(crs, "OGC:CRS84", always_xy=True)
+            x, y = transformer.transform(x, y)
+        # The geohash bit string interleaves longitude and latitude bits starting
+        # with longitude, so its integer value is a Z-order index with x and y
+        # swapped
+        grid_x, grid_y = to_grid(x, y, GEOGRAPHIC_EXTENT, 2 * CURVE_ORDER)
+        keys = zorder_index(grid_y, grid_x)
+    else:
+        if extent is None:
+            extent = shapely.total_bounds(geometries)
+        grid_x, grid_y = to_grid(x, y, extent, CURVE_ORDER)
+        if method == "hilbert":
+            keys = hilbert_index(grid_x, grid_y)
+        elif method == "zorder":
+            keys = zorder_index(grid_x, grid_y)
+        else:
+            raise ValueError(
+                f"Unknown sort method {method!r}, expected one of {AVAILABLE_SORTS}"
+            )
+
+    keys[missing] = MISSING_KEY
+    return keys
+
+
+def sort_order(
+    geometries: NDArray[np.object_],
+    method: str,
+    extent: Optional[Sequence[float]] = None,
+    crs: Optional[CRS] = None,
+) -> NDArray[np.intp]:
+    """Indices that put the geometries in space-filling curve order"""
+    return np.argsort(sort_key(geometries, method, extent, crs), kind="stable")
+
+
+def _merge_runs(run_paths: List[Path], batch_size: int) -> Iterator[pa.Table]:
+    """Merge sorted runs into a single sorted stream of tables of batch_size rows
+
+    A buffer of rows is kept for each run. All rows with a key up to the smallest
+    "last key" of the buffers are guaranteed to be loaded, so they can be sorted and
+    emitted together, and the exhausted buffer is then refilled from its run. The
+    merged rows are regrouped into tables of exactly batch_size rows, except for the
+    last one, since writers make a row group of each table.
+    """
+    readers = [
+        pq.ParquetFile(path).iter_batches(batch_size=batch_size) for path in run_paths
+    ]
+
+    buffers: List[Optional[pa.Table]] = []
+    for reader in readers:
+        batch = next(reader, None)
+        buffers.append(None if batch is None else pa.Table.from_batches([batch]))
+
+    pending: Optional[pa.Table] = None
+    while any(buffer is not None for buffer in buffers):
+        threshold = min(
+            buffer.column(SORT_KEY_COLUMN)[-1].as_py()
+            for buffer in buffers
+            if buffer is not None
+        )
+
+        parts = []
+        for i, buffer in enumerate(buffers):
+            if buffer is None:
+                continue
+            keys = buffer.column(SORT_KEY_COLUMN).to_numpy()
+            n_take = int(np.searchsorted(keys, threshold, side="right"))
+            parts.append(buffer.slice(0, n_take))
+            buffer = buffer.slice(n_take)
+            if len(buffer) == 0:
+                batch = next(readers[i], None)
+                buffer = None if batch is None else pa.Table.from_batches([batch])
+            buffers[i] = buffer
+
+        merged = pa.concat_tables(parts).sort_by(SORT_KEY_COLUMN)
+        pending = merged if pending is None else pa.concat_tables([pending, merged])
+        while len(pending) >= batch_size:
+            yield pending.slice(0, batch_size).drop_columns([SORT_KEY_COLUMN])
+            pending = pending.slice(batch_size)
+
+    if pending is not None and len(pending):
+        yield pending.drop_columns([SORT_KEY_COLUMN])
+
+
+def external_sort(
+    tables: Iterator[pa.Table],
+    tmpdir: Optional[Path] = None,
+    batch_size: Optional[int] = None,
+) -> Iterator[pa.Table]:
+    """Sort a stream of tables that may not fit in memory
+
+    Each table must carry its sort key in the SORT_KEY_COLUMN column. Tables are
+    sorted individually and spilled to temporary Parquet files ("runs"), which are
+    then k-way merged while reading `batch_size` rows (by default MERGE_BATCH_SIZE) per
+    run at a time, and output in tables of `batch_size` rows. The sort key column is
+    dropped from the output.
+    """
+    batch_size = batch_size or MERGE_BATCH_SIZE
+    with tempfile.TemporaryDirectory(dir=tmpdir) as run_dir:
+        run_paths = []
+        for i, table in enumerate(tables):
+            run_path = Path(run_dir) / f"run-{i:06d}.parquet"
+            pq.write_table(table.sort_by(SORT_KEY_COLUMN), run_path)
+            run_paths.append(run_path)
+
+        yield from _merge_runs(run_paths, batch_size)
@@ -0,0 +1,68 @@
+"""
+Test cases for the data-vs-metadata consistency checker.
+
+Run tests with `pytest test_check_geoparquet.py`
+"""
+
+import json
+
+import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+import shapely
+
+from check_geoparquet import check_file
+from write_nz_building_outline import geopandas_to_arrow
+
+N_FEATURES = 500
+
+
+@pytest.fixture(scope="module")
+def polygons() -> gpd.GeoDataFrame:
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 1000, size=(2, N_FEATURES))
+    geometry = shapely.orient_polygons(shapely.buffer(shapely.points(x, y), 5))
+    return gpd.GeoDataFrame({"id": np.arange(N_FEATURES)}, geometry=geometry)
+
+
+def write(path, df, encoding="WKB", **column_metadata):
+    table = geopandas_to_arrow(df, covering=True, encoding=encoding)
+    geo_metadata = json.loads(table.schema.metadata[b"geo"])
+    geo_metadata["columns"]["geometry"]["geometry_types"] = ["Polygon"]
+    geo_metadata["columns"]["geometry"].update(column_metadata)
+    metadata = {**table.schema.metadata, b"geo": json.dumps(geo_metadata)}
+    pq.write_table(table.replace_schema_metadata(metadata), path, row_group_size=100)
+    return path
+
+
+@pytest.mark.parametrize("encoding", ["WKB", "geoarrow"])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_consistent_file(tmp_path, polygons, encoding, workers):
+    path = write(tmp_path / "ok.parquet", polygons, encoding)
+    assert check_file(path, workers=workers, batch_size=30) == []
+
+
+def test_bbox_not_containing_data(tmp_path, polygons):
+    path = write(tmp_path / "bbox.parquet", polygons, bbox=[0, 0, 500, 500])
+    (problem,) = check_file(path)
+    assert "outside the declared bbox" in problem
+
+
+def test_undeclared_geometry_types(tmp_path, polygons):
+    df = polygons.copy()
+    df.geometry = shapely.force_3d(df.geometry.values, 1.0)
+    path = write(tmp_path / "types.parquet", df, geometry_types=["Polygon"])
+    (problem,) = check_file(path)
+    assert "['Polygon Z'] are not in the declared geometry_types" in problem
+
+
+def test_orientation(tmp_path, polygons):
+    path = write(tmp_path / "ccw.parquet", polygons, orientation="counterclockwise")
+    assert check_file(path) == []
+
+    df = polygons.copy()
+    df.geometry = shapely.reverse(df.geometry.values)
+    path = write(tmp_path / "cw.parquet", df, orientation="counterclockwise")
+    (problem,) = check_file(path)
+    assert problem.startswith(f"geometry: {N_FEATURES} rings")
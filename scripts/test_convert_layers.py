@@ -0,0 +1,117 @@
+"""
+Test cases for the multi-layer, multi-file conversion driver.
+
+Run tests with `pytest test_convert_layers.py`
+"""
+
+import json
+
+import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from click.testing import CliRunner
+
+from convert_layers import MANIFEST_NAME, ConversionOptions, convert_all, main
+from spatial_sort import sort_key
+
+
+def write_geopackage(path, n_features, seed=0):
+    rng = np.random.default_rng(seed)
+    points = shapely.points(rng.uniform(0, 1000, (n_features, 2)))
+    layers = {
+        "points": points,
+        "polygons": shapely.buffer(points, 5, quad_segs=2),
+    }
+    for layer, geometry in layers.items():
+        df = gpd.GeoDataFrame(
+            {"value": rng.random(n_features)}, geometry=geometry, crs="EPSG:3857"
+        )
+        df.to_file(path, layer=layer, driver="GPKG")
+    return path
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    directory = tmp_path / "inputs"
+    directory.mkdir()
+    return [
+        write_geopackage(directory / "a.gpkg", 100, seed=0),
+        write_geopackage(directory / "b.gpkg", 200, seed=1),
+    ]
+
+
+def test_convert_and_resume(tmp_path, inputs):
+    output = tmp_path / "output"
+    entries = list(convert_all(inputs, output, ConversionOptions(), workers=2))
+    assert sorted((e["input"], e["layer"]) for e in entries) == sorted(
+        (str(path.resolve()), layer)
+        for path in inputs
+        for layer in ["points", "polygons"]
+    )
+    assert all(e["status"] == "done" for e in entries)
+    table = pq.read_table(output / "b" / "polygons.parquet")
+    assert len(table) == 200
+    assert json.loads(table.schema.metadata[b"geo"])["primary_column"] == "geometry"
+
+    # Unchanged inputs are skipped, and changed ones converted again
+    assert list(convert_all(inputs, output, ConversionOptions())) == []
+    write_geopackage(inputs[0], 50, seed=2)
+    entries = list(convert_all(inputs, output, ConversionOptions()))
+    assert {(e["layer"], e["rows"]) for e in entries} == {
+        ("points", 50),
+        ("polygons", 50),
+    }
+
+    # As are all layers when the options change
+    entries = list(convert_all(inputs, output, ConversionOptions(covering=True)))
+    assert len(entries) == 4
+    assert "bbox" in pq.read_schema(output / "a" / "points.parquet").names
+
+
+def test_sort_without_stored_extent(tmp_path):
+    # GeoJSONSeq files don't store the extent of their layer
+    directory = tmp_path / "inputs"
+    directory.mkdir()
+    rng = np.random.default_rng(0)
+    df = gpd.GeoDataFrame(
+        {"value": np.arange(500)},
+        geometry=shapely.points(rng.uniform(0, 1000, (500, 2))),
+        crs="EPSG:4326",
+    )
+    df.to_file(directory / "points.geojsonl", driver="GeoJSONSeq")
+
+    output = tmp_path / "output"
+    options = ConversionOptions(batch_size=100, sort="hilbert")
+    entries = list(convert_all([directory / "points.geojsonl"], output, options))
+    assert [e["status"] for e in entries] == ["done"]
+
+    (path,) = output.glob("points/*.parquet")
+    metadata = pq.read_metadata(path)
+    assert [metadata.row_group(i).num_rows for i in range(5)] == [100] * 5
+    result = gpd.read_parquet(path)
+    extent = shapely.total_bounds(df.geometry.values)
+    keys = sort_key(result.geometry.values, "hilbert", extent)
+    assert (np.diff(keys.astype(np.int64)) >= 0).all()
+
+
+def test_failures_are_retried(tmp_path, inputs):
+    broken = inputs[0].parent / "broken.gpkg"
+    broken.write_bytes(b"not a geopackage")
+    output = tmp_path / "output"
+    result = CliRunner().invoke(main, [str(inputs[0].parent), "-o", str(output)])
+    assert result.exit_code == 1
+
+    manifest = json.loads((output / MANIFEST_NAME).read_text())["conversions"]
+    statuses = {(e["input"], e["layer"]): e["status"] for e in manifest.values()}
+    assert statuses[(str(broken.resolve()), "")] == "failed"
+    assert sum(status == "done" for status in statuses.values()) == 4
+
+    write_geopackage(broken, 10)
+    result = CliRunner().invoke(main, [str(inputs[0].parent), "-o", str(output)])
+    assert result.exit_code == 0, result.output
+    manifest = json.loads((output / MANIFEST_NAME).read_text())["conversions"]
+    assert len(manifest) == 6
+    assert all(e["status"] == "done" for e in manifest.values())
+    assert len(pq.read_table(output / "broken" / "points.parquet")) == 10
@@ -9,19 +9,12 @@ import pathlib
 
 import pyarrow.parquet as pq
 import pytest
-from jsonschema.validators import Draft7Validator
-from referencing import Registry, Resource
 
-from test_json_schema import fetch_remote_schema, SCHEMA, PROJJSON_URI
+from schema_registry import get_schema, get_validator
 
 HERE = pathlib.Path(__file__).parent
 EXAMPLE_PARQUET = HERE / ".." / "examples" / "example.parquet"
-
-# Pre-fetch the projjson schema and create a registry with it
-projjson_schema = fetch_remote_schema(PROJJSON_URI)
-REGISTRY = Registry().with_resources(
-    [(PROJJSON_URI, Resource.from_contents(projjson_schema))]
-)
+SCHEMA = get_schema()
 
 
 def get_geo_metadata(parquet_file: pq.ParquetFile) -> dict:
@@ -55,9 +48,7 @@ class TestExampleParquet:
         assert geo_metadata is not None
 
     def test_schema_valid(self, geo_metadata):
-        errors = list(
-            Draft7Validator(SCHEMA, registry=REGISTRY).iter_errors(geo_metadata)
-        )
+        errors = list(get_validator().iter_errors(geo_metadata))
         assert errors == []
 
     def test_has_version(self, geo_metadata):
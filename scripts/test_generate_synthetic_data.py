@@ -0,0 +1,112 @@
+"""
+Test cases for the synthetic GeoParquet generator.
+
+Run tests with `pytest test_generate_synthetic_data.py`
+"""
+
+import json
+
+import geoarrow.pyarrow as ga
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from click.testing import CliRunner
+
+from check_geoparquet import check_file
+from generate_synthetic_data import (
+    GEOMETRY_TYPES,
+    SyntheticSpec,
+    generate_array,
+    main,
+    write_synthetic,
+)
+from read_geoparquet import to_shapely
+from schema_registry import get_validator
+
+N_FEATURES = 2000
+
+
+def read_geometries(path):
+    geo_metadata = json.loads(pq.read_metadata(path).metadata[b"geo"])
+    encoding = geo_metadata["columns"]["geometry"]["encoding"]
+    return to_shapely(pq.read_table(path)["geometry"], encoding), geo_metadata
+
+
+@pytest.mark.parametrize("geometry_type", GEOMETRY_TYPES)
+@pytest.mark.parametrize("encoding", ["WKB", "geoarrow"])
+def test_write_synthetic(tmp_path, geometry_type, encoding):
+    spec = SyntheticSpec(
+        geometry_type=geometry_type,
+        dimensions="xyz",
+        max_holes=3,
+        null_ratio=0.1,
+        empty_ratio=0.1,
+    )
+    path = tmp_path / "synthetic.parquet"
+    geo_metadata = write_synthetic(
+        path, spec, N_FEATURES, row_group_size=300, encoding=encoding, covering=True
+    )
+    assert pq.read_metadata(path).num_row_groups == 7
+    assert check_file(path) == []
+    if encoding == "WKB":
+        assert get_validator().is_valid(geo_metadata)
+
+    geometries, written_metadata = read_geometries(path)
+    assert written_metadata == geo_metadata
+    is_null = shapely.is_missing(geometries)
+    present = geometries[~is_null]
+    assert 0.05 < is_null.mean() < 0.15
+    assert 0.05 < shapely.is_empty(present).mean() < 0.15
+    assert shapely.is_valid(present).all()
+    assert shapely.has_z(present[~shapely.is_empty(present)]).all()
+    column_metadata = geo_metadata["columns"]["geometry"]
+    assert column_metadata["geometry_types"] == [spec.geometry_type_name]
+    assert column_metadata["bbox"] == pytest.approx(shapely.total_bounds(geometries))
+
+
+@pytest.mark.parametrize("geometry_type", ["multilinestring", "multipolygon"])
+def test_complexity(geometry_type):
+    spec = SyntheticSpec(
+        geometry_type=geometry_type,
+        dimensions="xym",
+        min_vertices=5,
+        max_vertices=7,
+        max_holes=2,
+        min_parts=2,
+        max_parts=4,
+    )
+    array, bounds = generate_array(spec, N_FEATURES, np.random.default_rng(0))
+    geometries = shapely.from_wkb(ga.as_wkb(array).storage)
+
+    np.testing.assert_array_equal(bounds, shapely.bounds(geometries))
+    n_parts = shapely.get_num_geometries(geometries)
+    assert set(n_parts) == {2, 3, 4}
+    parts = shapely.get_parts(geometries)
+    if geometry_type == "multipolygon":
+        assert set(shapely.get_num_interior_rings(parts)) == {0, 1, 2}
+        assert shapely.is_ccw(shapely.get_exterior_ring(parts)).all()
+        rings = shapely.get_exterior_ring(parts)
+    else:
+        rings = parts
+    n_vertices = shapely.get_num_coordinates(rings) - shapely.is_closed(rings)
+    assert set(n_vertices) <= {5, 6, 7}
+    assert shapely.is_valid(geometries).all()
+    assert shapely.has_m(geometries).all()
+
+
+def test_cli(tmp_path):
+    path = tmp_path / "synthetic.parquet"
+    args = [str(path), "--n-features", "1000", "--geometry-type", "point"]
+    result = CliRunner().invoke(main, [*args, "--row-group-size", "400", "--covering"])
+    assert result.exit_code == 0, result.output
+
+    table = pq.read_table(path)
+    assert table.column_names == ["id", "geometry", "bbox"]
+    assert table["id"].to_pylist() == list(range(1000))
+    assert pq.read_metadata(path).num_row_groups == 3
+
+    # The same seed generates the same data
+    other = tmp_path / "other.parquet"
+    CliRunner().invoke(main, [str(other), *args[1:], "--row-group-size", "400"])
+    assert pq.read_table(other)["geometry"].equals(table["geometry"])
@@ -0,0 +1,107 @@
+"""
+Test cases for the footer-only GeoParquet metadata inspector.
+
+Run tests with `pytest test_inspect_metadata.py`
+"""
+
+import mmap
+import os
+import pathlib
+import shutil
+import struct
+
+import pyarrow.parquet as pq
+import pytest
+
+import inspect_metadata
+from inspect_metadata import inspect_file, inspect_files, read_footer
+
+HERE = pathlib.Path(__file__).parent
+EXAMPLE_PARQUET = HERE / ".." / "examples" / "example.parquet"
+TEST_DATA = HERE / ".." / "test_data"
+
+
+def test_read_footer_matches_pyarrow():
+    metadata = read_footer(EXAMPLE_PARQUET)
+    expected = pq.read_metadata(EXAMPLE_PARQUET)
+
+    assert metadata.num_rows == expected.num_rows
+    assert metadata.metadata[b"geo"] == expected.metadata[b"geo"]
+    assert metadata.schema.equals(expected.schema)
+
+
+def test_read_footer_without_mmap(monkeypatch):
+    def no_mmap(*args, **kwargs):
+        raise OSError("mmap not supported")
+
+    monkeypatch.setattr(mmap, "mmap", no_mmap)
+    # Force the footer to not fit in the speculative read
+    monkeypatch.setattr(inspect_metadata, "FOOTER_READ_SIZE", 16)
+
+    metadata = read_footer(EXAMPLE_PARQUET)
+    assert (
+        metadata.metadata[b"geo"] == pq.read_metadata(EXAMPLE_PARQUET).metadata[b"geo"]
+    )
+
+
+def test_read_footer_rejects_non_parquet(tmp_path):
+    path = tmp_path / "not.parquet"
+    path.write_bytes(b"this is not a parquet file")
+    with pytest.raises(ValueError, match="not a Parquet file"):
+        read_footer(path)
+
+
+@pytest.mark.parametrize("footer_length", [-1, 2**31 - 1])
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_read_footer_rejects_corrupt_length(
+    tmp_path, monkeypatch, footer_length, use_mmap
+):
+    if not use_mmap:
+
+        def no_mmap(*args, **kwargs):
+            raise OSError("mmap not supported")
+
+        monkeypatch.setattr(mmap, "mmap", no_mmap)
+
+    path = tmp_path / "corrupt.parquet"
+    data = EXAMPLE_PARQUET.read_bytes()
+    path.write_bytes(data[:-8] + struct.pack("<i", footer_length) + b"PAR1")
+    with pytest.raises(ValueError, match="corrupt footer"):
+        read_footer(path)
+
+
+def test_inspect_file_uses_geo_statistics():
+    (record,) = inspect_file(EXAMPLE_PARQUET)
+    geo_stats = pq.ParquetFile(EXAMPLE_PARQUET).metadata.row_group(0).column(5)
+
+    assert record["column"] == "geometry"
+    assert record["encoding"] == "WKB"
+    assert record["geometry_types"] == ["Polygon", "MultiPolygon"]
+    assert record["xmin"] == geo_stats.geo_statistics.xmin
+    assert record["ymax"] == geo_stats.geo_statistics.ymax
+
+
+def test_inspect_files_reuses_cache(tmp_path, monkeypatch):
+    paths = []
+    for path in sorted(TEST_DATA.glob("*.parquet")):
+        paths.append(tmp_path / path.name)
+        shutil.copy(path, paths[-1])
+
+    table = inspect_files(paths, workers=4)
+    assert table.num_rows == len(paths)
+
+    # Only the modified file is read again
+    stat = paths[0].stat()
+    os.utime(paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    read = []
+    monkeypatch.setattr(
+        inspect_metadata,
+        "inspect_file",
+        lambda path: read.append(path) or inspect_file(path),
+    )
+    cached = inspect_files(paths, cache=table)
+
+    assert read == [paths[0]]
+    assert sorted(cached.column("path").to_pylist()) == sorted(
+        table.column("path").to_pylist()
+    )
@@ -0,0 +1,58 @@
+"""
+Test cases for the phase instrumentation.
+
+Run tests with `pytest test_instrumentation.py`
+"""
+
+import time
+
+import numpy as np
+
+from instrumentation import phase, recording
+
+
+def test_nested_phases():
+    with recording() as recorder:
+        for _ in range(2):
+            with phase("outer") as outer:
+                with phase("inner") as inner:
+                    data = np.ones(32 * 1024 * 1024 // 8)
+                    inner.bytes = data.nbytes
+                    del data
+                time.sleep(0.01)
+            outer.rows = 10
+
+    assert [(p.name, p.depth) for p in recorder.phases] == [
+        ("outer", 0),
+        ("inner", 1),
+        ("outer", 0),
+        ("inner", 1),
+    ]
+    totals = recorder.totals()
+    assert list(totals) == ["outer", "outer/inner"]
+    assert totals["outer"]["count"] == 2
+    assert totals["outer"]["rows"] == 20
+    assert totals["outer/inner"]["bytes"] == 2 * 32 * 1024 * 1024
+    assert totals["outer"]["wall_seconds"] >= totals["outer/inner"]["wall_seconds"]
+
+    # The peak of the outer phase includes the memory allocated by the inner one
+    outer, inner = recorder.phases[:2]
+    assert outer.peak_rss_bytes >= inner.peak_rss_bytes
+    if recorder.peak_reset:
+        assert inner.peak_rss_bytes - inner.start_rss_bytes >= 30 * 1024 * 1024
+
+    events = recorder.to_trace_events()["traceEvents"]
+    complete = [e for e in events if e["ph"] == "X"]
+    assert len(complete) == 4
+    assert complete[1]["ts"] >= complete[0]["ts"]
+    assert complete[1]["ts"] + complete[1]["dur"] <= (
+        complete[0]["ts"] + complete[0]["dur"]
+    )
+
+
+def test_not_recording():
+    with phase("anything") as p:
+        p.bytes = 1
+    with recording() as recorder:
+        pass
+    assert recorder.phases == []
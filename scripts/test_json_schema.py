@@ -11,30 +11,13 @@ as .json files to inspect, run `python test_json_schema.py`
 import copy
 import json
 import pathlib
-import urllib.request
 
 import pytest
-from jsonschema.validators import Draft7Validator
-from referencing import Registry, Resource
 
-HERE = pathlib.Path(__file__).parent
-SCHEMA_SRC = HERE / ".." / "format-specs" / "schema.json"
-SCHEMA = json.loads(SCHEMA_SRC.read_text())
-
-
-def fetch_remote_schema(uri: str) -> dict:
-    """Fetch a remote schema and return its contents."""
-    req = urllib.request.Request(uri, headers={"User-Agent": "geoparquet-tests"})
-    with urllib.request.urlopen(req) as response:
-        return json.load(response)
+from schema_registry import get_schema, get_validator
 
-
-# Pre-fetch the projjson schema and create a registry with it
-PROJJSON_URI = "https://proj.org/schemas/v0.7/projjson.schema.json"
-projjson_schema = fetch_remote_schema(PROJJSON_URI)
-REGISTRY = Registry().with_resources(
-    [(PROJJSON_URI, Resource.from_contents(projjson_schema))]
-)
+HERE = pathlib.Path(__file__).parent
+SCHEMA = get_schema()
 
 
 # # Define test cases
@@ -277,7 +260,7 @@ valid_cases["bbox_8_element"] = metadata
 
 @pytest.mark.parametrize("metadata", valid_cases.values(), ids=valid_cases.keys())
 def test_valid_schema(request, metadata):
-    errors = Draft7Validator(SCHEMA, registry=REGISTRY).iter_errors(metadata)
+    errors = get_validator().iter_errors(metadata)
 
     msgs = []
     valid = True
@@ -299,7 +282,7 @@ def test_valid_schema(request, metadata):
 
 @pytest.mark.parametrize("metadata", invalid_cases.values(), ids=invalid_cases.keys())
 def test_invalid_schema(request, metadata):
-    errors = Draft7Validator(SCHEMA, registry=REGISTRY).iter_errors(metadata)
+    errors = get_validator().iter_errors(metadata)
 
     if not len(list(errors)):
         raise AssertionError(
@@ -0,0 +1,149 @@
+"""
+Test cases for the shared GeoParquet metadata cache.
+
+Run tests with `pytest test_metadata_cache.py`
+"""
+
+import os
+import pathlib
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import shapely
+
+import metadata_cache
+from metadata_cache import FileIndex, build_index, cache_dir, clear_cache, load_index
+from read_geoparquet import prune_row_groups, read_geoparquet
+from write_nz_building_outline import geopandas_to_arrow
+
+HERE = pathlib.Path(__file__).parent
+EXAMPLE_PARQUET = HERE / ".." / "examples" / "example.parquet"
+
+N_FEATURES = 1000
+ROW_GROUP_SIZE = 100
+BBOXES = [(100, 100, 150, 150), (0, 0, 1000, 1000), (2000, 2000, 3000, 3000)]
+
+
+@pytest.fixture(autouse=True)
+def shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEOPARQUET_METADATA_CACHE", str(tmp_path / "cache"))
+    clear_cache(shared=False)
+    yield tmp_path / "cache"
+    clear_cache(shared=False)
+
+
+def write_file(path: pathlib.Path, row_group_size: int = ROW_GROUP_SIZE):
+    rng = np.random.default_rng(0)
+    x, y = np.sort(rng.uniform(0, 1000, size=(2, N_FEATURES)))
+    geometry = shapely.buffer(shapely.points(x, y), 5)
+    df = gpd.GeoDataFrame({"id": np.arange(N_FEATURES)}, geometry=geometry)
+    table = geopandas_to_arrow(df, covering=True)
+    pq.write_table(table, path, row_group_size=row_group_size)
+
+
+@pytest.fixture
+def parquet_file(tmp_path):
+    path = tmp_path / "data.parquet"
+    write_file(path)
+    return path
+
+
+def test_cache_dir(shared_cache):
+    assert cache_dir() == shared_cache
+
+
+def test_index_round_trip(parquet_file):
+    index = build_index(parquet_file)
+    copy = FileIndex.from_buffer(index.to_bytes())
+
+    assert copy.geo_metadata == index.geo_metadata
+    assert bytes(copy.footer) == index.footer
+    assert copy.metadata.num_row_groups == N_FEATURES // ROW_GROUP_SIZE
+    np.testing.assert_array_equal(
+        copy.row_group_bounds["geometry"], index.row_group_bounds["geometry"]
+    )
+
+
+@pytest.mark.parametrize("bbox", BBOXES)
+def test_prune_matches_reader(parquet_file, bbox):
+    index = load_index(parquet_file)
+    assert index.prune(bbox) == prune_row_groups(pq.read_metadata(parquet_file), bbox)
+
+
+def test_prune_geo_statistics():
+    # example.parquet has no covering column, only native Parquet geo statistics
+    index = load_index(EXAMPLE_PARQUET)
+    metadata = pq.read_metadata(EXAMPLE_PARQUET)
+    for bbox in [(-10, -80, 10, -70), (-180, -90, 180, 90)]:
+        assert index.prune(bbox) == prune_row_groups(metadata, bbox)
+
+
+def test_shared_between_processes(parquet_file, shared_cache):
+    index = load_index(parquet_file)
+    assert load_index(parquet_file) is index
+    assert len(list(shared_cache.glob("*.idx"))) == 1
+
+    # Another process finds the index in the shared cache, rather than the file
+    clear_cache(shared=False)
+    shared = load_index(parquet_file)
+    assert shared is not index
+    assert isinstance(shared.footer, memoryview)
+    assert shared.prune(BBOXES[0]) == index.prune(BBOXES[0])
+
+
+def test_modified_file_is_reindexed(parquet_file, shared_cache):
+    assert load_index(parquet_file).metadata.num_row_groups == 10
+
+    write_file(parquet_file, row_group_size=500)
+    stat = os.stat(parquet_file)
+    os.utime(parquet_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert load_index(parquet_file).metadata.num_row_groups == 2
+    assert len(list(shared_cache.glob("*.idx"))) == 2
+
+
+def test_corrupt_index_is_rebuilt(parquet_file, shared_cache):
+    load_index(parquet_file)
+    (index_path,) = shared_cache.glob("*.idx")
+    index_path.write_bytes(b"not an index")
+
+    clear_cache(shared=False)
+    assert load_index(parquet_file).metadata.num_row_groups == 10
+    assert FileIndex.from_buffer(index_path.read_bytes()).path == str(
+        parquet_file.resolve()
+    )
+
+
+def test_unshared(parquet_file, shared_cache):
+    load_index(parquet_file, shared=False)
+    assert not shared_cache.exists()
+
+
+def test_memory_cache_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(metadata_cache, "MEMORY_CACHE_SIZE", 2)
+    paths = [tmp_path / f"{i}.parquet" for i in range(3)]
+    for path in paths:
+        write_file(path)
+    indexes = [load_index(path) for path in paths]
+
+    assert load_index(paths[2]) is indexes[2]
+    assert load_index(paths[0]) is not indexes[0]
+
+
+def test_not_geoparquet(tmp_path):
+    path = tmp_path / "plain.parquet"
+    pq.write_table(pa.table({"id": [1]}), path)
+    with pytest.raises(ValueError, match="No 'geo' metadata"):
+        load_index(path)
+
+
+@pytest.mark.parametrize("bbox", BBOXES + [None])
+def test_read_memory_mapped(parquet_file, bbox):
+    expected, expected_statistics = read_geoparquet(parquet_file, bbox=bbox)
+    table, statistics = read_geoparquet(parquet_file, bbox=bbox, memory_map=True)
+
+    assert table.equals(expected)
+    assert statistics == expected_statistics
@@ -0,0 +1,271 @@
+"""
+Test cases for the out-db raster band resolver.
+
+Run tests with `pytest test_outdb.py`
+"""
+
+import struct
+import threading
+import zlib
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from outdb import (
+    BandRequest,
+    LocalBackend,
+    OutDbResolver,
+    coalesce_ranges,
+    read_tiff_layout,
+)
+from raster import GeoTransform, RasterWriter, read_window
+
+TRANSFORM = GeoTransform(ip_x=1000.0, ip_y=2000.0, scale_x=10.0, scale_y=-10.0)
+
+
+def write_tiff(
+    path, pixels, chunk_size=None, rows_per_strip=16, planar=False, deflate=False
+):
+    """Write a (bands, height, width) array as a little-endian GeoTIFF"""
+    bands, height, width = pixels.shape
+    if chunk_size is None:
+        chunk_width, chunk_height = width, rows_per_strip
+    else:
+        chunk_width, chunk_height = chunk_size
+
+    planes = [pixels[[b]] for b in range(bands)] if planar else [pixels]
+    chunks = []
+    for plane in planes:
+        for row in range(0, height, chunk_height):
+            for col in range(0, width, chunk_width):
+                chunk = plane[:, row : row + chunk_height, col : col + chunk_width]
+                if chunk_size is not None:
+                    # Tiles are padded to the full tile size
+                    padded = np.zeros(
+                        (len(plane), chunk_height, chunk_width), plane.dtype
+                    )
+                    padded[:, : chunk.shape[1], : chunk.shape[2]] = chunk
+                    chunk = padded
+                data = (
+                    np.ascontiguousarray(chunk.transpose(1, 2, 0))
+                    .astype("<" + chunk.dtype.str[1:])
+                    .tobytes()
+                )
+                chunks.append(zlib.compress(data) if deflate else data)
+
+    offsets = np.cumsum([8] + [len(c) for c in chunks])[:-1]
+    sample_format = {"u": 1, "i": 2, "f": 3}[pixels.dtype.kind]
+    tags = [
+        (256, 4, [width]),
+        (257, 4, [height]),
+        (258, 3, [pixels.dtype.itemsize * 8] * bands),
+        (259, 3, [8 if deflate else 1]),
+        (277, 3, [bands]),
+        (284, 3, [2 if planar else 1]),
+        (339, 3, [sample_format] * bands),
+        (33550, 12, [TRANSFORM.scale_x, -TRANSFORM.scale_y, 0.0]),
+        (33922, 12, [0.0, 0.0, 0.0, TRANSFORM.ip_x, TRANSFORM.ip_y, 0.0]),
+    ]
+    if chunk_size is None:
+        tags += [
+            (273, 4, offsets.tolist()),
+            (278, 4, [rows_per_strip]),
+            (279, 4, [len(c) for c in chunks]),
+        ]
+    else:
+        tags += [
+            (322, 3, [chunk_width]),
+            (323, 3, [chunk_height]),
+            (324, 4, offsets.tolist()),
+            (325, 4, [len(c) for c in chunks]),
+        ]
+    tags.sort()
+
+    formats = {3: "H", 4: "I", 12: "d"}
+    ifd_offset = 8 + sum(len(c) for c in chunks)
+    values_offset = ifd_offset + 2 + 12 * len(tags) + 4
+    entries, values = [], b""
+    for tag, field_type, value in tags:
+        data = struct.pack(f"<{len(value)}{formats[field_type]}", *value)
+        if len(data) <= 4:
+            entries.append(struct.pack("<HHI4s", tag, field_type, len(value), data))
+        else:
+            offset = values_offset + len(values)
+            entries.append(struct.pack("<HHII", tag, field_type, len(value), offset))
+            values += data
+    with open(path, "wb") as f:
+        f.write(b"II*\0" + struct.pack("<I", ifd_offset))
+        f.write(b"".join(chunks))
+        f.write(struct.pack("<H", len(tags)) + b"".join(entries) + b"\0\0\0\0" + values)
+
+
+@pytest.fixture(scope="module")
+def pixels() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 60000, size=(3, 300, 200)).astype(np.uint16)
+
+
+TIFF_LAYOUTS = {
+    "tiled": dict(chunk_size=(64, 32)),
+    "strips-planar": dict(rows_per_strip=7, planar=True),
+    "tiled-planar-deflate": dict(chunk_size=(32, 32), planar=True, deflate=True),
+}
+
+
+@pytest.fixture(scope="module", params=list(TIFF_LAYOUTS))
+def outdb_file(request, tmp_path_factory, pixels):
+    directory = tmp_path_factory.mktemp("outdb")
+    tiff = directory / "scene.tif"
+    write_tiff(tiff, pixels, **TIFF_LAYOUTS[request.param])
+
+    path = directory / "scene.parquet"
+    with RasterWriter(path, crs="EPSG:2193", row_group_size=10) as writer:
+        writer.write_outdb(
+            tiff.as_uri(),
+            TRANSFORM,
+            200,
+            300,
+            np.uint16,
+            band_numbers=[2, 0],
+            tile_size=(50, 40),
+        )
+    return path
+
+
+def tile_pixels(pixels, tile):
+    col_off = round((tile.transform.ip_x - TRANSFORM.ip_x) / TRANSFORM.scale_x)
+    row_off = round((tile.transform.ip_y - TRANSFORM.ip_y) / TRANSFORM.scale_y)
+    return pixels[:, row_off : row_off + tile.height, col_off : col_off + tile.width]
+
+
+def test_coalesce_ranges():
+    ranges = [(100, 10), (0, 50), (60, 20), (1000, 10), (1015, 5000)]
+    assert coalesce_ranges(ranges, max_gap=10, max_size=1000) == [
+        (0, 80, [1, 2]),
+        (100, 10, [0]),
+        (1000, 10, [3]),
+        (1015, 5000, [4]),
+    ]
+    assert coalesce_ranges(ranges, max_gap=0) == [
+        (0, 50, [1]),
+        (60, 20, [2]),
+        (100, 10, [0]),
+        (1000, 10, [3]),
+        (1015, 5000, [4]),
+    ]
+
+
+def test_tiff_layout(tmp_path, pixels):
+    path = tmp_path / "scene.tif"
+    write_tiff(path, pixels, chunk_size=(64, 32))
+    layout = read_tiff_layout(LocalBackend(), str(path))
+    assert (layout.width, layout.height, layout.samples) == (200, 300, 3)
+    assert (layout.chunks_across, layout.chunks_down) == (4, 10)
+    assert layout.origin == (TRANSFORM.ip_x, TRANSFORM.ip_y)
+    assert layout.scale == (TRANSFORM.scale_x, TRANSFORM.scale_y)
+
+
+def test_read_batches_and_caches(outdb_file, pixels):
+    tiles = list(read_window(outdb_file))
+    assert len(tiles) == 4 * 8
+    assert all(band.is_offline for tile in tiles for band in tile.bands)
+
+    with OutDbResolver(workers=4) as resolver:
+        bands = resolver.read(tiles)
+        for tile, (band_2, band_0) in zip(tiles, bands):
+            expected = tile_pixels(pixels, tile)
+            np.testing.assert_array_equal(band_2, expected[2])
+            np.testing.assert_array_equal(band_0, expected[0])
+
+        statistics = resolver.statistics
+        assert statistics.bands == 64
+        assert statistics.header_reads == 1
+        # Chunks shared by several tiles are only fetched once, and adjacent chunks
+        # are read at once
+        assert statistics.chunks_fetched < statistics.chunks
+        assert statistics.range_reads < 4
+
+        resolver.read(tiles[:5], bands=[1])
+        assert resolver.statistics.range_reads == statistics.range_reads
+        assert resolver.cache.hits > 0
+
+
+def test_window_reads_only_intersecting_chunks(tmp_path, pixels):
+    path = tmp_path / "scene.tif"
+    write_tiff(path, pixels, chunk_size=(32, 32), planar=True)
+    with OutDbResolver(max_gap=0) as resolver:
+        (window,) = resolver.fetch([BandRequest(str(path), 1, 40, 60, 30, 20)])
+        np.testing.assert_array_equal(window, pixels[1, 60:80, 40:70])
+        # 2 by 2 tiles, in 2 rows of adjacent tiles
+        assert resolver.statistics.chunks_fetched == 4
+        assert resolver.statistics.range_reads == 2
+
+
+def test_cache_budget(tmp_path, pixels):
+    path = tmp_path / "scene.tif"
+    write_tiff(path, pixels, chunk_size=(32, 32), planar=True)
+    requests = [BandRequest(str(path), b, 0, 0, 200, 300) for b in range(3)]
+    budget = 10 * 32 * 32 * 2
+    with OutDbResolver(cache_bytes=budget) as resolver:
+        resolver.fetch(requests)
+        assert resolver.cache.nbytes <= budget
+        assert len(resolver.cache._chunks) == 10
+
+        resolver.fetch(requests[2:])
+        assert resolver.cache.hits == 10
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files with support for single range requests, counting requests"""
+
+    protocol_version = "HTTP/1.1"
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        path = self.translate_path(self.path)
+        with open(path, "rb") as f:
+            data = f.read()
+        start, end = self.headers["Range"].removeprefix("bytes=").split("-")
+        body = data[int(start) : int(end) + 1]
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_http_backend(tmp_path, pixels):
+    write_tiff(tmp_path / "scene.tif", pixels, chunk_size=(16, 16))
+    handler = partial(RangeRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/scene.tif"
+        path = tmp_path / "scene.parquet"
+        with RasterWriter(path) as writer:
+            writer.write_outdb(
+                url, TRANSFORM, 200, 300, np.uint16, [0, 1, 2], tile_size=(10, 10)
+            )
+
+        tiles = list(read_window(path))
+        assert len(tiles) == 600
+        with OutDbResolver(workers=8, max_range_size=64 * 1024) as resolver:
+            bands = resolver.read(tiles)
+        for tile, tile_bands in zip(tiles, bands):
+            np.testing.assert_array_equal(
+                np.stack(tile_bands), tile_pixels(pixels, tile)
+            )
+        # 1800 bands in 2 header requests, for the start of the file and its IFD
+        # at the end, and a few coalesced range requests
+        assert RangeRequestHandler.requests == 2 + resolver.statistics.range_reads
+        assert resolver.statistics.range_reads <= 8
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,297 @@
+"""
+Test cases for the Parquet Raster writer and reader.
+
+Run tests with `pytest test_raster.py`
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import shapely
+
+from check_geoparquet import check_file
+from raster import (
+    RASTER_TYPE,
+    Band,
+    GeoTransform,
+    RasterWriter,
+    encode_offline_band,
+    footprints_wkb,
+    pixel_to_world,
+    raster_bounds,
+    raster_footprints,
+    read_window,
+    window_to_pixels,
+    world_to_pixel,
+    write_raster,
+)
+from validate_geoparquet import validate_files
+
+TRANSFORM = GeoTransform(ip_x=1000.0, ip_y=2000.0, scale_x=10.0, scale_y=-10.0)
+
+
+@pytest.fixture(scope="module")
+def pixels() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 1000, size=(3, 300, 200)).astype(np.uint16)
+
+
+@pytest.fixture(scope="module")
+def raster_file(tmp_path_factory, pixels):
+    path = tmp_path_factory.mktemp("raster") / "raster.parquet"
+    write_raster(
+        path,
+        pixels,
+        TRANSFORM,
+        crs="EPSG:2193",
+        nodata=0,
+        tile_size=(64, 64),
+        row_group_size=4,
+    )
+    return path
+
+
+def tile_pixels(pixels, tile):
+    col_off = round((tile.transform.ip_x - TRANSFORM.ip_x) / TRANSFORM.scale_x)
+    row_off = round((tile.transform.ip_y - TRANSFORM.ip_y) / TRANSFORM.scale_y)
+    return pixels[:, row_off : row_off + tile.height, col_off : col_off + tile.width]
+
+
+def test_roundtrip(raster_file, pixels):
+    tiles = list(read_window(raster_file))
+    metadata = pq.read_metadata(raster_file)
+
+    # 4 columns of tiles, the last 8 pixels wide, by 5 rows, the last 44 pixels high
+    assert len(tiles) == metadata.num_rows == 20
+    assert metadata.num_row_groups == 5
+    assert sorted({(tile.width, tile.height) for tile in tiles}) == [
+        (8, 44),
+        (8, 64),
+        (64, 44),
+        (64, 64),
+    ]
+    for tile in tiles:
+        assert tile.crs.startswith("projjson:")
+        assert [band.nodata for band in tile.bands] == [0, 0, 0]
+        decoded = np.stack([band.to_numpy() for band in tile.bands])
+        np.testing.assert_array_equal(decoded, tile_pixels(pixels, tile))
+
+
+def test_footprint_column_is_valid_geoparquet(raster_file):
+    (result,) = validate_files([raster_file])
+    assert result.valid, result.errors
+    assert check_file(raster_file) == []
+
+
+def test_bands_are_views_of_arrow_buffers(raster_file):
+    band = next(read_window(raster_file)).band(0)
+    array = band.to_numpy()
+    assert array.__array_interface__["data"][0] == band.data.address
+    assert not array.flags.writeable
+
+
+@pytest.mark.parametrize(
+    "window", [(1000, 1000, 1500, 1500), (1500, 0, 1510, 10_000), (0, 0, 999, 5000)]
+)
+def test_window_reads_intersecting_tiles(raster_file, pixels, window):
+    tiles = list(read_window(raster_file, window))
+
+    all_tiles = list(read_window(raster_file))
+    query = shapely.box(*window)
+    expected = [t.transform for t in all_tiles if t.footprint.intersects(query)]
+    assert [tile.transform for tile in tiles] == expected
+    for tile in tiles:
+        np.testing.assert_array_equal(
+            tile.band(2).to_numpy(), tile_pixels(pixels, tile)[2]
+        )
+
+
+@pytest.mark.parametrize(
+    "dtype", ["bool", "int8", "uint8", "int16", "int32", "uint32", "float32", "float64"]
+)
+def test_pixel_types_and_gzip(tmp_path, dtype):
+    rng = np.random.default_rng(1)
+    pixels = (rng.random((1, 20, 30)) * 100).astype(dtype)
+    pixels[0, :10, :10] = 0
+    path = tmp_path / "raster.parquet"
+    write_raster(
+        path, pixels, TRANSFORM, nodata=0, tile_size=(10, 10), compress_bands=True
+    )
+
+    tiles = list(read_window(path))
+    assert len(tiles) == 6
+    (band,) = tiles[0].bands
+    assert band.is_gzipped
+    assert band.is_all_nodata
+    assert not tiles[1].band(0).is_all_nodata
+    for tile in tiles:
+        np.testing.assert_array_equal(
+            tile.band(0).to_numpy(), tile_pixels(pixels, tile)[0].astype(band.dtype)
+        )
+
+
+def test_memory_mapped_scenes_with_skew(tmp_path):
+    source = np.lib.format.open_memmap(
+        tmp_path / "scene.npy", mode="w+", dtype=np.float32, shape=(50, 40)
+    )
+    source[:] = np.arange(50 * 40).reshape(50, 40)
+    transform = GeoTransform(0.0, 0.0, 1.0, -1.0, skew_x=0.5, skew_y=0.25)
+
+    path = tmp_path / "raster.parquet"
+    with RasterWriter(path, crs="EPSG:3857", row_group_size=3) as writer:
+        writer.write(source, transform, tile_size=(20, 20))
+        writer.write(source, TRANSFORM, tile_size=(40, 50))
+
+    tiles = list(read_window(path))
+    assert len(tiles) == 7
+    assert tiles[0].footprint.equals(
+        shapely.Polygon([(0, 0), (20, 5), (30, -15), (10, -20)])
+    )
+    assert tiles[3].transform == GeoTransform(30.0, -15.0, 1.0, -1.0, 0.5, 0.25)
+    np.testing.assert_array_equal(tiles[3].band(0).to_numpy(), source[20:40, 20:40])
+    np.testing.assert_array_equal(tiles[6].band(0).to_numpy(), source)
+    assert tiles[6].bands[0].nodata is None
+
+
+def test_offline_band_reference():
+    buffer = pa.py_buffer(
+        encode_offline_band("file:///data/scene.tif", 2, np.uint16, nodata=65535)
+    )
+    band = Band(buffer, 10, 10)
+    assert band.is_offline
+    assert band.nodata == 65535
+    assert band.offline_reference == (2, "file:///data/scene.tif")
+    with pytest.raises(ValueError, match="OutDbResolver"):
+        band.to_numpy()
+
+
+@pytest.fixture(scope="module")
+def rasters() -> pa.StructArray:
+    rng = np.random.default_rng(2)
+    n = 100
+    skewed = rng.random(n) < 0.5
+    return pa.array(
+        [
+            {
+                "crs": None,
+                "ip_x": rng.uniform(-1000, 1000),
+                "ip_y": rng.uniform(-1000, 1000),
+                "scale_x": rng.uniform(0.5, 2),
+                "scale_y": -rng.uniform(0.5, 2),
+                "skew_x": rng.uniform(-0.3, 0.3) if skewed[i] else 0.0,
+                "skew_y": rng.uniform(-0.3, 0.3) if skewed[i] else 0.0,
+                "width": int(rng.integers(1, 50)),
+                "height": int(rng.integers(1, 50)),
+                "bands": [],
+            }
+            for i in range(n)
+        ]
+        + [None],
+        type=RASTER_TYPE,
+    )
+
+
+def test_pixel_to_world_matches_specification(rasters):
+    col = np.array([[0, 3], [1, 2]])
+    row = np.array([[0, 1], [4, 0]])
+    x, y = pixel_to_world(rasters[:2], col, row)
+    for i, raster in enumerate(rasters[:2].to_pylist()):
+        for j in range(2):
+            c, r = col[i, j], row[i, j]
+            assert x[i, j] == pytest.approx(
+                raster["ip_x"]
+                + (c + 0.5) * raster["scale_x"]
+                + (r + 0.5) * raster["skew_x"]
+            )
+            assert y[i, j] == pytest.approx(
+                raster["ip_y"]
+                + (c + 0.5) * raster["skew_y"]
+                + (r + 0.5) * raster["scale_y"]
+            )
+
+
+def test_world_to_pixel_inverts_pixel_to_world(rasters):
+    valid = rasters[:-1]
+    rng = np.random.default_rng(3)
+    width = valid.field("width").to_numpy()[:, None]
+    height = valid.field("height").to_numpy()[:, None]
+    col = (rng.random((len(valid), 10)) * width).astype(np.int64)
+    row = (rng.random((len(valid), 10)) * height).astype(np.int64)
+
+    x, y = pixel_to_world(valid, col, row)
+    # Move the points off the centres, staying within the pixels
+    x += 0.2 * valid.field("scale_x").to_numpy()[:, None]
+    col_back, row_back = world_to_pixel(valid, x, y)
+    np.testing.assert_array_equal(col_back, col)
+    np.testing.assert_array_equal(row_back, row)
+
+
+def test_footprints_and_bounds(rasters):
+    footprints = raster_footprints(rasters)
+    assert footprints[-1] is None
+    for raster, footprint in zip(rasters[:-1].to_pylist(), footprints):
+        transform = GeoTransform(
+            **{name: raster[name] for name in ["ip_x", "ip_y", "scale_x", "scale_y"]},
+            skew_x=raster["skew_x"],
+            skew_y=raster["skew_y"],
+        )
+        x, y = transform.to_world(
+            np.array([0, raster["width"], raster["width"], 0]),
+            np.array([0, 0, raster["height"], raster["height"]]),
+        )
+        assert footprint.equals(shapely.Polygon(np.column_stack([x, y])))
+
+    bounds = raster_bounds(rasters)
+    np.testing.assert_allclose(bounds[:-1], shapely.bounds(footprints[:-1]))
+    assert np.isnan(bounds[-1]).all()
+
+    wkb = footprints_wkb(rasters)
+    assert wkb.to_pylist() == [
+        None if f is None else shapely.to_wkb(f) for f in footprints
+    ]
+
+
+def test_window_to_pixels_matches_brute_force(rasters):
+    window = (-200.3, -150.7, 350.1, 400.9)
+    pixels = window_to_pixels(rasters, window)
+    query = shapely.box(*window)
+    assert pixels[-1].tolist() == [0, 0, 0, 0]
+
+    for raster, (col_off, row_off, width, height) in zip(
+        rasters[:-1].to_pylist(), pixels
+    ):
+        if raster["skew_x"] or raster["skew_y"]:
+            continue
+        transform = GeoTransform(
+            raster["ip_x"], raster["ip_y"], raster["scale_x"], raster["scale_y"]
+        )
+        cols, rows = np.meshgrid(
+            np.arange(raster["width"]), np.arange(raster["height"])
+        )
+        x0, y0 = transform.to_world(cols, rows)
+        x1, y1 = transform.to_world(cols + 1, rows + 1)
+        inside = (
+            shapely.area(shapely.intersection(shapely.box(x0, y0, x1, y1), query)) > 0
+        )
+        if not inside.any():
+            assert width == 0 or height == 0
+            continue
+        rows_inside, cols_inside = np.nonzero(inside)
+        assert (col_off, row_off) == (cols_inside.min(), rows_inside.min())
+        assert (width, height) == (
+            cols_inside.max() + 1 - col_off,
+            rows_inside.max() + 1 - row_off,
+        )
+
+
+def test_non_invertible_transformation():
+    raster = {
+        "crs": None,
+        **dict(ip_x=0.0, ip_y=0.0, scale_x=1.0, scale_y=1.0, skew_x=1.0, skew_y=1.0),
+        "width": 1,
+        "height": 1,
+        "bands": [],
+    }
+    with pytest.raises(ValueError, match="non-invertible"):
+        world_to_pixel(pa.array([raster], type=RASTER_TYPE), [0.0], [0.0])
@@ -0,0 +1,97 @@
+"""
+Test cases for the bbox-filtered GeoParquet reader.
+
+Run tests with `pytest test_read_geoparquet.py`
+"""
+
+import pathlib
+
+import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+import shapely
+
+from read_geoparquet import read_geoparquet
+from spatial_sort import sort_order
+from write_nz_building_outline import geopandas_to_arrow
+
+HERE = pathlib.Path(__file__).parent
+EXAMPLE_PARQUET = HERE / ".." / "examples" / "example.parquet"
+
+N_FEATURES = 2000
+ROW_GROUP_SIZE = 200
+
+
+@pytest.fixture(scope="module")
+def polygons() -> gpd.GeoDataFrame:
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 1000, size=(2, N_FEATURES))
+    geometry = shapely.buffer(shapely.points(x, y), rng.uniform(1, 10, N_FEATURES))
+    df = gpd.GeoDataFrame({"id": np.arange(N_FEATURES)}, geometry=geometry)
+    return df.take(sort_order(df.geometry.values, "hilbert"))
+
+
+@pytest.fixture(scope="module", params=["WKB", "geoarrow"])
+def sorted_file(request, tmp_path_factory, polygons):
+    path = tmp_path_factory.mktemp("read") / f"{request.param}.parquet"
+    table = geopandas_to_arrow(polygons, covering=True, encoding=request.param)
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE)
+    return path
+
+
+@pytest.mark.parametrize(
+    "bbox", [(100, 100, 150, 150), (0, 0, 1000, 1000), (500, 0, 501, 1000)]
+)
+def test_matches_brute_force(sorted_file, polygons, bbox):
+    table, statistics = read_geoparquet(sorted_file, bbox=bbox)
+
+    expected = polygons["id"][polygons.intersects(shapely.box(*bbox))]
+    assert sorted(table.column("id").to_pylist()) == sorted(expected)
+    assert statistics.rows_matched == len(expected)
+    assert statistics.row_groups == N_FEATURES // ROW_GROUP_SIZE
+
+
+def test_skips_row_groups(sorted_file):
+    table, statistics = read_geoparquet(sorted_file, bbox=(100, 100, 150, 150))
+
+    assert statistics.row_groups_read < statistics.row_groups
+    assert statistics.bytes_skipped > 0
+    assert statistics.rows_read == statistics.row_groups_read * ROW_GROUP_SIZE
+
+
+def test_outside_file_bbox_reads_nothing(sorted_file):
+    table, statistics = read_geoparquet(sorted_file, bbox=(2000, 2000, 3000, 3000))
+
+    assert len(table) == 0
+    assert statistics.row_groups_read == 0
+    assert statistics.bytes_read == 0
+
+
+def test_selected_columns(sorted_file):
+    table, _ = read_geoparquet(sorted_file, bbox=(100, 100, 150, 150), columns=["id"])
+    assert table.column_names == ["id"]
+
+
+def test_selected_columns_statistics(sorted_file):
+    # The geometry and covering columns are read too, to filter on
+    _, statistics = read_geoparquet(
+        sorted_file, bbox=(100, 100, 150, 150), columns=["id"]
+    )
+    assert 0 < statistics.bytes_read < statistics.bytes
+
+    _, statistics = read_geoparquet(
+        EXAMPLE_PARQUET, bbox=(-180, -90, 180, 90), columns=["name"]
+    )
+    assert statistics.bytes_read == statistics.bytes
+    assert statistics.bytes_skipped == 0
+
+
+def test_geo_statistics_pruning():
+    # example.parquet has no covering column, only native Parquet geo statistics
+    table, statistics = read_geoparquet(EXAMPLE_PARQUET, bbox=(-10, -80, 10, -70))
+    assert statistics.row_groups_read == 0
+
+    table, statistics = read_geoparquet(EXAMPLE_PARQUET, bbox=(-100, 40, -90, 50))
+    assert statistics.row_groups_read == 1
+    assert table.column("name").to_pylist() == ["Canada", "United States of America"]
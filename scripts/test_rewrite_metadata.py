@@ -0,0 +1,126 @@
+"""
+Test cases for the footer-only geo metadata rewrite.
+
+Run tests with `pytest test_rewrite_metadata.py`
+"""
+
+import json
+import pathlib
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from click.testing import CliRunner
+
+import rewrite_metadata
+from inspect_metadata import read_footer_bytes
+from rewrite_metadata import main, replace_key_value_metadata, rewrite_geo_metadata
+from schema_registry import get_validator
+from write_nz_building_outline import geopandas_to_arrow
+
+HERE = pathlib.Path(__file__).parent
+EXAMPLE_PARQUET = HERE / ".." / "examples" / "example.parquet"
+TEST_DATA = HERE / ".." / "test_data"
+
+
+def data_bytes(path):
+    return path.read_bytes()[: path.stat().st_size - len(read_footer_bytes(path))]
+
+
+def read_geo_metadata(path):
+    """The geo metadata of the footer and of the schema read by pyarrow"""
+    footer = json.loads(pq.read_metadata(path).metadata[b"geo"])
+    schema = json.loads(pq.read_schema(path).metadata[b"geo"])
+    assert footer == schema
+    return footer
+
+
+@pytest.mark.parametrize(
+    "path", [EXAMPLE_PARQUET, *sorted(TEST_DATA.glob("*.parquet"))], ids=str
+)
+def test_unchanged_footer_roundtrips(path):
+    footer = read_footer_bytes(path)[:-8]
+    assert replace_key_value_metadata(footer, lambda metadata: metadata) == footer
+
+
+@pytest.mark.parametrize("in_place", [False, True])
+@pytest.mark.parametrize("store_schema", [False, True])
+def test_rewrite(tmp_path, in_place, store_schema):
+    path = tmp_path / "input.parquet"
+    table = pq.read_table(EXAMPLE_PARQUET)
+    pq.write_table(table, path, row_group_size=2, store_schema=store_schema)
+    geo_metadata = json.loads(table.schema.metadata[b"geo"])
+    geo_metadata["columns"]["geometry"]["bbox"] = [-180, -90, 180, 90]
+
+    output = None if in_place else tmp_path / "output.parquet"
+    expected_data = data_bytes(path)
+    expected_row_groups = pq.read_metadata(path).num_row_groups
+    rewrite_geo_metadata(path, geo_metadata, output)
+
+    output = output or path
+    assert data_bytes(output) == expected_data
+    assert read_geo_metadata(output) == geo_metadata
+    assert pq.read_table(output).equals(table)
+    assert pq.read_metadata(output).num_row_groups == expected_row_groups
+
+
+def test_interrupted_in_place_rewrite(tmp_path, monkeypatch):
+    path = tmp_path / "input.parquet"
+    shutil.copy(EXAMPLE_PARQUET, path)
+    original = path.read_bytes()
+
+    def interrupted_copy(src, dst, length):
+        dst.write(src.read(length // 2))
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(rewrite_metadata, "_copy_range", interrupted_copy)
+    with pytest.raises(KeyboardInterrupt):
+        rewrite_geo_metadata(path, {**read_geo_metadata(path), "version": "2.0.0"})
+
+    assert path.read_bytes() == original
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_many_metadata_keys(tmp_path):
+    path = tmp_path / "input.parquet"
+    table = pq.read_table(EXAMPLE_PARQUET)
+    metadata = {**table.schema.metadata, **{f"key{i}": str(i) for i in range(20)}}
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+    geo_metadata = {**read_geo_metadata(path), "version": "2.0.0"}
+    rewrite_geo_metadata(path, geo_metadata)
+
+    assert read_geo_metadata(path) == geo_metadata
+    assert pq.read_metadata(path).metadata[b"key19"] == b"19"
+
+
+def test_cli(tmp_path):
+    rng = np.random.default_rng(0)
+    geometry = shapely.points(rng.uniform(0, 100, size=(100, 2)))
+    df = gpd.GeoDataFrame({"id": np.arange(100)}, geometry=geometry)
+    table = geopandas_to_arrow(df, covering=True)
+    geo_metadata = json.loads(table.schema.metadata[b"geo"])
+    geo_metadata["version"] = "1.0.0"
+    del geo_metadata["columns"]["geometry"]["covering"]
+    geo_metadata["columns"]["geometry"]["bbox"] = [0, 0, 1, 1]
+    path = tmp_path / "input.parquet"
+    metadata = {**table.schema.metadata, b"geo": json.dumps(geo_metadata)}
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+    output = tmp_path / "output.parquet"
+    args = [str(path), "-o", str(output), "--upgrade", "--recompute", "--covering"]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+
+    geo_metadata = read_geo_metadata(output)
+    assert get_validator().is_valid(geo_metadata)
+    column_metadata = geo_metadata["columns"]["geometry"]
+    assert column_metadata["geometry_types"] == ["Point"]
+    assert column_metadata["bbox"] == list(shapely.total_bounds(geometry))
+    assert column_metadata["covering"]["bbox"]["xmin"] == ["bbox", "xmin"]
+
+    result = CliRunner().invoke(main, [str(path)])
+    assert result.exit_code != 0
@@ -0,0 +1,70 @@
+"""
+Test cases for the offline schema registry.
+
+Run tests with `pytest test_schema_registry.py`
+"""
+
+import json
+
+import pytest
+
+import schema_registry
+from schema_registry import PROJJSON_URI, get_validator, load_schema
+
+OTHER_URI = "https://example.com/schemas/v1/other.schema.json"
+OTHER_SCHEMA = {"$id": OTHER_URI, "type": "string"}
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    """An empty cache directory and a network that records and serves requests"""
+    monkeypatch.setenv("GEOPARQUET_SCHEMA_CACHE", str(tmp_path))
+    fetched = []
+
+    def fetch(uri):
+        fetched.append(uri)
+        if uri != OTHER_URI:
+            raise OSError("no network")
+        return OTHER_SCHEMA
+
+    monkeypatch.setattr(schema_registry, "fetch_remote_schema", fetch)
+    load_schema.cache_clear()
+    yield fetched
+    load_schema.cache_clear()
+
+
+def test_projjson_is_bundled(offline):
+    schema = load_schema(PROJJSON_URI)
+    assert schema["$id"] == PROJJSON_URI
+    assert offline == []
+
+
+def test_remote_schema_is_cached_on_disk(offline):
+    assert load_schema(OTHER_URI) == OTHER_SCHEMA
+    load_schema.cache_clear()
+    assert load_schema(OTHER_URI) == OTHER_SCHEMA
+    assert offline == [OTHER_URI]
+
+
+def test_corrupt_cache_entry_is_ignored(offline):
+    load_schema(OTHER_URI)
+    path = schema_registry._cache_path(OTHER_URI)
+    entry = json.loads(path.read_text())
+    entry["content"] = json.dumps({"type": "number"})
+    path.write_text(json.dumps(entry))
+
+    load_schema.cache_clear()
+    assert load_schema(OTHER_URI) == OTHER_SCHEMA
+    assert offline == [OTHER_URI, OTHER_URI]
+
+
+def test_validator_is_compiled_once():
+    assert get_validator() is get_validator()
+    crs = {"$schema": PROJJSON_URI, "type": "GeographicCRS"}
+    metadata = {
+        "version": schema_registry.get_schema()["properties"]["version"]["const"],
+        "primary_column": "geometry",
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": [], "crs": crs}},
+    }
+    # The PROJJSON reference is resolved: this CRS is missing required properties
+    assert not get_validator().is_valid(metadata)
@@ -0,0 +1,120 @@
+"""
+Test cases for the STRtree spatial filter of GeoParquet files.
+
+Run tests with `pytest test_spatial_filter.py`
+"""
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import shapely
+
+from spatial_filter import QUERY_INDEX_COLUMN, filter_geoparquet
+from spatial_sort import sort_order
+from write_nz_building_outline import geopandas_to_arrow
+
+N_FEATURES = 2000
+ROW_GROUP_SIZE = 200
+
+
+@pytest.fixture(scope="module")
+def polygons() -> gpd.GeoDataFrame:
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 1000, size=(2, N_FEATURES))
+    geometry = shapely.buffer(shapely.points(x, y), rng.uniform(1, 10, N_FEATURES))
+    geometry[::50] = None
+    df = gpd.GeoDataFrame({"id": np.arange(N_FEATURES)}, geometry=geometry)
+    return df.take(sort_order(df.geometry.values, "hilbert"))
+
+
+@pytest.fixture(scope="module")
+def queries(polygons):
+    return [
+        polygons.geometry.dropna().iloc[10].centroid,
+        shapely.box(100, 100, 180, 150),
+        shapely.Point(120, 120).buffer(40),
+        shapely.Polygon([(600, 600), (700, 620), (640, 700)]),
+    ]
+
+
+@pytest.fixture(
+    scope="module",
+    params=[("WKB", True), ("geoarrow", True), ("WKB", False)],
+    ids=["wkb-covering", "geoarrow-covering", "wkb"],
+)
+def sorted_file(request, tmp_path_factory, polygons):
+    encoding, covering = request.param
+    path = tmp_path_factory.mktemp("filter") / f"{encoding}-{covering}.parquet"
+    table = geopandas_to_arrow(polygons, covering=covering, encoding=encoding)
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE)
+    return path
+
+
+@pytest.mark.parametrize("predicate", ["intersects", "contains", "within"])
+def test_matches_sjoin(sorted_file, polygons, queries, predicate):
+    batches, statistics = filter_geoparquet(
+        sorted_file, queries, predicate, join=True, workers=4, batch_size=64
+    )
+    table = pa.Table.from_batches(list(batches))
+
+    expected = gpd.sjoin(
+        polygons,
+        gpd.GeoDataFrame(geometry=queries),
+        predicate=predicate,
+    )
+    assert len(expected) > 0
+    assert sorted(
+        zip(table.column("id").to_pylist(), table[QUERY_INDEX_COLUMN].to_pylist())
+    ) == sorted(zip(expected["id"], expected["index_right"]))
+    assert statistics.rows_matched == len(expected)
+
+
+def test_filter_keeps_file_order(sorted_file, polygons, queries):
+    batches, statistics = filter_geoparquet(sorted_file, queries, workers=4)
+    table = pa.Table.from_batches(list(batches))
+
+    matched = polygons.intersects(shapely.union_all(queries))
+    assert table.column("id").to_pylist() == polygons["id"][matched].tolist()
+    assert table.schema.metadata[b"geo"] == pq.read_schema(sorted_file).metadata[b"geo"]
+
+
+def test_skips_row_groups_and_streams(sorted_file, queries):
+    if "covering" not in pq.read_schema(sorted_file).metadata[b"geo"].decode():
+        pytest.skip("Plain WKB columns are written without geospatial statistics")
+    batches, statistics = filter_geoparquet(sorted_file, queries[1:3], workers=2)
+    assert statistics.row_groups_read < statistics.row_groups
+    assert statistics.bytes_skipped > 0
+    assert statistics.rows_read == 0
+
+    for _ in batches:
+        pass
+    assert statistics.rows_read == statistics.row_groups_read * ROW_GROUP_SIZE
+
+
+def test_selected_columns(sorted_file, queries):
+    batches, _ = filter_geoparquet(sorted_file, queries, columns=["id"], join=True)
+    table = pa.Table.from_batches(list(batches))
+    assert table.column_names == ["id", QUERY_INDEX_COLUMN]
+
+
+def test_selected_columns_statistics(sorted_file):
+    # The geometry and covering columns are read too, to filter on
+    _, statistics = filter_geoparquet(
+        sorted_file, [shapely.box(100, 100, 150, 150)], columns=["id"]
+    )
+    assert 0 < statistics.bytes_read <= statistics.bytes
+
+    _, statistics = filter_geoparquet(
+        sorted_file, [shapely.box(-1, -1, 1001, 1001)], columns=["id"]
+    )
+    assert statistics.bytes_read == statistics.bytes
+
+
+def test_outside_file_bbox_reads_nothing(sorted_file):
+    batches, statistics = filter_geoparquet(
+        sorted_file, [shapely.box(2000, 0, 3000, 1)]
+    )
+    assert list(batches) == []
+    assert statistics.row_groups_read == 0
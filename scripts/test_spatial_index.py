@@ -0,0 +1,205 @@
+"""
+Test cases for the sidecar packed Hilbert R-tree index.
+
+Run tests with `pytest test_spatial_index.py`
+"""
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from click.testing import CliRunner
+
+from read_geoparquet import get_geo_metadata, read_geoparquet
+from spatial_index import (
+    PageReader,
+    SpatialIndex,
+    build_index,
+    index_path_for,
+    main,
+    query_index,
+)
+from write_nz_building_outline import geopandas_to_arrow
+
+N_FEATURES = 5000
+ROW_GROUP_SIZE = 1000
+BBOXES = [
+    (100, 100, 130, 130),
+    (400, 0, 401, 1000),
+    (0, 0, 1000, 1000),
+    (2000, 2000, 2001, 2001),
+]
+
+
+def brute_force(bounds, bbox):
+    return np.flatnonzero(
+        (bounds[:, 0] <= bbox[2])
+        & (bounds[:, 2] >= bbox[0])
+        & (bounds[:, 1] <= bbox[3])
+        & (bounds[:, 3] >= bbox[1])
+    )
+
+
+def random_bounds(n: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 1000, size=(n, 2))
+    size = rng.uniform(0, 20, size=(n, 2))
+    return np.hstack([xy, xy + size])
+
+
+@pytest.mark.parametrize("n", [0, 1, 16, 17, 1000])
+@pytest.mark.parametrize("node_size", [2, 16])
+def test_search_matches_brute_force(n, node_size):
+    bounds = random_bounds(n)
+    index = SpatialIndex.pack(bounds, node_size)
+    assert index.num_items == n
+    for bbox in BBOXES:
+        np.testing.assert_array_equal(index.search(bbox), brute_force(bounds, bbox))
+
+
+def test_nan_bounds_are_left_out():
+    bounds = random_bounds(100)
+    bounds[::3] = np.nan
+    index = SpatialIndex.pack(bounds)
+    assert index.num_items == 66
+    rows = index.search((0, 0, 1000, 1000))
+    np.testing.assert_array_equal(rows, np.flatnonzero(~np.isnan(bounds[:, 0])))
+
+
+def test_write_and_open(tmp_path):
+    bounds = random_bounds(1000)
+    SpatialIndex.pack(bounds, 8, {"column": "geometry"}).write(tmp_path / "index")
+    index = SpatialIndex.open(tmp_path / "index")
+
+    assert index.node_size == 8
+    assert index.header == {"column": "geometry"}
+    assert isinstance(index.nodes, np.memmap)
+    np.testing.assert_array_equal(
+        index.search(BBOXES[0]), brute_force(bounds, BBOXES[0])
+    )
+
+
+def test_open_rejects_other_files(tmp_path):
+    (tmp_path / "index").write_bytes(b"PAR1")
+    with pytest.raises(ValueError, match="not a GeoParquet spatial index"):
+        SpatialIndex.open(tmp_path / "index")
+
+
+@pytest.fixture(scope="module")
+def polygons() -> gpd.GeoDataFrame:
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 1000, size=(2, N_FEATURES))
+    geometry = shapely.buffer(shapely.points(x, y), rng.uniform(1, 5, N_FEATURES))
+    geometry[::50] = None
+    df = gpd.GeoDataFrame(
+        {
+            "id": np.arange(N_FEATURES),
+            "name": rng.choice(["a", "bb", "ccc"], N_FEATURES),
+            "value": np.where(np.arange(N_FEATURES) % 7, 1.0, np.nan),
+        },
+        geometry=geometry,
+    )
+    return df
+
+
+@pytest.fixture(
+    scope="module",
+    params=[
+        ("WKB", True, True),
+        ("WKB", False, True),
+        ("geoarrow", False, True),
+        ("WKB", True, False),
+    ],
+    ids=["covering", "wkb", "geoarrow", "no-page-index"],
+)
+def indexed_file(request, tmp_path_factory, polygons):
+    encoding, covering, page_index = request.param
+    path = tmp_path_factory.mktemp("index") / "data.parquet"
+    table = geopandas_to_arrow(polygons, covering=covering, encoding=encoding)
+    pq.write_table(
+        table,
+        path,
+        row_group_size=ROW_GROUP_SIZE,
+        write_page_index=page_index,
+        data_page_size=1024,
+        write_batch_size=64,
+        use_dictionary=["name"],
+    )
+    build_index(path)
+    return path
+
+
+@pytest.mark.parametrize("bbox", BBOXES)
+def test_query_matches_reader(indexed_file, bbox):
+    table, statistics = query_index(indexed_file, bbox)
+    expected, _ = read_geoparquet(indexed_file, bbox=bbox)
+
+    assert table.equals(expected)
+    assert statistics.rows_matched == len(expected)
+
+
+def test_query_reads_only_pages(indexed_file):
+    _, statistics = query_index(indexed_file, BBOXES[0])
+    _, expected = read_geoparquet(indexed_file, bbox=BBOXES[0])
+
+    assert statistics.row_groups_read == expected.row_groups_read
+    metadata = pq.read_metadata(indexed_file)
+    encoding = get_geo_metadata(metadata)["columns"]["geometry"]["encoding"]
+    # Native geometries have several leaf columns, which are read whole
+    if metadata.row_group(0).column(0).has_offset_index and encoding == "WKB":
+        assert statistics.bytes_read < expected.bytes_read / 4
+    assert statistics.rows_read < expected.rows_read
+
+
+@pytest.mark.parametrize("columns", [None, ["id"]])
+def test_query_statistics(indexed_file, columns):
+    for bbox in BBOXES:
+        _, statistics = query_index(indexed_file, bbox, columns=columns)
+        assert 0 <= statistics.bytes_read <= statistics.bytes
+
+
+def test_query_columns(indexed_file):
+    table, _ = query_index(indexed_file, BBOXES[0], columns=["id"])
+    assert table.column_names == ["id"]
+
+
+@pytest.mark.parametrize(
+    "rows", [[0], [5, 6, 999, 1000, 4999], list(range(0, 5000, 37))]
+)
+def test_read_rows(indexed_file, rows):
+    expected = pq.read_table(indexed_file).take(rows)
+    with PageReader(indexed_file) as reader:
+        table = reader.read_rows(np.array(rows))
+    assert table.equals(expected)
+
+
+def test_read_no_rows(indexed_file):
+    with PageReader(indexed_file) as reader:
+        table = reader.read_rows(np.array([], dtype=np.int64), ["id"])
+    assert table.schema == pa.schema([pq.read_schema(indexed_file).field("id")])
+    assert len(table) == 0
+
+
+def test_out_of_date_index(tmp_path, polygons):
+    path = tmp_path / "data.parquet"
+    pq.write_table(geopandas_to_arrow(polygons), path)
+    build_index(path)
+    pq.write_table(geopandas_to_arrow(polygons.iloc[:10]), path)
+
+    with pytest.raises(ValueError, match="out of date"):
+        query_index(path, BBOXES[0])
+
+
+def test_cli(tmp_path, polygons):
+    path = tmp_path / "data.parquet"
+    pq.write_table(geopandas_to_arrow(polygons), path)
+
+    result = CliRunner().invoke(main, [str(path)])
+    assert result.exit_code == 0, result.output
+    assert index_path_for(path).exists()
+    assert "no offset index" in result.output
+
+    result = CliRunner().invoke(main, [str(path), "--bbox", "100", "100", "130", "130"])
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,76 @@
+"""
+Test cases for the Thrift compact protocol helpers.
+
+Run tests with `pytest test_thrift_compact.py`
+"""
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from inspect_metadata import read_footer_bytes
+from thrift_compact import (
+    BINARY,
+    I32,
+    I64,
+    LIST,
+    STRUCT,
+    iter_fields,
+    list_items,
+    read_int,
+    read_varint,
+    skip,
+    write_binary,
+    write_int,
+    write_list,
+    write_struct,
+    write_varint,
+)
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 2**35])
+def test_varint_round_trip(value):
+    assert read_varint(write_varint(value) + b"\xff", 0) == (
+        value,
+        len(write_varint(value)),
+    )
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 2**31 - 1, -(2**40)])
+def test_int_round_trip(value):
+    assert read_int(write_int(value), 0) == value
+
+
+@pytest.mark.parametrize("n_items", [0, 3, 14, 15, 40])
+def test_list_round_trip(n_items):
+    items = [write_binary(f"item {i}".encode()) for i in range(n_items)]
+    buf = write_list(BINARY, items)
+    assert [buf[start:end] for start, end in list_items(buf, 0)] == items
+    assert skip(buf, 0, LIST) == len(buf)
+
+
+def test_struct_round_trip():
+    # Field 20 is more than 15 ids after field 2, so its header holds the full id
+    fields = [
+        (20, BINARY, write_binary(b"x")),
+        (1, I32, write_int(-5)),
+        (2, I64, write_int(7)),
+    ]
+    buf = write_struct(fields)
+
+    decoded = [(i, t, buf[start:end]) for i, t, start, end in iter_fields(buf, 0)]
+    assert decoded == sorted(fields)
+    assert skip(buf, 0, STRUCT) == len(buf)
+
+
+def test_parquet_footer(tmp_path):
+    path = tmp_path / "data.parquet"
+    pq.write_table(pa.table({"a": range(10)}), path)
+    footer = read_footer_bytes(path)
+
+    fields = {i: (t, start) for i, t, start, _ in iter_fields(footer, 0)}
+    # FileMetaData.num_rows is field 3
+    assert fields[3][0] == I64
+    assert read_int(footer, fields[3][1]) == 10
+    # The footer is followed by its length and the magic bytes
+    assert skip(footer, 0, STRUCT) == len(footer) - 8
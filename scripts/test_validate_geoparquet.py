@@ -0,0 +1,81 @@
+"""
+Test cases for the batch GeoParquet metadata validator.
+
+Run tests with `pytest test_validate_geoparquet.py`
+"""
+
+import json
+import pathlib
+import shutil
+
+import pyarrow.parquet as pq
+from click.testing import CliRunner
+
+import validate_geoparquet
+from validate_geoparquet import ValidationSummary, main, validate_files
+
+HERE = pathlib.Path(__file__).parent
+EXAMPLE_PARQUET = HERE / ".." / "examples" / "example.parquet"
+
+
+def write_with_geo_metadata(path, geo_metadata):
+    table = pq.read_table(EXAMPLE_PARQUET)
+    metadata = {**table.schema.metadata, b"geo": geo_metadata}
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+
+def test_identical_metadata_is_validated_once(tmp_path, monkeypatch):
+    paths = [tmp_path / f"{i}.parquet" for i in range(5)]
+    for path in paths:
+        shutil.copy(EXAMPLE_PARQUET, path)
+
+    validated = []
+    validate_blob = validate_geoparquet.validate_blob
+    monkeypatch.setattr(
+        validate_geoparquet,
+        "validate_blob",
+        lambda blob: validated.append(blob) or validate_blob(blob),
+    )
+
+    summary = ValidationSummary()
+    results = list(validate_files(paths, workers=2, summary=summary))
+
+    assert [result.path for result in results] == [str(path) for path in paths]
+    assert all(result.valid for result in results)
+    assert len(validated) == 1
+    assert summary.files == 5
+    assert summary.distinct_metadata == 1
+
+
+def test_invalid_files_are_reported(tmp_path):
+    geo_metadata = json.loads(pq.read_metadata(EXAMPLE_PARQUET).metadata[b"geo"])
+    del geo_metadata["primary_column"]
+    write_with_geo_metadata(tmp_path / "invalid.parquet", json.dumps(geo_metadata))
+    write_with_geo_metadata(tmp_path / "not-json.parquet", "{")
+    (tmp_path / "not-parquet.parquet").write_bytes(b"not a parquet file")
+
+    results = {
+        pathlib.Path(result.path).name: result
+        for result in validate_files(sorted(tmp_path.glob("*.parquet")))
+    }
+
+    assert not any(result.valid for result in results.values())
+    assert (
+        "'primary_column' is a required property"
+        in results["invalid.parquet"].errors[0]
+    )
+    assert "not valid JSON" in results["not-json.parquet"].errors[0]
+    assert "Parquet footer" in results["not-parquet.parquet"].errors[0]
+
+
+def test_cli(tmp_path):
+    shutil.copy(EXAMPLE_PARQUET, tmp_path / "valid.parquet")
+    write_with_geo_metadata(tmp_path / "invalid.parquet", "{}")
+
+    result = CliRunner().invoke(main, [str(tmp_path / "*.parquet")])
+    assert result.exit_code == 1
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [record["valid"] for record in records] == [False, True]
+
+    result = CliRunner().invoke(main, [str(tmp_path / "valid.parquet")])
+    assert result.exit_code == 0
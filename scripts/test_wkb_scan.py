@@ -0,0 +1,87 @@
+"""
+Test cases for the NumPy WKB scanner.
+
+Run tests with `pytest test_wkb_scan.py`
+"""
+
+import numpy as np
+import pyarrow as pa
+import pytest
+import shapely
+
+import wkb_scan
+from wkb_scan import scan_wkb, wkb_statistics
+
+GEOMETRIES = shapely.from_wkt(
+    [
+        "POINT (1 2)",
+        "POINT Z (1 2 3)",
+        "POINT EMPTY",
+        "LINESTRING (0 0, 5 -1, 3 4)",
+        "LINESTRING EMPTY",
+        "LINESTRING M (0 0 1, 1 1 2)",
+        "POLYGON ((0 0, 10 0, 10 10, 0 0), (1 1, 2 1, 2 2, 1 1))",
+        "POLYGON EMPTY",
+        "MULTIPOINT ((1 1), (-3 7))",
+        "MULTILINESTRING ZM ((0 0 1 2, 3 3 3 3))",
+        "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((20 20, 21 20, 21 22, 20 20)))",
+        "GEOMETRYCOLLECTION (POINT (100 100), GEOMETRYCOLLECTION (POINT (0 200)))",
+    ]
+)
+
+
+@pytest.mark.parametrize("flavor", ["iso", "extended"])
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_matches_shapely(flavor, byte_order):
+    wkb = shapely.to_wkb(GEOMETRIES, flavor=flavor, byte_order=byte_order)
+    codes, bounds = scan_wkb(pa.array(wkb))
+
+    expected = shapely.to_wkb(GEOMETRIES, flavor="iso", byte_order=1)
+    expected_codes = [int.from_bytes(geom[1:5], "little") for geom in expected]
+    np.testing.assert_array_equal(codes, expected_codes)
+    np.testing.assert_array_equal(bounds, shapely.bounds(GEOMETRIES))
+
+
+def test_srid_nulls_and_slices():
+    wkb = shapely.to_wkb(shapely.set_srid(GEOMETRIES, 4326), include_srid=True)
+    array = pa.array([None, *wkb], type=pa.large_binary()).slice(1)
+    codes, bounds = scan_wkb(array)
+    np.testing.assert_array_equal(bounds, shapely.bounds(GEOMETRIES))
+
+    codes, bounds = scan_wkb(pa.array([None, *wkb]).slice(0, 2))
+    assert codes.tolist() == [0, 1]
+    assert np.isnan(bounds[0]).all()
+
+
+def test_chunks(monkeypatch):
+    monkeypatch.setattr(wkb_scan, "SCAN_CHUNK_SIZE", 5)
+    _, bounds = scan_wkb(pa.array(shapely.to_wkb(GEOMETRIES)))
+    np.testing.assert_array_equal(bounds, shapely.bounds(GEOMETRIES))
+
+
+def test_wkb_statistics():
+    types, bbox = wkb_statistics(pa.array(shapely.to_wkb(GEOMETRIES)))
+    assert types == [
+        "GeometryCollection",
+        "LineString",
+        "LineString M",
+        "MultiLineString ZM",
+        "MultiPoint",
+        "MultiPolygon",
+        "Point",
+        "Point Z",
+        "Polygon",
+    ]
+    assert bbox == list(shapely.total_bounds(GEOMETRIES))
+
+    types, bbox = wkb_statistics(pa.array([None], type=pa.binary()))
+    assert types == []
+    assert np.isnan(bbox).all()
+
+
+def test_truncated_wkb():
+    wkb = shapely.to_wkb(shapely.box(0, 0, 1, 1))
+    with pytest.raises(ValueError, match="Truncated"):
+        scan_wkb(pa.array([wkb[:20]]))
+    with pytest.raises(ValueError, match="invalid WKB in row 0"):
+        scan_wkb(pa.array([wkb[:-8], wkb]))
@@ -0,0 +1,444 @@
+"""
+Test cases for the nz-building-outlines conversion helpers.
+
+Run tests with `pytest test_write_nz_building_outline.py`
+"""
+
+import json
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from click.testing import CliRunner
+
+import spatial_sort
+import write_nz_building_outline
+from check_geoparquet import check_file
+from partition_nz_building_outline import (
+    kdtree_partition,
+    read_manifest,
+    write_partitioned,
+)
+from row_group_sizing import parse_byte_size
+from validate_geoparquet import validate_files
+from write_nz_building_outline import (
+    geopandas_to_arrow,
+    iter_geopackage_batches,
+    main,
+    write_streaming,
+)
+
+N_FEATURES = 1000
+
+
+@pytest.fixture(scope="module")
+def buildings() -> gpd.GeoDataFrame:
+    """Small synthetic stand-in for the nz-building-outlines layer"""
+    rng = np.random.default_rng(0)
+    x = rng.uniform(1_100_000, 2_100_000, N_FEATURES)
+    y = rng.uniform(4_700_000, 6_200_000, N_FEATURES)
+    geometry = shapely.buffer(shapely.points(x, y), 10, quad_segs=2)
+    geometry[::7] = shapely.multipolygons([[g] for g in geometry[::7]])
+
+    return gpd.GeoDataFrame(
+        {
+            "building_id": np.arange(N_FEATURES, dtype=np.int64),
+            "name": [f"building {i}" for i in range(N_FEATURES)],
+            "capture_source_id": np.ones(N_FEATURES, dtype=np.int64),
+            "capture_source_from": ["2020-01-01"] * N_FEATURES,
+            "capture_source_to": ["2021-01-01"] * N_FEATURES,
+            "last_modified": ["2022-01-02"] * N_FEATURES,
+        },
+        geometry=geometry,
+        crs="EPSG:2193",
+    )
+
+
+@pytest.fixture(scope="module")
+def geopackage(tmp_path_factory, buildings):
+    path = tmp_path_factory.mktemp("gpkg") / "nz-building-outlines.gpkg"
+    buildings.to_file(path, layer="nz_building_outlines")
+    return path
+
+
+def read_geo_metadata(path) -> dict:
+    return json.loads(pq.read_schema(path).metadata[b"geo"])
+
+
+class TestStreaming:
+    def test_batches_are_bounded(self, geopackage):
+        batches = list(iter_geopackage_batches(geopackage, "nz_building_outlines", 300))
+        assert [len(df) for df in batches] == [300, 300, 300, 100]
+        assert all(df.geometry.name == "geometry" for df in batches)
+        assert batches[0].crs.to_epsg() == 2193
+
+    def test_matches_in_memory_conversion(self, tmp_path, geopackage):
+        output = tmp_path / "streamed.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(batches, output, "SNAPPY")
+
+        df = gpd.read_file(geopackage, layer="nz_building_outlines")
+        expected = json.loads(geopandas_to_arrow(df).schema.metadata[b"geo"])
+        geo_metadata = read_geo_metadata(output)
+        column = geo_metadata["columns"]["geometry"]
+        expected_column = expected["columns"]["geometry"]
+
+        assert pq.ParquetFile(output).metadata.num_rows == N_FEATURES
+        assert pq.ParquetFile(output).metadata.num_row_groups == 4
+        assert sorted(column["geometry_types"]) == sorted(
+            expected_column["geometry_types"]
+        )
+        assert column["bbox"] == pytest.approx(expected_column["bbox"])
+        assert column["crs"] == expected_column["crs"]
+
+
+class TestArrowConversion:
+    def test_matches_pandas_conversion(self, monkeypatch, buildings):
+        monkeypatch.setattr(write_nz_building_outline, "PARALLEL_CHUNK_SIZE", 128)
+        buildings = buildings.copy()
+        buildings.loc[3, "geometry"] = None
+
+        table = geopandas_to_arrow(buildings)
+        assert table.column("geometry").num_chunks == 8
+        assert table.column("geometry").to_pylist() == list(
+            shapely.to_wkb(buildings.geometry.values)
+        )
+        assert table.column_names == list(buildings.columns)
+        df = table.drop_columns(["geometry"]).to_pandas()
+        expected = buildings.drop(columns="geometry")
+        assert df.equals(expected)
+
+    def test_numeric_columns_are_not_copied(self, buildings):
+        table = geopandas_to_arrow(buildings)
+        (chunk,) = table.column("building_id").chunks
+        address = buildings["building_id"].values.ctypes.data
+        assert chunk.buffers()[1].address == address
+
+
+class TestParallel:
+    @pytest.mark.parametrize("engine", ["thread", "process"])
+    def test_matches_serial_conversion(self, monkeypatch, buildings, engine):
+        monkeypatch.setattr(write_nz_building_outline, "PARALLEL_CHUNK_SIZE", 128)
+        buildings = buildings.copy()
+        buildings.loc[3, "geometry"] = None
+
+        expected = geopandas_to_arrow(buildings)
+        table = geopandas_to_arrow(buildings, workers=4, engine=engine)
+
+        assert table.column("geometry").equals(expected.column("geometry"))
+        geo_metadata = json.loads(table.schema.metadata[b"geo"])
+        expected_geo_metadata = json.loads(expected.schema.metadata[b"geo"])
+        column = geo_metadata["columns"]["geometry"]
+        expected_column = expected_geo_metadata["columns"]["geometry"]
+        assert sorted(column["geometry_types"]) == sorted(
+            expected_column["geometry_types"]
+        )
+        assert column["bbox"] == pytest.approx(expected_column["bbox"])
+
+
+class TestSpatialSort:
+    @pytest.mark.parametrize("method", spatial_sort.AVAILABLE_SORTS)
+    def test_streaming_matches_in_memory_sort(
+        self, monkeypatch, tmp_path, geopackage, method
+    ):
+        # Merge in small batches so that the runs have to be interleaved
+        monkeypatch.setattr(spatial_sort, "MERGE_BATCH_SIZE", 64)
+        df = gpd.read_file(geopackage, layer="nz_building_outlines")
+        extent = shapely.total_bounds(df.geometry.values)
+        keys = spatial_sort.sort_key(df.geometry.values, method, extent, df.crs)
+
+        output = tmp_path / "sorted.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(batches, output, "SNAPPY", sort=method, extent=extent)
+
+        table = pq.read_table(output)
+        assert spatial_sort.SORT_KEY_COLUMN not in table.column_names
+        building_ids = table.column("building_id").to_numpy()
+        assert sorted(building_ids) == list(range(N_FEATURES))
+        # Ties between equal keys may be broken differently across runs, so compare
+        # the keys rather than the order of the rows
+        np.testing.assert_array_equal(keys[building_ids], np.sort(keys))
+
+    def test_streaming_sort_row_groups(self, tmp_path, geopackage):
+        df = gpd.read_file(geopackage, layer="nz_building_outlines")
+        extent = shapely.total_bounds(df.geometry.values)
+
+        output = tmp_path / "sorted.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(
+            batches, output, "SNAPPY", sort="hilbert", extent=extent, batch_size=300
+        )
+
+        metadata = pq.read_metadata(output)
+        sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        n_full, remainder = divmod(N_FEATURES, 300)
+        assert sizes == [300] * n_full + ([remainder] if remainder else [])
+
+    @pytest.mark.parametrize("method", ["hilbert", "zorder"])
+    def test_streaming_sort_requires_extent(self, tmp_path, geopackage, method):
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        with pytest.raises(ValueError, match="extent"):
+            write_streaming(batches, tmp_path / "sorted.parquet", "SNAPPY", sort=method)
+
+    def test_missing_geometries_sort_last(self):
+        geometries = np.array(
+            [shapely.Point(1, 1), None, shapely.Point(0, 0), shapely.Point()]
+        )
+        order = spatial_sort.sort_order(geometries, "hilbert")
+        assert order.tolist() == [2, 0, 1, 3]
+
+    def test_hilbert_curve_is_continuous(self):
+        x, y = np.meshgrid(np.arange(8), np.arange(8))
+        index = spatial_sort.hilbert_index(x.ravel(), y.ravel(), order=3)
+        order = np.argsort(index)
+        steps = np.abs(np.diff(x.ravel()[order])) + np.abs(np.diff(y.ravel()[order]))
+        assert sorted(index.tolist()) == list(range(64))
+        assert (steps == 1).all()
+
+
+class TestBboxCovering:
+    def test_covering_column(self, buildings):
+        buildings = buildings.copy()
+        buildings.loc[5, "geometry"] = None
+        table = geopandas_to_arrow(buildings, covering=True)
+        geo_metadata = json.loads(table.schema.metadata[b"geo"])
+
+        assert geo_metadata["columns"]["geometry"]["covering"] == {
+            "bbox": {
+                "xmin": ["bbox", "xmin"],
+                "ymin": ["bbox", "ymin"],
+                "xmax": ["bbox", "xmax"],
+                "ymax": ["bbox", "ymax"],
+            }
+        }
+        bbox = table.column("bbox").combine_chunks()
+        assert bbox.type.names == ["xmin", "ymin", "xmax", "ymax"]
+        assert bbox.null_count == 1
+        expected = shapely.bounds(buildings.geometry.values[0])
+        assert list(bbox[0].as_py().values()) == pytest.approx(list(expected))
+
+    def test_row_group_statistics(self, tmp_path, geopackage):
+        output = tmp_path / "covering.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(batches, output, "SNAPPY", covering=True)
+
+        parquet_file = pq.ParquetFile(output)
+        df = gpd.read_file(geopackage, layer="nz_building_outlines")
+        column_paths = [
+            parquet_file.schema.column(i).path for i in range(len(parquet_file.schema))
+        ]
+        xmin_idx = column_paths.index("bbox.xmin")
+        for i in range(parquet_file.metadata.num_row_groups):
+            stats = parquet_file.metadata.row_group(i).column(xmin_idx).statistics
+            assert stats is not None and stats.has_min_max
+            expected = shapely.bounds(df.geometry.values[i * 300 : (i + 1) * 300])
+            assert stats.min == pytest.approx(expected[:, 0].min())
+
+
+class TestRowGroupSizing:
+    @pytest.mark.parametrize(
+        "value,expected",
+        [
+            ("1024", 1024),
+            ("64KB", 64 * 1024),
+            ("128MB", 128 * 1024**2),
+            ("1.5gb", 1.5 * 1024**3),
+        ],
+    )
+    def test_parse_byte_size(self, value, expected):
+        assert parse_byte_size(value) == expected
+
+    def test_row_groups_close_at_byte_target(self, tmp_path, geopackage):
+        output = tmp_path / "sized.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(batches, output, "NONE", row_group_bytes=32 * 1024)
+
+        metadata = pq.ParquetFile(output).metadata
+        sizes = [
+            metadata.row_group(i).total_byte_size
+            for i in range(metadata.num_row_groups)
+        ]
+        assert metadata.num_rows == N_FEATURES
+        assert metadata.num_row_groups > 4
+        # All row groups but the last are full and close to the target
+        assert all(24 * 1024 < size < 40 * 1024 for size in sizes[:-1])
+
+    def test_max_rows(self, tmp_path, geopackage):
+        output = tmp_path / "sized.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(batches, output, "NONE", max_row_group_rows=128)
+
+        metadata = pq.ParquetFile(output).metadata
+        assert [
+            metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)
+        ] == [128] * 7 + [104]
+
+
+class TestPartitioning:
+    @pytest.mark.parametrize("n_partitions", [1, 4, 7])
+    def test_partitions_are_balanced(self, n_partitions):
+        rng = np.random.default_rng(0)
+        x, y = rng.normal(size=(2, 1001))
+        labels = kdtree_partition(x, y, n_partitions)
+
+        counts = np.bincount(labels, minlength=n_partitions)
+        assert len(counts) == n_partitions
+        assert counts.max() - counts.min() <= 1 + 1001 // n_partitions // 10
+
+    def test_write_partitioned(self, tmp_path, buildings):
+        df = buildings.copy()
+        manifest = write_partitioned(df, tmp_path, 4, workers=2)
+
+        assert read_manifest(tmp_path) == manifest
+        assert sum(partition["num_rows"] for partition in manifest) == N_FEATURES
+        for partition in manifest:
+            path = tmp_path / partition["path"]
+            part = gpd.read_parquet(path)
+            assert len(part) == partition["num_rows"]
+            assert list(shapely.total_bounds(part.geometry.values)) == pytest.approx(
+                partition["bbox"]
+            )
+            assert read_geo_metadata(path)["columns"]["geometry"]["bbox"] == (
+                partition["bbox"]
+            )
+
+        # Partition boxes are tight, so a small query only hits one or two files
+        x, y = shapely.get_coordinates(df.geometry.values[0])[0]
+        hits = read_manifest(tmp_path, bbox=(x, y, x + 1, y + 1))
+        assert 1 <= len(hits) <= 2
+
+
+class TestMetadata:
+    def test_geometry_types(self, buildings):
+        df = buildings.copy()
+        df.loc[1, "geometry"] = None
+        df.loc[2, "geometry"] = shapely.force_3d(df.geometry.values[2])
+        df.loc[3, "geometry"] = shapely.Point()
+        table = geopandas_to_arrow(df)
+        geo_metadata = json.loads(table.schema.metadata[b"geo"])
+
+        assert geo_metadata["columns"]["geometry"]["geometry_types"] == [
+            "MultiPolygon",
+            "Point",
+            "Polygon",
+            "Polygon Z",
+        ]
+
+    def test_empty_batches_have_no_bbox(self, tmp_path, buildings):
+        empty = buildings.iloc[:10].copy()
+        empty["geometry"] = None
+        output = tmp_path / "output.parquet"
+
+        def strict_metadata():
+            geo = pq.read_schema(output).metadata[b"geo"]
+            return json.loads(geo, parse_constant=pytest.fail)["columns"]["geometry"]
+
+        write_streaming(iter([empty, empty]), output, "SNAPPY", cast=None)
+        assert "bbox" not in strict_metadata()
+
+        batches = iter([empty, buildings.iloc[10:], empty])
+        write_streaming(batches, output, "SNAPPY", cast=None)
+        expected = shapely.total_bounds(buildings.geometry.values[10:])
+        assert strict_metadata()["bbox"] == pytest.approx(expected)
+
+    @pytest.mark.parametrize("encoding", ["WKB", "geoarrow"])
+    def test_output_validates(self, tmp_path, geopackage, encoding):
+        output = tmp_path / "output.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(batches, output, "SNAPPY", encoding=encoding, covering=True)
+
+        # The 2.0 schema only allows WKB, native encodings are GeoParquet 1.1
+        if encoding == "WKB":
+            (result,) = validate_files([output])
+            assert result.valid, result.errors
+        assert check_file(output) == []
+
+
+class TestNativeEncoding:
+    def test_single_type_column_is_native(self, buildings):
+        points = buildings.copy()
+        points["geometry"] = points.geometry.centroid
+        points.loc[3, "geometry"] = None
+        table = geopandas_to_arrow(points, encoding="geoarrow")
+        geo_metadata = json.loads(table.schema.metadata[b"geo"])
+
+        assert geo_metadata["version"] == "1.1.0"
+        assert geo_metadata["columns"]["geometry"]["encoding"] == "point"
+        geometry = table.column("geometry").combine_chunks()
+        assert geometry.type == pa.struct(
+            [pa.field("x", pa.float64(), False), pa.field("y", pa.float64(), False)]
+        )
+        assert geometry.null_count == 1
+        assert geometry.field("x")[0].as_py() == pytest.approx(
+            points.geometry.values[0].x
+        )
+
+    def test_mixed_types_fall_back_to_wkb(self, buildings):
+        table = geopandas_to_arrow(buildings, encoding="geoarrow")
+        geo_metadata = json.loads(table.schema.metadata[b"geo"])
+
+        assert geo_metadata["columns"]["geometry"]["encoding"] == "WKB"
+        assert table.schema.field("geometry").type == pa.binary()
+
+    def test_streaming_round_trip(self, tmp_path, geopackage):
+        output = tmp_path / "native.parquet"
+        batches = iter_geopackage_batches(geopackage, "nz_building_outlines", 300)
+        write_streaming(batches, output, "SNAPPY", encoding="geoarrow", covering=True)
+
+        geo_metadata = read_geo_metadata(output)
+        assert geo_metadata["columns"]["geometry"]["encoding"] == "multipolygon"
+        df = gpd.read_parquet(output)
+        expected = gpd.read_file(geopackage, layer="nz_building_outlines")
+        assert df.geometry.geom_equals(expected.geometry).all()
+
+
+class TestCli:
+    @pytest.mark.parametrize(
+        "args",
+        [
+            [],
+            ["--covering", "--sort", "hilbert", "--encoding", "geoarrow"],
+            ["--streaming", "--batch-size", "300", "--row-group-bytes", "32KB"],
+            ["--streaming", "--sort", "zorder", "--workers", "2"],
+        ],
+    )
+    def test_main(self, tmp_path, geopackage, args):
+        output = tmp_path / "out.parquet"
+        result = CliRunner().invoke(
+            main, ["-i", str(geopackage), "-o", str(output), *args]
+        )
+
+        assert result.exit_code == 0, result.output
+        assert pq.ParquetFile(output).metadata.num_rows == N_FEATURES
+
+    @pytest.mark.parametrize("streaming", [False, True])
+    def test_profile(self, tmp_path, geopackage, streaming):
+        output = tmp_path / "out.parquet"
+        profile = tmp_path / "profile.json"
+        trace = tmp_path / "trace.json"
+        args = ["-i", str(geopackage), "-o", str(output)]
+        args += ["--profile", str(profile), "--trace", str(trace)]
+        if streaming:
+            args += ["--streaming", "--batch-size", "300"]
+        result = CliRunner().invoke(main, args)
+        assert result.exit_code == 0, result.output
+
+        totals = json.loads(profile.read_text())["totals"]
+        for name in [
+            "cast_dtypes",
+            "convert/parse_to_shapely",
+            "convert/encode_wkb",
+            "convert/create_metadata",
+            "convert/from_pandas",
+            "write",
+        ]:
+            assert totals[name]["count"] == (4 if streaming else 1)
+        assert totals["read"]["rows"] == N_FEATURES
+        assert totals["write"]["rows"] == N_FEATURES
+        assert totals["convert/encode_wkb"]["bytes"] > 0
+
+        events = json.loads(trace.read_text())["traceEvents"]
+        assert {e["name"] for e in events if e["ph"] == "X"} >= {"read", "write"}
@@ -0,0 +1,161 @@
+"""
+Minimal reader and writer of the Thrift compact protocol, as used by Parquet footers
+and page headers.
+
+Values are read from and written to bytes directly. Structs are not decoded into
+objects: their fields are located by position so that callers can decode the few
+fields they need and copy the others verbatim.
+"""
+
+from typing import Iterator, List, Tuple
+
+# Thrift compact protocol types
+STOP = 0
+BOOLEAN_TRUE = 1
+BOOLEAN_FALSE = 2
+BYTE = 3
+I16 = 4
+I32 = 5
+I64 = 6
+DOUBLE = 7
+BINARY = 8
+LIST = 9
+SET = 10
+MAP = 11
+STRUCT = 12
+
+
+def read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    """An unsigned varint at pos, and the position after it"""
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def write_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_int(buf: bytes, pos: int) -> int:
+    """A zigzag-encoded I16, I32 or I64 at pos"""
+    zigzag, _ = read_varint(buf, pos)
+    return (zigzag >> 1) ^ -(zigzag & 1)
+
+
+def write_int(value: int) -> bytes:
+    return write_varint((value << 1) ^ (value >> 63))
+
+
+def write_binary(value: bytes) -> bytes:
+    return write_varint(len(value)) + value
+
+
+def skip(buf: bytes, pos: int, type_: int) -> int:
+    """Position after a value of a Thrift compact type"""
+    if type_ in (BOOLEAN_TRUE, BOOLEAN_FALSE, BYTE):
+        # Booleans are only a byte in lists, and carried by the field header otherwise
+        return pos + 1
+    if type_ in (I16, I32, I64):
+        return read_varint(buf, pos)[1]
+    if type_ == DOUBLE:
+        return pos + 8
+    if type_ == BINARY:
+        length, pos = read_varint(buf, pos)
+        return pos + length
+    if type_ in (LIST, SET):
+        header = buf[pos]
+        pos += 1
+        size = header >> 4
+        if size == 15:
+            size, pos = read_varint(buf, pos)
+        for _ in range(size):
+            pos = skip(buf, pos, header & 0x0F)
+        return pos
+    if type_ == MAP:
+        size, pos = read_varint(buf, pos)
+        if size:
+            types = buf[pos]
+            pos += 1
+            for _ in range(size):
+                pos = skip(buf, pos, types >> 4)
+                pos = skip(buf, pos, types & 0x0F)
+        return pos
+    if type_ == STRUCT:
+        for *_, end in iter_fields(buf, pos):
+            pos = end
+        return pos + 1
+    raise ValueError(f"Unknown Thrift compact type {type_}")
+
+
+def iter_fields(buf: bytes, pos: int) -> Iterator[Tuple[int, int, int, int]]:
+    """Fields of the struct at pos, as (field id, type, value start, value end)"""
+    field_id = 0
+    while buf[pos] != STOP:
+        header = buf[pos]
+        pos += 1
+        field_type = header & 0x0F
+        if header >> 4:
+            field_id += header >> 4
+        else:
+            zigzag, pos = read_varint(buf, pos)
+            field_id = (zigzag >> 1) ^ -(zigzag & 1)
+
+        if field_type in (BOOLEAN_TRUE, BOOLEAN_FALSE):
+            end = pos
+        else:
+            end = skip(buf, pos, field_type)
+        yield field_id, field_type, pos, end
+        pos = end
+
+
+def list_items(buf: bytes, pos: int) -> List[Tuple[int, int]]:
+    """Start and end of each item of the list at pos"""
+    header = buf[pos]
+    pos += 1
+    size = header >> 4
+    if size == 15:
+        size, pos = read_varint(buf, pos)
+    items = []
+    for _ in range(size):
+        end = skip(buf, pos, header & 0x0F)
+        items.append((pos, end))
+        pos = end
+    return items
+
+
+def write_field_header(field_id: int, last_id: int, field_type: int) -> bytes:
+    if 0 < field_id - last_id <= 15:
+        return bytes([(field_id - last_id) << 4 | field_type])
+    return bytes([field_type]) + write_varint((field_id << 1) ^ (field_id >> 15))
+
+
+def write_list_header(item_type: int, size: int) -> bytes:
+    if size < 15:
+        return bytes([size << 4 | item_type])
+    return bytes([0xF0 | item_type]) + write_varint(size)
+
+
+def write_list(item_type: int, items: List[bytes]) -> bytes:
+    """A list of encoded items"""
+    return write_list_header(item_type, len(items)) + b"".join(items)
+
+
+def write_struct(fields: List[Tuple[int, int, bytes]]) -> bytes:
+    """A struct of (field id, type, encoded value) fields"""
+    out = bytearray()
+    last_id = 0
+    for field_id, field_type, value in sorted(fields, key=lambda field: field[0]):
+        out += write_field_header(field_id, last_id, field_type) + value
+        last_id = field_id
+    out.append(STOP)
+    return bytes(out)
@@ -0,0 +1,164 @@
+"""
+Validate the geo metadata of many GeoParquet files against format-specs/schema.json.
+
+Footers are read concurrently with `inspect_metadata.read_footer`, so no data pages are
+read. Collections of files written by the same tool tend to share identical geo
+metadata, so metadata blobs are deduplicated by their hash and each distinct blob is
+validated only once, by a single validator compiled for the whole run.
+
+One JSON record per file is written to stdout, and throughput numbers to stderr. The
+exit status is 1 if any file is invalid.
+"""
+
+import glob
+import hashlib
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+
+from inspect_metadata import read_footer
+from schema_registry import get_validator
+
+
+@dataclass
+class ValidationResult:
+    """Result of validating the geo metadata of one file"""
+
+    path: str
+    valid: bool
+    sha256: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ValidationSummary:
+    files: int = 0
+    invalid: int = 0
+    distinct_metadata: int = 0
+    metadata_bytes: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        rate = self.files / self.seconds if self.seconds else float("inf")
+        return (
+            f"validated {self.files} files ({self.invalid} invalid) with "
+            f"{self.distinct_metadata} distinct geo metadata blobs "
+            f"({self.metadata_bytes} bytes) in {self.seconds:.2f}s, "
+            f"{rate:.0f} files/s"
+        )
+
+
+def expand_inputs(inputs: Iterable[str], pattern: str = "*.parquet") -> List[Path]:
+    """Files matching a list of files, directories and glob patterns
+
+    Directories are searched recursively for files matching `pattern`.
+    """
+    paths = []
+    for input in inputs:
+        path = Path(input)
+        if path.is_dir():
+            paths.extend(sorted(path.rglob(pattern)))
+        elif path.exists():
+            paths.append(path)
+        else:
+            paths.extend(
+                Path(match) for match in sorted(glob.glob(input, recursive=True))
+            )
+    return paths
+
+
+def read_geo_metadata(path: Path) -> Tuple[Optional[bytes], Optional[str]]:
+    """The raw geo metadata of a file, or an error message if it can't be read"""
+    try:
+        metadata = read_footer(path)
+    except (OSError, ValueError) as e:
+        return None, f"could not read the Parquet footer: {e}"
+
+    blob = (metadata.metadata or {}).get(b"geo")
+    if blob is None:
+        return None, "no 'geo' metadata found in the Parquet footer"
+    return blob, None
+
+
+def validate_blob(blob: bytes) -> List[str]:
+    """Schema validation errors of a geo metadata blob"""
+    try:
+        geo_metadata = json.loads(blob)
+    except ValueError as e:
+        return [f"geo metadata is not valid JSON: {e}"]
+
+    errors = get_validator().iter_errors(geo_metadata)
+    return sorted(f"{error.json_path}: {error.message}" for error in errors)
+
+
+def validate_files(
+    paths: Iterable[Path],
+    workers: Optional[int] = None,
+    summary: Optional[ValidationSummary] = None,
+) -> Iterator[ValidationResult]:
+    """Validate the geo metadata of many files, in the order of paths
+
+    Footers are read on a thread pool while the results are validated, and the
+    result of validating each distinct metadata blob is reused for every file that
+    has it. If given, `summary` is updated as results are produced.
+    """
+    summary = summary if summary is not None else ValidationSummary()
+    validated: Dict[str, List[str]] = {}
+    start = time.perf_counter()
+
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, (blob, error) in zip(paths, executor.map(read_geo_metadata, paths)):
+            if blob is None:
+                result = ValidationResult(str(path), valid=False, errors=[error])
+            else:
+                digest = hashlib.sha256(blob).hexdigest()
+                if digest not in validated:
+                    validated[digest] = validate_blob(blob)
+                    summary.distinct_metadata += 1
+                    summary.metadata_bytes += len(blob)
+                errors = validated[digest]
+                result = ValidationResult(str(path), not errors, digest, errors)
+
+            summary.files += 1
+            summary.invalid += not result.valid
+            summary.seconds = time.perf_counter() - start
+            yield result
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of threads reading footers.",
+)
+@click.option(
+    "--invalid-only",
+    is_flag=True,
+    help="Only output the records of invalid files.",
+)
+def main(inputs: Tuple[str, ...], workers: Optional[int], invalid_only: bool):
+    """Validate the GeoParquet files in INPUTS (files, directories or glob patterns)"""
+    paths = expand_inputs(inputs)
+    if not paths:
+        raise click.UsageError("No files match the given inputs")
+
+    summary = ValidationSummary()
+    for result in validate_files(paths, workers, summary):
+        if not (invalid_only and result.valid):
+            print(json.dumps(asdict(result)), file=sys.stdout)
+
+    print(summary, file=sys.stderr)
+    sys.exit(1 if summary.invalid else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Compute geometry types and bounds directly from WKB, without parsing geometries.
+
+Computing the `geometry_types` and `bbox` metadata of a WKB column with shapely means
+creating a Python object for every geometry, only to read its type and coordinates.
+This module reads the offsets and data buffers of an Arrow binary array with NumPy
+instead. Each geometry's header (byte order and type code) is decoded in a vectorized
+way, and nested geometries are walked level by level: the i-th ring or part of all
+geometries is processed at once, so the number of Python-level iterations is the
+largest number of rings or parts of a geometry, not the number of geometries. The x
+and y values of the coordinate runs found are then gathered from zero-copy float64
+views of the data buffer and reduced to bounds.
+
+Both ISO WKB and the extended WKB written by shapely/GEOS (with Z, M and SRID flags)
+are supported.
+"""
+
+from typing import List, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+from numpy.typing import NDArray
+
+from geoparquet_names import wkb_type_name
+
+EWKB_Z = 0x80000000
+EWKB_M = 0x40000000
+EWKB_SRID = 0x20000000
+EWKB_FLAGS = EWKB_Z | EWKB_M | EWKB_SRID
+
+POINT = 1
+LINESTRING = 2
+POLYGON = 3
+
+# Number of geometries scanned at a time
+SCAN_CHUNK_SIZE = 65_536
+
+# A run of consecutive coordinates: row, offset of the first coordinate, number of
+# coordinates, number of dimensions and whether it is little-endian
+CoordinateRuns = List[Tuple[NDArray, NDArray, NDArray, NDArray, NDArray]]
+
+
+def _view(data: NDArray[np.uint8], dtype: str, offset: int) -> NDArray:
+    """View the data buffer as an array of dtype, starting at a byte offset"""
+    itemsize = np.dtype(dtype).itemsize
+    return np.frombuffer(
+        data, dtype=dtype, offset=offset, count=max(len(data) - offset, 0) // itemsize
+    )
+
+
+def _read_uint32(
+    data: NDArray[np.uint8], pos: NDArray[np.int64], little: NDArray[np.bool_]
+) -> NDArray[np.int64]:
+    """Read unsigned integers at arbitrary byte offsets, from aligned views"""
+    values = np.empty(len(pos), dtype=np.int64)
+    alignment = pos % 4
+    for byte_order, mask in [("<", little), (">", ~little)]:
+        for a in range(4):
+            selected = np.flatnonzero(mask & (alignment == a))
+            if len(selected):
+                view = _view(data, f"{byte_order}u4", a)
+                values[selected] = view[(pos[selected] - a) // 4]
+    return values
+
+
+def _run_bounds(
+    data: NDArray[np.uint8],
+    start: NDArray[np.int64],
+    n: NDArray[np.int64],
+    ndim: NDArray[np.int64],
+    little: NDArray[np.bool_],
+) -> NDArray[np.float64]:
+    """xmin, ymin, xmax, ymax of each non-empty run of coordinates
+
+    WKB doubles are generally not 8-byte aligned, but all the coordinates of a run
+    share the alignment of its first one. The data is viewed as float64 at each of the
+    8 possible alignments and both byte orders, without copying, and the coordinates of
+    the runs with each alignment are gathered from the matching view.
+    """
+    # Runs are grouped by byte order, alignment and number of dimensions, so that
+    # each group is read from a single view with a constant stride
+    group = start % 8 + 8 * little + 16 * (ndim - 2)
+    order = np.argsort(group, kind="stable")
+    boundaries = np.searchsorted(group[order], np.arange(49))
+    bounds = np.empty((len(start), 4))
+    for g in range(48):
+        runs = order[boundaries[g] : boundaries[g + 1]]
+        if len(runs) == 0:
+            continue
+        alignment, little_endian, stride = g % 8, (g // 8) % 2, 2 + g // 16
+        view = _view(data, "<f8" if little_endian else ">f8", alignment)
+
+        # Index in the view of x of the j-th coordinate of a run: first + stride * j
+        count = n[runs]
+        run_offsets = np.cumsum(count) - count
+        first = (start[runs] - alignment) // 8
+        index = np.arange(count.sum()) * stride
+        index += np.repeat(first - stride * run_offsets, count)
+        x = view[index]
+        y = view[index + 1]
+        # fmin/fmax ignore the NaN coordinates of empty points
+        bounds[runs, 0] = np.fmin.reduceat(x, run_offsets)
+        bounds[runs, 1] = np.fmin.reduceat(y, run_offsets)
+        bounds[runs, 2] = np.fmax.reduceat(x, run_offsets)
+        bounds[runs, 3] = np.fmax.reduceat(y, run_offsets)
+    return bounds
+
+
+def _scan(
+    data: NDArray[np.uint8],
+    pos: NDArray[np.int64],
+    row: NDArray[np.int64],
+    runs: CoordinateRuns,
+) -> Tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """Walk the geometries starting at pos, appending their coordinate runs
+
+    Returns the offset of the end of each geometry and its ISO WKB type code.
+    """
+    little = data[pos] == 1
+    code = _read_uint32(data, pos + 1, little)
+    iso = code & ~EWKB_FLAGS
+    geometry_type = iso % 1000
+    has_z = ((code & EWKB_Z) != 0) | np.isin(iso // 1000, [1, 3])
+    has_m = ((code & EWKB_M) != 0) | np.isin(iso // 1000, [2, 3])
+    ndim = 2 + has_z + has_m
+    body = pos + 5 + 4 * ((code & EWKB_SRID) != 0)
+    end = np.empty_like(pos)
+
+    unknown = (geometry_type < POINT) | (geometry_type > 7)
+    if unknown.any():
+        raise ValueError(f"Unknown WKB geometry type {iso[unknown][0]}")
+
+    points = geometry_type == POINT
+    runs.append(
+        (
+            row[points],
+            body[points],
+            np.ones(points.sum(), np.int64),
+            ndim[points],
+            little[points],
+        )
+    )
+    end[points] = body[points] + 8 * ndim[points]
+
+    lines = geometry_type == LINESTRING
+    n = _read_uint32(data, body[lines], little[lines])
+    runs.append((row[lines], body[lines] + 4, n, ndim[lines], little[lines]))
+    end[lines] = body[lines] + 4 + 8 * ndim[lines] * n
+
+    # The rings of polygons and the parts of multi-geometries and collections are
+    # walked in lockstep: the i-th ring or part of every geometry at once
+    polygons = np.flatnonzero(geometry_type == POLYGON)
+    n_rings = _read_uint32(data, body[polygons], little[polygons])
+    cursor = body[polygons] + 4
+    for i in range(n_rings.max(initial=0)):
+        active = n_rings > i
+        idx = polygons[active]
+        n = _read_uint32(data, cursor[active], little[idx])
+        runs.append((row[idx], cursor[active] + 4, n, ndim[idx], little[idx]))
+        cursor[active] += 4 + 8 * ndim[idx] * n
+    end[polygons] = cursor
+
+    collections = np.flatnonzero(geometry_type > POLYGON)
+    n_parts = _read_uint32(data, body[collections], little[collections])
+    cursor = body[collections] + 4
+    for i in range(n_parts.max(initial=0)):
+        active = n_parts > i
+        cursor[active], _ = _scan(data, cursor[active], row[collections[active]], runs)
+    end[collections] = cursor
+
+    return end, geometry_type + 1000 * (has_z + 2 * has_m)
+
+
+def _binary_buffers(
+    array: Union[pa.Array, pa.ChunkedArray],
+) -> Tuple[NDArray[np.int64], NDArray[np.uint8]]:
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if isinstance(array, pa.ExtensionArray):
+        array = array.storage
+    if not (pa.types.is_binary(array.type) or pa.types.is_large_binary(array.type)):
+        raise TypeError(f"Expected a binary array of WKB, got {array.type}")
+
+    _, offsets, data = array.buffers()
+    offset_type = np.int64 if pa.types.is_large_binary(array.type) else np.int32
+    offsets = np.frombuffer(offsets, dtype=offset_type)
+    offsets = offsets[array.offset : array.offset + len(array) + 1].astype(np.int64)
+    data = np.frombuffer(data or b"", dtype=np.uint8)
+    return offsets, data
+
+
+def scan_wkb(
+    array: Union[pa.Array, pa.ChunkedArray],
+) -> Tuple[NDArray[np.int64], NDArray[np.float64]]:
+    """ISO WKB geometry type code and 2D bounds of each geometry of a WKB array
+
+    Parameters
+    ----------
+    array : pyarrow binary or large binary array
+        WKB geometries, possibly wrapped in an extension type.
+
+    Returns
+    -------
+    The type codes (e.g. 1003 for "Polygon Z", 0 for nulls) and an array of shape
+    (n, 4) of xmin, ymin, xmax, ymax. The bounds of null and empty geometries are NaN.
+    """
+    offsets, data = _binary_buffers(array)
+    rows = np.flatnonzero(offsets[1:] > offsets[:-1])
+
+    codes = np.zeros(len(offsets) - 1, dtype=np.int64)
+    bounds = np.empty((len(codes), 4))
+    bounds[:, :2] = np.inf
+    bounds[:, 2:] = -np.inf
+    # Geometries are scanned in chunks to bound the size of the temporary arrays
+    for i in range(0, len(rows), SCAN_CHUNK_SIZE):
+        chunk = rows[i : i + SCAN_CHUNK_SIZE]
+        runs: CoordinateRuns = []
+        try:
+            end, codes[chunk] = _scan(data, offsets[chunk], chunk, runs)
+        except IndexError as e:
+            raise ValueError("Truncated WKB") from e
+        invalid = end != offsets[chunk + 1]
+        if invalid.any():
+            raise ValueError(f"Truncated or invalid WKB in row {chunk[invalid][0]}")
+
+        row, start, n, ndim, little = (np.concatenate(values) for values in zip(*runs))
+        non_empty = n > 0
+        row = row[non_empty]
+        run_bounds = _run_bounds(
+            data, start[non_empty], n[non_empty], ndim[non_empty], little[non_empty]
+        )
+        np.fmin.at(bounds[:, 0], row, run_bounds[:, 0])
+        np.fmin.at(bounds[:, 1], row, run_bounds[:, 1])
+        np.fmax.at(bounds[:, 2], row, run_bounds[:, 2])
+        np.fmax.at(bounds[:, 3], row, run_bounds[:, 3])
+
+    bounds[np.isinf(bounds[:, 0])] = np.nan
+    return codes, bounds
+
+
+def wkb_statistics(
+    array: Union[pa.Array, pa.ChunkedArray],
+) -> Tuple[List[str], List[float]]:
+    """The geometry_types and bbox metadata of a WKB column"""
+    codes, bounds = scan_wkb(array)
+    types = sorted(wkb_type_name(code) for code in np.unique(codes[codes > 0]))
+    bounds = bounds[~np.isnan(bounds[:, 0])]
+    if len(bounds) == 0:
+        # As shapely.total_bounds
+        return types, [np.nan] * 4
+    bbox = [*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)]
+    return types, [float(value) for value in bbox]
@@ -1,21 +1,76 @@
+import contextlib
 import json
 import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 import click
+import geoarrow.pyarrow as ga
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
+import pyogrio
 import shapely
 from numpy.typing import NDArray
-from shapely import GeometryType
+
+import row_group_sizing
+from geoparquet_names import covering_column_name, wkb_type_name
+from instrumentation import phase, recording
+from row_group_sizing import ByteBudgetWriter, parse_byte_size
+from schema_registry import get_schema
+from spatial_sort import (
+    AVAILABLE_SORTS,
+    SORT_KEY_COLUMN,
+    external_sort,
+    sort_key,
+    sort_order,
+)
 
 AVAILABLE_COMPRESSIONS = ["NONE", "SNAPPY", "GZIP", "BROTLI", "LZ4", "ZSTD"]
+AVAILABLE_ENGINES = ["thread", "process"]
+AVAILABLE_ENCODINGS = ["WKB", "geoarrow"]
+
+# GeoParquet 1.1 native encodings of single-type geometry columns
+NATIVE_ENCODINGS = {
+    "Point": "point",
+    "LineString": "linestring",
+    "Polygon": "polygon",
+    "MultiPoint": "multipoint",
+    "MultiLineString": "multilinestring",
+    "MultiPolygon": "multipolygon",
+}
+# The native encodings were dropped from the 2.0 specification, which only allows WKB
+NATIVE_ENCODING_VERSION = "1.1.0"
+
+# Number of geometries encoded by a single task when encoding in parallel, and by a
+# single step when encoding serially
+PARALLEL_CHUNK_SIZE = 50_000
+
+# ISO WKB geometry codes indexed by shapely type id. Linear rings are written to WKB
+# as line strings.
+WKB_TYPE_CODES = np.array([1, 2, 2, 3, 4, 5, 6, 7])
+
+# Bounds of a batch without any non-empty geometries
+EMPTY_BBOX = [np.nan] * 4
 
 ShapelyGeometryArray = NDArray[np.object_]
+# Geometry types and bbox of a geometry column
+GeometryStatistics = Tuple[List[str], List[float]]
 
 
 class PathType(click.Path):
@@ -25,6 +80,20 @@ class PathType(click.Path):
         return Path(super().convert(value, param, ctx))
 
 
+class ByteSizeType(click.ParamType):
+    """A Click argument for a byte size like "128MB", returned as an int"""
+
+    name = "size"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return parse_byte_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
 def parse_to_shapely(df: gpd.GeoDataFrame) -> Dict[str, ShapelyGeometryArray]:
     """Parse to shapely geometry array
 
@@ -39,24 +108,35 @@ def parse_to_shapely(df: gpd.GeoDataFrame) -> Dict[str, ShapelyGeometryArray]:
 
 
 def _create_metadata(
-    df: gpd.GeoDataFrame, geometry_columns: Dict[str, ShapelyGeometryArray]
+    df: gpd.GeoDataFrame,
+    geometry_columns: Dict[str, ShapelyGeometryArray],
+    statistics: Optional[Dict[str, GeometryStatistics]] = None,
 ) -> Dict[str, Any]:
     """Create and encode geo metadata dict.
 
     Parameters
     ----------
     df : GeoDataFrame
+    geometry_columns : dict
+        Shapely geometry array for each geometry column
+    statistics : dict, optional
+        Precomputed geometry types and bbox for each geometry column, e.g. as reduced
+        from a parallel encoding. Computed from the geometry arrays if not given.
 
     Returns
     -------
     dict
     """
+    statistics = statistics or {}
 
     # Construct metadata for each geometry
     column_metadata = {}
     for col, geometry_array in geometry_columns.items():
-        geometry_types = get_geometry_types(geometry_array)
-        bbox = list(shapely.total_bounds(geometry_array))
+        if col in statistics:
+            geometry_types, bbox = statistics[col]
+        else:
+            geometry_types = get_geometry_types(geometry_array)
+            bbox = list(shapely.total_bounds(geometry_array))
 
         series = df[col]
         column_metadata[col] = {
@@ -66,15 +146,15 @@ def _create_metadata(
             # We don't specify orientation for now
             # "orientation"
             "edges": "planar",
-            "bbox": bbox,
             # I don't know how to get the epoch from a pyproj CRS, and if it's relevant
             # here
             # "epoch":
         }
+        # Columns without any non-empty geometries have a NaN bbox, which isn't JSON
+        if np.isfinite(bbox).all():
+            column_metadata[col]["bbox"] = list(bbox)
 
-    with open("../format-specs/schema.json") as f:
-        spec_schema = json.load(f)
-        version = spec_schema["properties"]["version"]["const"]
+    version = get_schema()["properties"]["version"]["const"]
 
     return {
         "version": version,
@@ -84,15 +164,59 @@ def _create_metadata(
     }
 
 
+def merge_metadata(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Combine the geo metadata of two batches of the same table
+
+    Geometry types are unioned and bounding boxes are expanded to cover both
+    batches. Batches without any non-empty geometries have no bbox, and the merged
+    metadata only has one if either batch does.
+    """
+    merged = {**left, "columns": {}}
+    for col, left_meta in left["columns"].items():
+        right_meta = right["columns"][col]
+        geometry_types = set(left_meta["geometry_types"]) | set(
+            right_meta["geometry_types"]
+        )
+        left_bbox = np.asarray(left_meta.get("bbox", EMPTY_BBOX), dtype=np.float64)
+        right_bbox = np.asarray(right_meta.get("bbox", EMPTY_BBOX), dtype=np.float64)
+        bbox = np.concatenate(
+            [
+                np.fmin(left_bbox[:2], right_bbox[:2]),
+                np.fmax(left_bbox[2:], right_bbox[2:]),
+            ]
+        )
+        merged["columns"][col] = {
+            **left_meta,
+            "geometry_types": sorted(geometry_types),
+        }
+        merged["columns"][col].pop("bbox", None)
+        if np.isfinite(bbox).all():
+            merged["columns"][col]["bbox"] = bbox.tolist()
+
+    return merged
+
+
 def get_geometry_types(shapely_geoms: ShapelyGeometryArray) -> List[str]:
+    return geometry_type_names(geometry_type_codes(shapely_geoms))
+
+
+def geometry_type_codes(shapely_geoms: ShapelyGeometryArray) -> Set[int]:
+    """The distinct ISO WKB geometry codes, with Z/M offsets, of non-missing geoms"""
+    shapely_geoms = np.asarray(shapely_geoms)
     type_ids = shapely.get_type_id(shapely_geoms)
-    unique_type_ids = set(type_ids)
+    present = type_ids >= 0
+    shapely_geoms = shapely_geoms[present]
+    codes = (
+        WKB_TYPE_CODES[type_ids[present]]
+        + 1000 * shapely.has_z(shapely_geoms)
+        + 2000 * shapely.has_m(shapely_geoms)
+    )
+    return set(np.unique(codes).tolist())
 
-    geom_type_names: List[str] = []
-    for type_id in unique_type_ids:
-        geom_type_names.append(GeometryType(type_id).name)
 
-    return geom_type_names
+def geometry_type_names(codes: Iterable[int]) -> List[str]:
+    """The GeoParquet geometry type names, like "Polygon Z", of ISO WKB codes"""
+    return sorted(wkb_type_name(code) for code in codes)
 
 
 def encode_metadata(metadata: Dict) -> bytes:
@@ -132,21 +256,404 @@ def cast_dtypes(df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     return df
 
 
-def geopandas_to_arrow(df: gpd.GeoDataFrame) -> pa.Table:
-    geometry_columns = parse_to_shapely(df)
-    geo_metadata = _create_metadata(df, geometry_columns)
+def wkb_array(geometry_array: ShapelyGeometryArray) -> pa.BinaryArray:
+    """Encode geometries to WKB in the buffers of an Arrow binary array
+
+    The whole array is encoded by a single shapely.to_wkb call. Arrow copies the
+    resulting WKB bytes objects straight into a contiguous values buffer, so they only
+    need to exist until then.
+    """
+    return pa.array(shapely.to_wkb(geometry_array), type=pa.binary())
+
+
+def _chunks(geometry_array: ShapelyGeometryArray) -> List[ShapelyGeometryArray]:
+    geometry_array = np.asarray(geometry_array)
+    n_chunks = max(1, -(-len(geometry_array) // PARALLEL_CHUNK_SIZE))
+    return np.array_split(geometry_array, n_chunks)
+
 
-    df = pd.DataFrame(df)
+def encode_wkb(geometry_array: ShapelyGeometryArray) -> pa.ChunkedArray:
+    """Encode geometries to WKB, one chunk of PARALLEL_CHUNK_SIZE at a time
+
+    Large arrays are encoded in chunks so that only a chunk of WKB bytes objects exists
+    at a time.
+    """
+    return pa.chunked_array(
+        [wkb_array(chunk) for chunk in _chunks(geometry_array)], type=pa.binary()
+    )
+
+
+def _encode_chunk(
+    geometry_array: ShapelyGeometryArray,
+) -> Tuple[pa.BinaryArray, Set[int], NDArray[np.float64]]:
+    """Encode a chunk of geometries to WKB and compute its partial statistics"""
+    wkb = wkb_array(geometry_array)
+    codes = geometry_type_codes(geometry_array)
+    bounds = shapely.total_bounds(geometry_array)
+    return wkb, codes, bounds
+
+
+def encode_parallel(
+    geometry_array: ShapelyGeometryArray, executor: Executor
+) -> Tuple[pa.ChunkedArray, GeometryStatistics]:
+    """Encode geometries to WKB in chunks on an executor
+
+    The partial type sets and bounds of the chunks are reduced into the geometry types
+    and bbox of the whole column. Shapely releases the GIL while encoding, so a thread
+    pool is usually enough to keep all cores busy.
+    """
+    wkb_chunks = []
+    codes: Set[int] = set()
+    bounds = np.full(4, np.nan)
+    for wkb, chunk_codes, chunk_bounds in executor.map(
+        _encode_chunk, _chunks(geometry_array)
+    ):
+        wkb_chunks.append(wkb)
+        codes |= chunk_codes
+        bounds[:2] = np.fmin(bounds[:2], chunk_bounds[:2])
+        bounds[2:] = np.fmax(bounds[2:], chunk_bounds[2:])
+
+    wkb = pa.chunked_array(wkb_chunks, type=pa.binary())
+    return wkb, (geometry_type_names(codes), bounds.tolist())
+
+
+def create_executor(engine: str, workers: int) -> Executor:
+    if engine == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    if engine == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    raise ValueError(f"Unknown engine {engine!r}, expected one of {AVAILABLE_ENGINES}")
+
+
+def bbox_covering(geometry_array: ShapelyGeometryArray) -> pa.StructArray:
+    """Compute the per-row bounding boxes of a geometry column
+
+    Missing and empty geometries get a null bounding box, so that they don't
+    contribute NaNs to the column statistics.
+    """
+    return bounds_covering(shapely.bounds(geometry_array))
+
+
+def bounds_covering(bounds: NDArray[np.float64]) -> pa.StructArray:
+    """A bbox covering column from an (n, 4) array of bounds, null where NaN"""
+    mask = np.isnan(bounds).any(axis=1)
+    return pa.StructArray.from_arrays(
+        [pa.array(bounds[:, i], mask=mask) for i in range(4)],
+        names=["xmin", "ymin", "xmax", "ymax"],
+        mask=pa.array(mask),
+    )
+
+
+def _add_bbox_covering(
+    geometry_columns: Dict[str, ShapelyGeometryArray],
+    table: pa.Table,
+    geo_metadata: Dict[str, Any],
+) -> pa.Table:
+    """Append a bbox covering column for each geometry column
+
+    The covering columns are native struct<xmin, ymin, xmax, ymax> columns, so Parquet
+    writes min/max statistics for each of their fields and readers can skip row
+    groups based on them. They are registered under "covering" in the geo metadata
+    as described in GeoParquet 1.1.
+    """
     for col, geometry_array in geometry_columns.items():
-        df[col] = shapely.to_wkb(geometry_array)
+        bbox_col = covering_column_name(geo_metadata["primary_column"], col)
+        table = table.append_column(bbox_col, bbox_covering(geometry_array))
+        geo_metadata["columns"][col]["covering"] = {
+            "bbox": {
+                "xmin": [bbox_col, "xmin"],
+                "ymin": [bbox_col, "ymin"],
+                "xmax": [bbox_col, "xmax"],
+                "ymax": [bbox_col, "ymax"],
+            }
+        }
+
+    return table
+
+
+def native_encoding(geometry_types: List[str]) -> Optional[str]:
+    """The native encoding for a column with these geometry types, if there is one
+
+    Only columns with a single geometry type can be encoded natively. The Z/M
+    dimensions are carried by the native coordinates, so "Polygon Z" is a polygon.
+    """
+    types = set(geometry_types)
+    if len(types) != 1:
+        return None
+    return NATIVE_ENCODINGS.get(types.pop().split(" ")[0])
+
+
+def encode_native(wkb: pa.Array) -> pa.Array:
+    """Encode WKB geometries of a single geometry type as native GeoArrow
+
+    Coordinates use the separated (struct) layout, as required by GeoParquet 1.1, so
+    that Parquet writes statistics for each coordinate dimension.
+    """
+    native = ga.as_geoarrow(ga.wkb().wrap_array(wkb), coord_type=ga.CoordType.SEPARATED)
+    return native.storage
+
 
-    table = pa.Table.from_pandas(df, preserve_index=False)
+def _encode_native_columns(
+    table: pa.Table, geo_metadata: Dict[str, Any], schema: Optional[pa.Schema]
+) -> pa.Table:
+    """Replace WKB geometry columns with native GeoArrow where the type allows
+
+    Columns with mixed geometry types stay WKB. If a schema is given, as when
+    converting later batches of a stream, the columns that are encoded natively are
+    taken from it instead so that all batches are consistent.
+    """
+    for col, column_metadata in geo_metadata["columns"].items():
+        if schema is not None:
+            # The first batch determined the encoding, which is kept when merging
+            # the geo metadata of the batches
+            if pa.types.is_binary(schema.field(col).type):
+                continue
+        else:
+            encoding = native_encoding(column_metadata["geometry_types"])
+            if encoding is None:
+                continue
+            column_metadata["encoding"] = encoding
+            geo_metadata["version"] = NATIVE_ENCODING_VERSION
+
+        idx = table.schema.get_field_index(col)
+        native = encode_native(table.column(idx).combine_chunks())
+        if schema is not None and native.type != schema.field(col).type:
+            raise ValueError(
+                f"Geometries of column {col!r} can't be encoded natively like the "
+                "first batch; use the WKB encoding for mixed geometry types"
+            )
+
+        table = table.set_column(idx, col, native)
+
+    return table
+
+
+def _geopandas_to_arrow(
+    df: gpd.GeoDataFrame,
+    executor: Optional[Executor] = None,
+    covering: bool = False,
+    encoding: str = "WKB",
+    schema: Optional[pa.Schema] = None,
+) -> Tuple[pa.Table, Dict[str, Any]]:
+    """Convert to an Arrow table with WKB geometries, returning the geo metadata
+    separately so that it can be accumulated across batches.
+
+    If an executor is given, WKB encoding and metadata computation are split into
+    chunks and run on it. If covering is True, a bbox covering column is added for
+    each geometry column. If encoding is "geoarrow", single-type geometry columns use
+    the native GeoArrow encoding, following the encodings in `schema` if given.
+    """
+    with phase("parse_to_shapely") as p:
+        geometry_columns = parse_to_shapely(df)
+        p.rows = len(df)
+
+    wkb_columns = {}
+    statistics: Dict[str, GeometryStatistics] = {}
+    with phase("encode_wkb") as p:
+        for col, geometry_array in geometry_columns.items():
+            if executor is None:
+                wkb_columns[col] = encode_wkb(geometry_array)
+            else:
+                wkb_columns[col], statistics[col] = encode_parallel(
+                    geometry_array, executor
+                )
+        p.bytes = sum(wkb.nbytes for wkb in wkb_columns.values())
+
+    with phase("create_metadata"):
+        geo_metadata = _create_metadata(df, geometry_columns, statistics)
+
+    # Convert the attribute columns with placeholders for the geometry columns, which
+    # are then replaced by the WKB arrays, like GeoDataFrame.to_arrow. Numeric
+    # columns are converted without copying where their dtypes allow.
+    with phase("from_pandas") as p:
+        attributes = pd.DataFrame(df.copy(deep=False))
+        for col in wkb_columns:
+            attributes[col] = None
+        table = pa.Table.from_pandas(attributes, preserve_index=False)
+        p.bytes = table.nbytes
+    for col, wkb in wkb_columns.items():
+        table = table.set_column(table.schema.get_field_index(col), col, wkb)
+    if encoding == "geoarrow":
+        with phase("encode_native"):
+            table = _encode_native_columns(table, geo_metadata, schema)
+    if covering:
+        with phase("bbox_covering"):
+            table = _add_bbox_covering(geometry_columns, table, geo_metadata)
+
+    return table, geo_metadata
+
+
+def geopandas_to_arrow(
+    df: gpd.GeoDataFrame,
+    workers: int = 1,
+    engine: str = "thread",
+    covering: bool = False,
+    encoding: str = "WKB",
+) -> pa.Table:
+    if workers > 1:
+        with create_executor(engine, workers) as executor:
+            table, geo_metadata = _geopandas_to_arrow(df, executor, covering, encoding)
+    else:
+        table, geo_metadata = _geopandas_to_arrow(
+            df, covering=covering, encoding=encoding
+        )
 
     metadata = table.schema.metadata
     metadata.update({b"geo": encode_metadata(geo_metadata)})
     return table.replace_schema_metadata(metadata)
 
 
+def _is_wkb_extension(field: pa.Field) -> bool:
+    """Whether a field is a geoarrow.wkb extension, registered with pyarrow or not"""
+    if isinstance(field.type, pa.ExtensionType):
+        return field.type.extension_name == "geoarrow.wkb"
+    return (field.metadata or {}).get(b"ARROW:extension:name") == b"geoarrow.wkb"
+
+
+def iter_geopackage_batches(
+    path: Path, layer_name: str, batch_size: int
+) -> Iterator[gpd.GeoDataFrame]:
+    """Read a GeoPackage layer as a sequence of GeoDataFrames
+
+    Each GeoDataFrame holds at most `batch_size` features, so only a single batch
+    needs to be in memory at a time. As with `gpd.read_file`, the geometry column is
+    always named "geometry".
+    """
+    with pyogrio.open_arrow(
+        path, layer=layer_name, batch_size=batch_size, use_pyarrow=True
+    ) as (meta, reader):
+        # Layers without a named geometry column get a default name that depends on
+        # the GDAL version, so find it by its extension type
+        geometry_name = meta["geometry_name"] or next(
+            field.name for field in reader.schema if _is_wkb_extension(field)
+        )
+        for batch in reader:
+            df = batch.drop_columns([geometry_name]).to_pandas()
+            geometry = gpd.GeoSeries.from_wkb(
+                batch.column(geometry_name).to_numpy(zero_copy_only=False),
+                crs=meta["crs"],
+            )
+            yield gpd.GeoDataFrame(df, geometry=geometry)
+
+
+def write_streaming(
+    batches: Iterator[gpd.GeoDataFrame],
+    output: Path,
+    compression: str,
+    executor: Optional[Executor] = None,
+    sort: Optional[str] = None,
+    extent: Optional[Sequence[float]] = None,
+    covering: bool = False,
+    row_group_bytes: Optional[int] = None,
+    max_row_group_rows: Optional[int] = None,
+    encoding: str = "WKB",
+    cast: Optional[Callable[[gpd.GeoDataFrame], gpd.GeoDataFrame]] = cast_dtypes,
+    batch_size: Optional[int] = None,
+) -> None:
+    """Write batches of features to GeoParquet, one or more row groups per batch
+
+    The geo metadata is accumulated across batches and only written into the file
+    footer once the last batch has been written. The Arrow schema is not stored in
+    the footer, as it would carry the metadata as it was when the writer was opened.
+
+    If `sort` is given, rows are spatially ordered with an external merge sort, using
+    the output directory for temporary files. `extent` must then be the extent of
+    the whole layer for the "hilbert" and "zorder" sorts, so that the sort keys of all
+    batches are comparable. The sorted rows are written in row groups of `batch_size`
+    rows, by default spatial_sort.MERGE_BATCH_SIZE.
+
+    If `covering` is True, a bbox covering column is added for each geometry column.
+    If `encoding` is "geoarrow", the first batch decides which columns are encoded
+    natively, and later batches must have the same geometry type.
+
+    If `row_group_bytes` or `max_row_group_rows` is given, batches are regrouped into
+    row groups of about that many bytes (by default DEFAULT_ROW_GROUP_BYTES) and at
+    most that many rows.
+
+    Each batch is passed through `cast` before conversion, by default the dtype
+    conversions of the nz-building-outlines layer. Pass None to convert other layers
+    as they are read.
+    """
+    if sort in ("hilbert", "zorder") and extent is None:
+        raise ValueError(
+            f"The extent of the whole layer is required to sort batches by {sort}"
+        )
+
+    geo_metadata: Optional[Dict[str, Any]] = None
+    schema: Optional[pa.Schema] = None
+
+    def convert() -> Iterator[pa.Table]:
+        nonlocal geo_metadata, schema
+        batch_iterator = iter(batches)
+        while True:
+            with phase("read") as p:
+                df = next(batch_iterator, None)
+            if df is None:
+                break
+            p.rows = len(df)
+
+            if cast is not None:
+                with phase("cast_dtypes"):
+                    df = cast(df)
+            with phase("convert") as p:
+                table, batch_geo_metadata = _geopandas_to_arrow(
+                    df, executor, covering, encoding, schema
+                )
+                p.rows = len(table)
+
+            if schema is None:
+                schema = table.schema
+                geo_metadata = batch_geo_metadata
+            else:
+                # Columns that are entirely null in a batch may be inferred as a
+                # different type, so always conform to the schema of the first batch
+                table = table.cast(schema)
+                geo_metadata = merge_metadata(geo_metadata, batch_geo_metadata)
+
+            if sort is not None:
+                with phase("sort_key"):
+                    keys = sort_key(df.geometry.values, sort, extent, df.crs)
+                    table = table.append_column(SORT_KEY_COLUMN, pa.array(keys))
+
+            yield table
+
+    tables = convert()
+    if sort is not None:
+        tables = external_sort(tables, tmpdir=output.parent, batch_size=batch_size)
+
+    writer: Optional[Union[pq.ParquetWriter, ByteBudgetWriter]] = None
+    writer_options = dict(
+        compression=compression, store_schema=False, write_statistics=True
+    )
+    try:
+        for table in tables:
+            if writer is None and (row_group_bytes or max_row_group_rows):
+                writer = ByteBudgetWriter(
+                    output,
+                    schema,
+                    row_group_bytes or row_group_sizing.DEFAULT_ROW_GROUP_BYTES,
+                    max_row_group_rows,
+                    **writer_options,
+                )
+            elif writer is None:
+                writer = pq.ParquetWriter(output, schema, **writer_options)
+            with phase("write") as p:
+                writer.write_table(table)
+                p.bytes = table.nbytes
+                p.rows = len(table)
+            print(f"Wrote batch of {len(table)} rows", file=sys.stderr)
+
+        if writer is None:
+            raise ValueError("Input layer contains no features")
+
+        metadata = dict(schema.metadata or {})
+        metadata.update({b"geo": encode_metadata(geo_metadata)})
+        writer.add_key_value_metadata(metadata)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
 @click.command()
 @click.option(
     "-i",
@@ -177,17 +684,203 @@ def geopandas_to_arrow(df: gpd.GeoDataFrame) -> pa.Table:
     help="Compression codec to use when writing to Parquet.",
     show_default=True,
 )
-def main(input: Path, layer_name: str, output: Path, compression: str):
+@click.option(
+    "--streaming",
+    is_flag=True,
+    default=False,
+    help="Read and convert the layer in batches to bound memory usage.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=100_000,
+    help="Number of features per batch when streaming.",
+    show_default=True,
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of workers used to encode WKB and compute geo metadata.",
+    show_default=True,
+)
+@click.option(
+    "--engine",
+    type=click.Choice(AVAILABLE_ENGINES),
+    default="thread",
+    help="Kind of worker pool used when --workers is greater than 1.",
+    show_default=True,
+)
+@click.option(
+    "--sort",
+    type=click.Choice(AVAILABLE_SORTS),
+    default=None,
+    help="Spatially order rows along a space-filling curve.",
+)
+@click.option(
+    "--covering/--no-covering",
+    default=False,
+    help="Add a bbox covering column with per-row-group statistics.",
+    show_default=True,
+)
+@click.option(
+    "--row-group-bytes",
+    type=ByteSizeType(),
+    default=None,
+    help=(
+        "Target size of row groups, e.g. 128MB, estimated from the encoded WKB and "
+        "attribute bytes per row. Defaults to the Parquet writer's row count."
+    ),
+)
+@click.option(
+    "--max-row-group-rows",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum number of rows per row group.",
+)
+@click.option(
+    "--encoding",
+    type=click.Choice(AVAILABLE_ENCODINGS, case_sensitive=False),
+    default="WKB",
+    help=(
+        "Geometry encoding. geoarrow uses the native GeoParquet 1.1 encodings for "
+        "single-type geometry columns and falls back to WKB for mixed types."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--profile",
+    type=PathType(file_okay=True, dir_okay=False, writable=True),
+    default=None,
+    help="Write the time, CPU time, peak memory and bytes of each phase as JSON.",
+)
+@click.option(
+    "--trace",
+    type=PathType(file_okay=True, dir_okay=False, writable=True),
+    default=None,
+    help="Write the phases as trace events, to open in https://ui.perfetto.dev.",
+)
+def main(
+    input: Path,
+    layer_name: str,
+    output: Path,
+    compression: str,
+    streaming: bool,
+    batch_size: int,
+    workers: int,
+    engine: str,
+    sort: Optional[str],
+    covering: bool,
+    row_group_bytes: Optional[int],
+    max_row_group_rows: Optional[int],
+    encoding: str,
+    profile: Optional[Path],
+    trace: Optional[Path],
+):
+    recorder_context = recording() if profile or trace else contextlib.nullcontext()
+    with recorder_context as recorder:
+        convert_geopackage(
+            input,
+            layer_name,
+            output,
+            compression,
+            streaming,
+            batch_size,
+            workers,
+            engine,
+            sort,
+            covering,
+            row_group_bytes,
+            max_row_group_rows,
+            encoding,
+        )
+
+    if recorder is not None:
+        print(recorder.summary(), file=sys.stderr)
+        if profile is not None:
+            recorder.write_json(profile)
+        if trace is not None:
+            recorder.write_trace(trace)
+
+
+def convert_geopackage(
+    input: Path,
+    layer_name: str,
+    output: Path,
+    compression: str,
+    streaming: bool,
+    batch_size: int,
+    workers: int,
+    engine: str,
+    sort: Optional[str],
+    covering: bool,
+    row_group_bytes: Optional[int],
+    max_row_group_rows: Optional[int],
+    encoding: str,
+) -> None:
+    if streaming:
+        print("Starting streaming conversion to Parquet", file=sys.stderr)
+        batches = iter_geopackage_batches(input, layer_name, batch_size)
+        # Without forcing, drivers that don't store the extent return None
+        info = pyogrio.read_info(input, layer=layer_name, force_total_bounds=True)
+        extent = info["total_bounds"]
+        executor = create_executor(engine, workers) if workers > 1 else None
+        with executor or contextlib.nullcontext():
+            write_streaming(
+                batches,
+                output,
+                compression,
+                executor,
+                sort,
+                extent,
+                covering,
+                row_group_bytes,
+                max_row_group_rows,
+                encoding,
+                batch_size=batch_size,
+            )
+        print("Finished streaming conversion to Parquet", file=sys.stderr)
+        return
+
     print("Starting to read geopackage", file=sys.stderr)
-    df = gpd.read_file(input, layer=layer_name)
+    with phase("read") as p:
+        df = gpd.read_file(input, layer=layer_name)
+        p.bytes = input.stat().st_size
+        p.rows = len(df)
     print("Finished reading geopackage", file=sys.stderr)
-    df = cast_dtypes(df)
+    with phase("cast_dtypes"):
+        df = cast_dtypes(df)
+
+    if sort is not None:
+        print("Starting spatial sort", file=sys.stderr)
+        with phase("sort"):
+            df = df.take(sort_order(df.geometry.values, sort, crs=df.crs))
+        print("Finished spatial sort", file=sys.stderr)
 
     print("Starting conversion to Arrow", file=sys.stderr)
-    arrow_table = geopandas_to_arrow(df)
+    with phase("convert") as p:
+        arrow_table = geopandas_to_arrow(
+            df, workers=workers, engine=engine, covering=covering, encoding=encoding
+        )
+        p.rows = len(arrow_table)
     print("Finished conversion to Arrow", file=sys.stderr)
     print("Starting write to Parquet", file=sys.stderr)
-    pq.write_table(arrow_table, output, compression=compression)
+    with phase("write") as p:
+        if row_group_bytes or max_row_group_rows:
+            row_group_sizing.write_table(
+                arrow_table,
+                output,
+                row_group_bytes or row_group_sizing.DEFAULT_ROW_GROUP_BYTES,
+                max_row_group_rows,
+                compression=compression,
+                write_statistics=True,
+            )
+        else:
+            pq.write_table(
+                arrow_table, output, compression=compression, write_statistics=True
+            )
+        p.bytes = arrow_table.nbytes
+        p.rows = len(arrow_table)
     print("Finished write to Parquet", file=sys.stderr)
 
 